@@ -0,0 +1,88 @@
+import hashlib
+
+from Poem.tenants.models import get_resource_versions, resource_schema
+from django.db import connection
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+class ConditionalResponse(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def get_validators(request, resources):
+    """
+    Returns strong ETag and Last-Modified timestamp for the request, built
+    from versions of resources the view depends on.
+    """
+    versions = get_resource_versions(resources)
+
+    parts = [
+        connection.schema_name, request.get_full_path(),
+        getattr(request, 'accepted_media_type', '') or ''
+    ]
+    last_modified = None
+    for resource in sorted(resources):
+        key = (resource_schema(resource), resource)
+        if key in versions:
+            parts.append('{}:{}:{}'.format(
+                key[0], resource, versions[key].version
+            ))
+            timestamp = int(versions[key].date_modified.timestamp())
+            if not last_modified or timestamp > last_modified:
+                last_modified = timestamp
+
+        else:
+            parts.append('{}:{}:0'.format(key[0], resource))
+
+    etag = '"{}"'.format(
+        hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    )
+
+    return etag, last_modified
+
+
+class ConditionalGetMixin:
+    """
+    Adds support for If-None-Match and If-Modified-Since headers to APIView.
+    Validators are calculated from versions of resources listed in
+    conditional_resources, so 304 is returned before the handler runs.
+    """
+    conditional_resources = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        self.etag = None
+        self.last_modified = None
+        if request.method in ['GET', 'HEAD'] and self.conditional_resources:
+            self.etag, self.last_modified = get_validators(
+                request, self.conditional_resources
+            )
+            response = get_conditional_response(
+                request, etag=self.etag, last_modified=self.last_modified
+            )
+
+            if response is not None:
+                raise ConditionalResponse(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ConditionalResponse):
+            return exc.response
+
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+
+        if getattr(self, 'etag', None) and response.status_code in [200, 304]:
+            response['ETag'] = self.etag
+            if self.last_modified:
+                response['Last-Modified'] = http_date(self.last_modified)
+            # clients should always revalidate with the server
+            patch_cache_control(response, private=True, no_cache=True)
+
+        return response
@@ -4,7 +4,7 @@ from django.contrib.contenttypes.models import ContentType
 import json
 
 from Poem.api import serializers
-from Poem.api.internal_views.utils import sync_webapi
+from Poem.api.internal_views.utils import sync_webapi_if_stale
 from Poem.api.views import NotFound
 from Poem.helpers.history_helpers import create_profile_history
 from Poem.poem import models as poem_models
@@ -89,7 +89,9 @@ class ListAggregations(APIView):
             )
 
     def get(self, request, aggregation_name=None):
-        sync_webapi(settings.WEBAPI_AGGREGATION, poem_models.Aggregation)
+        sync_webapi_if_stale(
+            settings.WEBAPI_AGGREGATION, poem_models.Aggregation
+        )
 
         if aggregation_name:
             try:
@@ -151,3 +153,25 @@ class ListPublicAggregations(ListAggregations):
 
     def delete(self, request, profile_name):
         return self._denied()
+
+
+class ListAggregationsForMetricProfile(APIView):
+    authentication_classes = (SessionAuthentication,)
+
+    def get(self, request, name):
+        sync_webapi_if_stale(
+            settings.WEBAPI_AGGREGATION, poem_models.Aggregation
+        )
+
+        aggregations = poem_models.Aggregation.objects.filter(
+            aggregationmetricprofile__metric_profile=name
+        )
+
+        return Response(
+            aggregations.order_by('name').values_list('name', flat=True)
+        )
+
+
+class ListPublicAggregationsForMetricProfile(ListAggregationsForMetricProfile):
+    authentication_classes = ()
+    permission_classes = ()
@@ -7,8 +7,10 @@ from django.contrib.auth import get_user_model
 from Poem.api import serializers
 from Poem.api.internal_views.users import get_all_groups, get_groups_for_user
 from Poem.api.models import MyAPIKey
+from Poem.helpers import webapi
 from Poem.poem.saml2.config import tenant_from_request, saml_login_string
 
+from rest_framework import status
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -125,3 +127,14 @@ class GetIsTenantSchema(APIView):
             resp = True
 
         return Response({'isTenantSchema': resp})
+
+
+class GetWebAPIStats(APIView):
+    authentication_classes = (SessionAuthentication,)
+
+    def get(self, request):
+        if request.user.is_superuser:
+            return Response(webapi.get_stats())
+
+        else:
+            return Response(status=status.HTTP_403_FORBIDDEN)
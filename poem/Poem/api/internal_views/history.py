@@ -1,25 +1,48 @@
 import datetime
 
-from Poem.api.internal_views.utils import one_value_inline, \
-    two_value_inline
+from Poem.api.conditional import ConditionalGetMixin
+from Poem.api.internal_views.utils import one_value_inline
+from Poem.api.pagination import CursorPage, is_summary
+from Poem.api.streaming import CollateC, iterate_chunked, list_response
 from Poem.api.views import NotFound
+from Poem.helpers.inline_codec import decode_inline
 from Poem.helpers.versioned_comments import new_comment
 from Poem.poem_super_admin import models as admin_models
+from django.db.models import Case, CharField, F, Prefetch, Q, Value, \
+    When
+from django.db.models.functions import Concat
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 
-class ListVersions(APIView):
+class ListVersions(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('history', 'package', 'metrictemplate')
 
     def get(self, request, obj, name=None):
         history_model = {
             'probe': admin_models.ProbeHistory,
             'metrictemplate': admin_models.MetricTemplateHistory
         }
+        summary = is_summary(request)
+
+        if obj == 'probe':
+            vers = history_model[obj].objects.all().select_related('package')
+            prefetch = ()
+
+        else:
+            vers = history_model[obj].objects.all().select_related(
+                'mtype', 'probekey__package'
+            )
+            # tags are only shown in fields; they are in order of their ids,
+            # as the query of version's tags used to return them
+            prefetch = () if summary else (Prefetch(
+                'tags', queryset=admin_models.MetricTags.objects.order_by('id')
+            ),)
 
         if name:
+            page = CursorPage(request, (int,))
             history_instance = history_model[obj].objects.filter(name=name)
 
             if history_instance.count() == 0:
@@ -28,72 +51,124 @@ class ListVersions(APIView):
             else:
                 instance = history_instance[0].object_id
 
-                vers = history_model[obj].objects.filter(
-                    object_id=instance
-                ).order_by('-date_created')
+                vers = vers.filter(object_id=instance).order_by('-id')
+                if page.cursor:
+                    vers = vers.filter(id__lt=page.cursor[0])
+
+                results = [
+                    self._get_version(obj, ver, summary)
+                    for ver in page.items(
+                        page.slice(vers.prefetch_related(*prefetch)),
+                        key=lambda ver: [ver.id]
+                    )
+                ]
+
+                return page.add_headers(Response(results))
 
         else:
-            vers = history_model[obj].objects.all()
+            page = CursorPage(request, (str, int))
 
-        results = []
-        for ver in vers:
             if obj == 'probe':
-                version = ver.package.version
-                fields = {
-                    'name': ver.name,
-                    'version': ver.package.version,
-                    'package': ver.package.__str__(),
-                    'description': ver.description,
-                    'comment': ver.comment,
-                    'repository': ver.repository,
-                    'docurl': ver.docurl
-                }
+                vers = vers.annotate(
+                    object_repr=Concat(
+                        'name', Value(' ('), 'package__version', Value(')'),
+                        output_field=CharField()
+                    )
+                )
+
             else:
-                if ver.probekey:
-                    probekey = ver.probekey.__str__()
-                    version = ver.probekey.__str__().split(' ')[1][1:-1]
-                else:
-                    probekey = ''
-                    version = datetime.datetime.strftime(
-                        ver.date_created, '%Y%m%d-%H%M%S'
+                vers = vers.annotate(
+                    object_repr=Case(
+                        When(probekey__isnull=True, then=F('name')),
+                        default=Concat(
+                            'name', Value(' ['), 'probekey__name', Value(' ('),
+                            'probekey__package__version', Value(')]'),
+                            output_field=CharField()
+                        ),
+                        output_field=CharField()
                     )
-                fields = {
-                    'name': ver.name,
-                    'mtype': ver.mtype.name,
-                    'tags': [tag.name for tag in ver.tags.all()],
-                    'probeversion': probekey,
-                    'description': ver.description,
-                    'parent': one_value_inline(ver.parent),
-                    'probeexecutable': one_value_inline(
-                        ver.probeexecutable
-                    ),
-                    'config': two_value_inline(ver.config),
-                    'attribute': two_value_inline(ver.attribute),
-                    'dependency': two_value_inline(ver.dependency),
-                    'flags': two_value_inline(ver.flags),
-                    'files': two_value_inline(ver.files),
-                    'parameter': two_value_inline(ver.parameter),
-                    'fileparameter': two_value_inline(ver.fileparameter)
-                }
-
-            results.append(dict(
-                id=ver.id,
-                object_repr=ver.__str__(),
-                fields=fields,
-                user=ver.version_user,
-                date_created=datetime.datetime.strftime(
-                    ver.date_created, '%Y-%m-%d %H:%M:%S'
-                ),
-                comment=new_comment(ver.version_comment),
-                version=version
+                )
+
+            vers = vers.annotate(
+                sort_repr=CollateC('object_repr')
+            ).order_by('sort_repr', 'id')
+            if page.cursor:
+                vers = vers.filter(
+                    Q(sort_repr__gt=page.cursor[0]) |
+                    Q(sort_repr=page.cursor[0], id__gt=page.cursor[1])
+                )
+
+            if page.limit is None:
+                vers = iterate_chunked(vers, *prefetch)
+
+            else:
+                vers = page.items(
+                    page.slice(vers.prefetch_related(*prefetch)),
+                    key=lambda ver: [ver.object_repr, ver.id]
+                )
+
+            return page.add_headers(list_response(
+                request, (self._get_version(obj, ver, summary) for ver in vers)
             ))
 
-        if name:
-            results = sorted(results, key=lambda k: k['id'], reverse=True)
+    @staticmethod
+    def _get_version(obj, ver, summary=False):
+        if obj == 'probe':
+            version = ver.package.version
+        elif ver.probekey:
+            version = ver.probekey.__str__().split(' ')[1][1:-1]
         else:
-            results = sorted(results, key=lambda k: k['object_repr'])
+            version = datetime.datetime.strftime(
+                ver.date_created, '%Y%m%d-%H%M%S'
+            )
+
+        result = dict(
+            id=ver.id,
+            object_repr=ver.__str__(),
+            user=ver.version_user,
+            date_created=datetime.datetime.strftime(
+                ver.date_created, '%Y-%m-%d %H:%M:%S'
+            ),
+            comment=ver.version_rendered_comment or new_comment(
+                ver.version_comment
+            ),
+            version=version
+        )
+
+        if summary:
+            return result
+
+        if obj == 'probe':
+            result['fields'] = {
+                'name': ver.name,
+                'version': ver.package.version,
+                'package': ver.package.__str__(),
+                'description': ver.description,
+                'comment': ver.comment,
+                'repository': ver.repository,
+                'docurl': ver.docurl
+            }
+        else:
+            result['fields'] = {
+                'name': ver.name,
+                'mtype': ver.mtype.name,
+                'tags': [tag.name for tag in ver.tags.all()],
+                'probeversion': ver.probekey.__str__() if ver.probekey else '',
+                'description': ver.description,
+                'parent': one_value_inline(ver.parent),
+                'probeexecutable': one_value_inline(
+                    ver.probeexecutable
+                ),
+                'config': decode_inline(ver.config),
+                'attribute': decode_inline(ver.attribute),
+                'dependency': decode_inline(ver.dependency),
+                'flags': decode_inline(ver.flags),
+                'files': decode_inline(ver.files),
+                'parameter': decode_inline(ver.parameter),
+                'fileparameter': decode_inline(ver.fileparameter)
+            }
 
-        return Response(results)
+        return result
 
 
 class ListPublicVersions(ListVersions):
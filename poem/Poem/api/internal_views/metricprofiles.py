@@ -2,7 +2,7 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 
 from Poem.api import serializers
-from Poem.api.internal_views.utils import sync_webapi
+from Poem.api.internal_views.utils import sync_webapi_if_stale
 from Poem.api.views import NotFound
 from Poem.helpers.history_helpers import create_profile_history
 from Poem.poem import models as poem_models
@@ -65,7 +65,9 @@ class ListMetricProfiles(APIView):
             )
 
     def get(self, request, profile_name=None):
-        sync_webapi(settings.WEBAPI_METRIC, poem_models.MetricProfiles)
+        sync_webapi_if_stale(
+            settings.WEBAPI_METRIC, poem_models.MetricProfiles
+        )
 
         if profile_name:
             try:
@@ -155,3 +157,25 @@ class ListPublicMetricProfiles(ListMetricProfiles):
 
     def delete(self, request, profile_name):
         return self._denied()
+
+
+class ListMetricProfilesForMetric(APIView):
+    authentication_classes = (SessionAuthentication,)
+
+    def get(self, request, name):
+        sync_webapi_if_stale(
+            settings.WEBAPI_METRIC, poem_models.MetricProfiles
+        )
+
+        profiles = poem_models.MetricProfiles.objects.filter(
+            metrics__metric=name
+        ).distinct()
+
+        return Response(
+            profiles.order_by('name').values_list('name', flat=True)
+        )
+
+
+class ListPublicMetricProfilesForMetric(ListMetricProfilesForMetric):
+    authentication_classes = ()
+    permission_classes = ()
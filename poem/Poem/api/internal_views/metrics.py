@@ -1,23 +1,29 @@
 import json
 
 import requests
-from Poem.api.internal_views.utils import one_value_inline, two_value_inline, \
+from Poem.api.conditional import ConditionalGetMixin
+from Poem.api.internal_views.utils import one_value_inline, \
     inline_metric_for_db
+from Poem.api.streaming import CollateC, iterate_chunked, list_response
 from Poem.api.views import NotFound
 from Poem.helpers.history_helpers import create_history
+from Poem.helpers.inline_codec import decode_inline
 from Poem.helpers.metrics_helpers import import_metrics, update_metrics, \
-    get_metrics_in_profiles, delete_metrics_from_profile
+    get_metrics_in_profiles, MetricProfilesWriteBack
+from Poem.helpers.webapi import WebAPIUnavailable
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Prefetch
 from rest_framework import status
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 
-class ListAllMetrics(APIView):
+class ListAllMetrics(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('metric',)
 
     def get(self, request):
         metrics = poem_models.Metric.objects.all().order_by('name')
@@ -34,8 +40,9 @@ class ListPublicAllMetrics(ListAllMetrics):
     permission_classes = ()
 
 
-class ListMetric(APIView):
+class ListMetric(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('metric', 'history', 'package')
 
     def get(self, request, name=None):
         if name:
@@ -43,56 +50,67 @@ class ListMetric(APIView):
             if metrics.count() == 0:
                 raise NotFound(status=404,
                                detail='Metric not found')
+
+            return Response(self._get_metric(metrics[0]))
+
         else:
-            metrics = poem_models.Metric.objects.all()
+            metrics = poem_models.Metric.objects.all().select_related(
+                'mtype', 'probekey__package', 'group'
+            ).order_by(CollateC('name'), 'id')
+
+            # tags in order of their ids, as the query of metric's tags used
+            # to return them
+            tags = Prefetch(
+                'tags', queryset=admin_models.MetricTags.objects.order_by('id')
+            )
 
-        results = []
-        for metric in metrics:
-            config = two_value_inline(metric.config)
-            parent = one_value_inline(metric.parent)
-            probeexecutable = one_value_inline(metric.probeexecutable)
-            attribute = two_value_inline(metric.attribute)
-            dependancy = two_value_inline(metric.dependancy)
-            flags = two_value_inline(metric.flags)
-            files = two_value_inline(metric.files)
-            parameter = two_value_inline(metric.parameter)
-            fileparameter = two_value_inline(metric.fileparameter)
-
-            if metric.probekey:
-                probeversion = metric.probekey.__str__()
-            else:
-                probeversion = ''
+            return list_response(
+                request, (
+                    self._get_metric(metric)
+                    for metric in iterate_chunked(metrics, tags)
+                )
+            )
 
-            if metric.group:
-                group = metric.group.name
-            else:
-                group = ''
-
-            results.append(dict(
-                id=metric.id,
-                name=metric.name,
-                mtype=metric.mtype.name,
-                tags=[tag.name for tag in metric.tags.all()],
-                probeversion=probeversion,
-                group=group,
-                description=metric.description,
-                parent=parent,
-                probeexecutable=probeexecutable,
-                config=config,
-                attribute=attribute,
-                dependancy=dependancy,
-                flags=flags,
-                files=files,
-                parameter=parameter,
-                fileparameter=fileparameter
-            ))
-
-        results = sorted(results, key=lambda k: k['name'])
+    @staticmethod
+    def _get_metric(metric):
+        config = decode_inline(metric.config)
+        parent = one_value_inline(metric.parent)
+        probeexecutable = one_value_inline(metric.probeexecutable)
+        attribute = decode_inline(metric.attribute)
+        dependancy = decode_inline(metric.dependancy)
+        flags = decode_inline(metric.flags)
+        files = decode_inline(metric.files)
+        parameter = decode_inline(metric.parameter)
+        fileparameter = decode_inline(metric.fileparameter)
+
+        if metric.probekey:
+            probeversion = metric.probekey.__str__()
+        else:
+            probeversion = ''
 
-        if name:
-            return Response(results[0])
+        if metric.group:
+            group = metric.group.name
         else:
-            return Response(results)
+            group = ''
+
+        return dict(
+            id=metric.id,
+            name=metric.name,
+            mtype=metric.mtype.name,
+            tags=[tag.name for tag in metric.tags.all()],
+            probeversion=probeversion,
+            group=group,
+            description=metric.description,
+            parent=parent,
+            probeexecutable=probeexecutable,
+            config=config,
+            attribute=attribute,
+            dependancy=dependancy,
+            flags=flags,
+            files=files,
+            parameter=parameter,
+            fileparameter=fileparameter
+        )
 
     def put(self, request):
         metric = poem_models.Metric.objects.get(name=request.data['name'])
@@ -475,6 +493,9 @@ class UpdateMetricsVersions(APIView):
 
             return Response({'detail': msg}, status=e.response.status_code)
 
+        except WebAPIUnavailable:
+            raise
+
         except Exception as e:
             msg = str(e)
             return Response({'detail': msg}, status=status.HTTP_404_NOT_FOUND)
@@ -494,10 +515,10 @@ class UpdateMetricsVersions(APIView):
 
         warn_msg = []
         if deleted:
+            writeback = MetricProfilesWriteBack()
+            writeback.remove(*deleted)
             try:
-                metrics_in_profiles = get_metrics_in_profiles(
-                    request.tenant.schema_name
-                )
+                failures = writeback.flush()
 
             except Exception:
                 warn_msg.append(
@@ -507,39 +528,23 @@ class UpdateMetricsVersions(APIView):
                 )
 
             else:
-                profiles = dict()
-                for metric in deleted:
-                    for key, value in metrics_in_profiles.items():
-                        if key == metric:
-                            for p in value:
-                                if p in profiles:
-                                    profiles.update({p: profiles[p] + [key]})
-                                else:
-                                    profiles.update({p: [key]})
-
-                if profiles:
-                    for key, value in profiles.items():
-                        try:
-                            delete_metrics_from_profile(key, value)
-
-                        except Exception:
-                            if len(value) > 1:
-                                message = \
-                                    'Error trying to remove metrics {} from '\
-                                    'profile {}.'.format(', '.join(value), key)
-                                pronoun = 'them'
-                            else:
-                                message = \
-                                    'Error trying to remove metric {} from '\
-                                    'profile {}.'.format(value[0], key)
-                                pronoun = 'it'
-
-                            warn_msg.append(
-                                message + ' Please remove {} manually.'.format(
-                                    pronoun
-                                )
-                            )
-                            continue
+                for profile, metrics, e in failures:
+                    if len(metrics) > 1:
+                        message = \
+                            'Error trying to remove metrics {} from ' \
+                            'profile {}.'.format(', '.join(metrics), profile)
+                        pronoun = 'them'
+                    else:
+                        message = \
+                            'Error trying to remove metric {} from ' \
+                            'profile {}.'.format(metrics[0], profile)
+                        pronoun = 'it'
+
+                    warn_msg.append(
+                        message + ' Please remove {} manually.'.format(
+                            pronoun
+                        )
+                    )
 
         if warn_msg:
             msg['deleted'] += ' WARNING: ' + ' '.join(warn_msg)
@@ -1,25 +1,31 @@
 import json
 
-from Poem.api.internal_views.utils import one_value_inline, two_value_inline, \
+from Poem.api.conditional import ConditionalGetMixin
+from Poem.api.internal_views.utils import one_value_inline, \
     inline_metric_for_db
+from Poem.api.streaming import CollateC, iterate_chunked, list_response
 from Poem.api.views import NotFound
 from Poem.helpers.history_helpers import create_history, update_comment
+from Poem.helpers.inline_codec import decode_inline
+from Poem.api.models import MyAPIKey
 from Poem.helpers.metrics_helpers import update_metrics, \
-    get_metrics_in_profiles, delete_metrics_from_profile
+    MetricProfilesWriteBack
+from Poem.helpers.tenant_helpers import run_in_tenants, raise_tenant_errors
+from Poem.helpers.versioned_comments import new_comment
 from Poem.poem.models import Metric, TenantHistory
 from Poem.poem_super_admin import models as admin_models
-from Poem.tenants.models import Tenant
+from Poem.tenants.models import bump_resource_version
 from django.contrib.contenttypes.models import ContentType
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
 from rest_framework import status
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from tenant_schemas.utils import get_public_schema_name, schema_context
 
 
-class ListMetricTemplates(APIView):
+class ListMetricTemplates(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('metrictemplate', 'history', 'package', 'yumrepo')
 
     def get(self, request, name=None):
         if name:
@@ -28,61 +34,71 @@ class ListMetricTemplates(APIView):
             )
             if metrictemplates.count() == 0:
                 raise NotFound(status=404, detail='Metric template not found')
-        else:
-            metrictemplates = admin_models.MetricTemplate.objects.all()
-
-        results = []
-        for metrictemplate in metrictemplates:
-            config = two_value_inline(metrictemplate.config)
-            parent = one_value_inline(metrictemplate.parent)
-            probeexecutable = one_value_inline(metrictemplate.probeexecutable)
-            attribute = two_value_inline(metrictemplate.attribute)
-            dependency = two_value_inline(metrictemplate.dependency)
-            flags = two_value_inline(metrictemplate.flags)
-            files = two_value_inline(metrictemplate.files)
-            parameter = two_value_inline(metrictemplate.parameter)
-            fileparameter = two_value_inline(metrictemplate.fileparameter)
-
-            ostag = []
-            if metrictemplate.probekey:
-                for repo in metrictemplate.probekey.package.repos.all():
-                    ostag.append(repo.tag.name)
-
-            tags = []
-            for tag in metrictemplate.tags.all():
-                tags.append(tag.name)
-
-            if metrictemplate.probekey:
-                probeversion = metrictemplate.probekey.__str__()
-            else:
-                probeversion = ''
 
-            results.append(dict(
-                id=metrictemplate.id,
-                name=metrictemplate.name,
-                mtype=metrictemplate.mtype.name,
-                ostag=ostag,
-                tags=sorted(tags),
-                probeversion=probeversion,
-                description=metrictemplate.description,
-                parent=parent,
-                probeexecutable=probeexecutable,
-                config=config,
-                attribute=attribute,
-                dependency=dependency,
-                flags=flags,
-                files=files,
-                parameter=parameter,
-                fileparameter=fileparameter
-            ))
-
-        results = sorted(results, key=lambda k: k['name'])
+            result = self._get_metrictemplate(metrictemplates[0])
+            del result['ostag']
+            return Response(result)
 
-        if name:
-            del results[0]['ostag']
-            return Response(results[0])
         else:
-            return Response(results)
+            metrictemplates = admin_models.MetricTemplate.objects.all(
+            ).select_related(
+                'mtype', 'probekey__package'
+            ).order_by(CollateC('name'), 'id')
+
+            return list_response(
+                request, (
+                    self._get_metrictemplate(metrictemplate)
+                    for metrictemplate in iterate_chunked(
+                        metrictemplates,
+                        'tags', 'probekey__package__repos__tag'
+                    )
+                )
+            )
+
+    @staticmethod
+    def _get_metrictemplate(metrictemplate):
+        config = decode_inline(metrictemplate.config)
+        parent = one_value_inline(metrictemplate.parent)
+        probeexecutable = one_value_inline(metrictemplate.probeexecutable)
+        attribute = decode_inline(metrictemplate.attribute)
+        dependency = decode_inline(metrictemplate.dependency)
+        flags = decode_inline(metrictemplate.flags)
+        files = decode_inline(metrictemplate.files)
+        parameter = decode_inline(metrictemplate.parameter)
+        fileparameter = decode_inline(metrictemplate.fileparameter)
+
+        ostag = []
+        if metrictemplate.probekey:
+            for repo in metrictemplate.probekey.package.repos.all():
+                ostag.append(repo.tag.name)
+
+        tags = []
+        for tag in metrictemplate.tags.all():
+            tags.append(tag.name)
+
+        if metrictemplate.probekey:
+            probeversion = metrictemplate.probekey.__str__()
+        else:
+            probeversion = ''
+
+        return dict(
+            id=metrictemplate.id,
+            name=metrictemplate.name,
+            mtype=metrictemplate.mtype.name,
+            ostag=ostag,
+            tags=sorted(tags),
+            probeversion=probeversion,
+            description=metrictemplate.description,
+            parent=parent,
+            probeexecutable=probeexecutable,
+            config=config,
+            attribute=attribute,
+            dependency=dependency,
+            flags=flags,
+            files=files,
+            parameter=parameter,
+            fileparameter=fileparameter
+        )
 
     def post(self, request):
         if request.data['parent']:
@@ -323,17 +339,22 @@ class ListMetricTemplates(APIView):
                         tags_to_add.append(mtag)
                         mt.tags.add(mtag)
 
-                new_data.update({
-                    'version_comment': update_comment(
-                        admin_models.MetricTemplate.objects.get(
-                            id=request.data['id']
-                        )
+                version_comment = update_comment(
+                    admin_models.MetricTemplate.objects.get(
+                        id=request.data['id']
                     )
+                )
+                new_data.update({
+                    'version_comment': version_comment,
+                    'version_rendered_comment': new_comment(version_comment)
                 })
 
                 admin_models.MetricTemplateHistory.objects.filter(
                     name=old_name, probekey=old_probekey
                 ).update(**new_data)
+                # queryset update does not send post_save signal
+                bump_resource_version('metrictemplate')
+                bump_resource_version('history')
 
                 history = admin_models.MetricTemplateHistory.objects.get(
                     name=request.data['name'], probekey=new_probekey
@@ -363,31 +384,28 @@ class ListMetricTemplates(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @staticmethod
+    def _delete_metric(name):
+        try:
+            m = Metric.objects.get(name=name)
+            TenantHistory.objects.filter(
+                object_id=m.id,
+                content_type=ContentType.objects.get_for_model(m)
+            ).delete()
+            m.delete()
+
+        except Metric.DoesNotExist:
+            pass
+
     def delete(self, request, name=None):
-        schemas = list(Tenant.objects.all().values_list('schema_name',
-                                                        flat=True))
-        schemas.remove(get_public_schema_name())
         if name:
             try:
                 mt = admin_models.MetricTemplate.objects.get(name=name)
-                for schema in schemas:
-                    with schema_context(schema):
-                        try:
-                            admin_models.History.objects.filter(
-                                object_id=mt.id,
-                                content_type=ContentType.objects.get_for_model(
-                                    mt)
-                            ).delete()
-                            m = Metric.objects.get(name=name)
-                            TenantHistory.objects.filter(
-                                object_id=m.id,
-                                content_type=ContentType.objects.get_for_model(
-                                    m
-                                )
-                            ).delete()
-                            m.delete()
-                        except Metric.DoesNotExist:
-                            pass
+                admin_models.History.objects.filter(
+                    object_id=mt.id,
+                    content_type=ContentType.objects.get_for_model(mt)
+                ).delete()
+                raise_tenant_errors(run_in_tenants(self._delete_metric, name))
 
                 mt.delete()
                 return Response(status=status.HTTP_204_NO_CONTENT)
@@ -416,18 +434,26 @@ class ListPublicMetricTemplates(ListMetricTemplates):
         return self._denied()
 
 
-class ListMetricTemplatesForImport(APIView):
+class ListMetricTemplatesForImport(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('metrictemplate', 'history', 'package', 'yumrepo')
 
     def get(self, request):
-        metrictemplates = admin_models.MetricTemplate.objects.all().order_by(
-            'name'
+        metrictemplates = admin_models.MetricTemplate.objects.all(
+        ).select_related('mtype', 'probekey__package').order_by('name')
+
+        return list_response(
+            request, self._get_metrictemplates(metrictemplates)
         )
 
-        results = []
-        for mt in metrictemplates:
+    @staticmethod
+    def _get_metrictemplates(metrictemplates):
+        ostags = None
+        for mt in iterate_chunked(metrictemplates, 'tags'):
             vers = admin_models.MetricTemplateHistory.objects.filter(
                 object_id=mt
+            ).select_related('probekey__package').prefetch_related(
+                'probekey__package__repos__tag'
             ).order_by('-date_created')
             if mt.probekey:
                 probeversion = mt.probekey.__str__()
@@ -456,31 +482,30 @@ class ListMetricTemplatesForImport(APIView):
                     centos7_probeversion = ''
 
             else:
-                tags = list(admin_models.OSTag.objects.all().values_list(
-                    'name', flat=True
-                ))
+                if ostags is None:
+                    ostags = list(admin_models.OSTag.objects.all(
+                    ).values_list('name', flat=True))
+
+                tags = list(ostags)
                 probeversion = ''
                 centos6_probeversion = ''
                 centos7_probeversion = ''
 
             tags.sort()
-            results.append(
-                dict(
-                    name=mt.name,
-                    mtype=mt.mtype.name,
-                    tags=sorted([tag.name for tag in mt.tags.all()]),
-                    probeversion=probeversion,
-                    centos6_probeversion=centos6_probeversion,
-                    centos7_probeversion=centos7_probeversion,
-                    ostag=tags
-                )
+            yield dict(
+                name=mt.name,
+                mtype=mt.mtype.name,
+                tags=sorted([tag.name for tag in mt.tags.all()]),
+                probeversion=probeversion,
+                centos6_probeversion=centos6_probeversion,
+                centos7_probeversion=centos7_probeversion,
+                ostag=tags
             )
 
-        return Response(results)
 
-
-class ListMetricTemplatesForProbeVersion(APIView):
+class ListMetricTemplatesForProbeVersion(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('metrictemplate', 'history', 'package')
 
     def get(self, request, probeversion):
         if probeversion:
@@ -497,65 +522,58 @@ class ListMetricTemplatesForProbeVersion(APIView):
 class BulkDeleteMetricTemplates(APIView):
     authentication_classes = (SessionAuthentication,)
 
+    @staticmethod
+    def _delete_metrics(metrictemplates):
+        schema = connection.schema_name
+        warning_message = []
+        writeback = MetricProfilesWriteBack()
+        try:
+            writeback.fetch()
+
+        except Exception as e:
+            if isinstance(e, MyAPIKey.DoesNotExist):
+                e = 'Error fetching WEB API data: API key not found.'
+
+            warning_message.append(
+                '{}: Metrics are not removed from metric profiles. '
+                'Unable to get metric profiles: {}'.format(schema, str(e))
+            )
+            return warning_message
+
+        for metric in metrictemplates:
+            try:
+                instance = Metric.objects.get(name=metric)
+                TenantHistory.objects.filter(object_id=instance.id).delete()
+                instance.delete()
+
+            except Metric.DoesNotExist:
+                continue
+
+            writeback.remove(metric)
+
+        for profile, metrics, e in writeback.flush():
+            if len(metrics) > 1:
+                noun = 'Metrics {}'.format(', '.join(metrics))
+            else:
+                noun = 'Metric {}'.format(metrics[0])
+
+            warning_message.append(
+                '{}: {} not deleted from profile {}: {}'.format(
+                    schema, noun, profile, str(e)
+                )
+            )
+
+        return warning_message
+
     def post(self, request):
         metrictemplates = dict(request.data)['metrictemplates']
 
-        schemas = list(
-            Tenant.objects.all().values_list('schema_name', flat=True)
-        )
-        schemas.remove(get_public_schema_name())
+        results = run_in_tenants(self._delete_metrics, metrictemplates)
+        raise_tenant_errors(results)
 
         warning_message = []
-        for schema in schemas:
-            with schema_context(schema):
-                try:
-                    mip = get_metrics_in_profiles(schema)
-                except Exception as e:
-                    warning_message.append(
-                        '{}: Metrics are not removed from metric profiles. '
-                        'Unable to get metric profiles: {}'.format(
-                            schema, str(e)
-                        )
-                    )
-                    continue
-
-                inter = set(metrictemplates).intersection(set(list(mip.keys())))
-                profiles = dict()
-                for metric in metrictemplates:
-                    try:
-                        instance = Metric.objects.get(name=metric)
-                        TenantHistory.objects.filter(
-                            object_id=instance.id
-                        ).delete()
-                        instance.delete()
-
-                    except Metric.DoesNotExist:
-                        continue
-
-                    for key, value in mip.items():
-                        if metric in inter and key == metric:
-                            for p in value:
-                                if p in profiles:
-                                    profiles.update({p: profiles[p] + [key]})
-                                else:
-                                    profiles.update({p: [key]})
-
-                if profiles:
-                    for key, value in profiles.items():
-                        try:
-                            delete_metrics_from_profile(key, value)
-
-                        except Exception as e:
-                            if len(value) > 1:
-                                noun = 'Metrics {}'.format(', '.join(value))
-                            else:
-                                noun = 'Metric {}'.format(value[0])
-
-                            warning_message.append(
-                                '{}: {} not deleted from profile {}: {}'.format(
-                                    schema, noun, key, str(e)
-                                )
-                            )
+        for result in results:
+            warning_message.extend(result.result)
 
         response_message = dict()
         mt = admin_models.MetricTemplate.objects.filter(
@@ -602,8 +620,9 @@ class ListPublicMetricTemplateTypes(ListMetricTemplateTypes):
     permission_classes = ()
 
 
-class ListMetricTags(APIView):
+class ListMetricTags(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('metrictemplate',)
 
     def get(self, request):
         tags = admin_models.MetricTags.objects.all().order_by('name')
@@ -1,5 +1,6 @@
 from distutils.version import StrictVersion
 
+from Poem.api.conditional import ConditionalGetMixin
 from Poem.api.views import NotFound
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
@@ -36,8 +37,9 @@ def get_packages_for_api(packages):
     return results
 
 
-class ListPackages(APIView):
+class ListPackages(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('package', 'yumrepo', 'metric', 'history')
 
     def get(self, request, nameversion=None):
         if nameversion:
@@ -236,8 +238,9 @@ class ListPublicPackages(ListPackages):
         return self._denied()
 
 
-class ListPackagesVersions(APIView):
+class ListPackagesVersions(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('package', 'yumrepo')
 
     def get(self, request, name):
         packages = admin_models.Package.objects.filter(name=name)
@@ -4,11 +4,14 @@ from django.db import IntegrityError
 
 import json
 
+from Poem.api.conditional import ConditionalGetMixin
 from Poem.api.views import NotFound
 from Poem.helpers.history_helpers import create_history, update_comment
+from Poem.helpers.tenant_helpers import run_in_tenants, raise_tenant_errors
+from Poem.helpers.versioned_comments import new_comment
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
-from Poem.tenants.models import Tenant
+from Poem.tenants.models import Tenant, bump_resource_version
 
 from rest_framework import status
 from rest_framework.authentication import SessionAuthentication
@@ -18,8 +21,9 @@ from rest_framework.views import APIView
 from tenant_schemas.utils import schema_context, get_public_schema_name
 
 
-class ListProbes(APIView):
+class ListProbes(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('probe', 'history', 'package')
 
     def get(self, request, name=None):
         if name:
@@ -78,12 +82,22 @@ class ListProbes(APIView):
 
             return Response(results)
 
-    def put(self, request):
-        schemas = list(
-            Tenant.objects.all().values_list('schema_name', flat=True)
-        )
-        schemas.remove(get_public_schema_name())
+    @staticmethod
+    def _rename_metrics_probe(probekey, probe):
+        metrics = poem_models.Metric.objects.filter(probekey=probekey)
 
+        for metric in metrics:
+            vers = poem_models.TenantHistory.objects.filter(
+                object_id=metric.id
+            ).select_related('snapshot')
+
+            for ver in vers:
+                serialized_data = json.loads(ver.serialized_data)
+                serialized_data[0]['fields']['probekey'] = probe
+                ver.serialized_data = json.dumps(serialized_data)
+                ver.save()
+
+    def put(self, request):
         probe = admin_models.Probe.objects.get(id=request.data['id'])
         old_name = probe.name
         try:
@@ -155,41 +169,26 @@ class ListProbes(APIView):
                 )
 
                 del new_data['user']
+                version_comment = update_comment(
+                    admin_models.Probe.objects.get(id=request.data['id'])
+                )
                 new_data.update({
-                    'version_comment': update_comment(
-                        admin_models.Probe.objects.get(
-                            id=request.data['id']
-                        )
-                    )
+                    'version_comment': version_comment,
+                    'version_rendered_comment': new_comment(version_comment)
                 })
                 history.update(**new_data)
+                # queryset update does not send post_save signal
+                poem_models.invalidate_metricconfigs_all_tenants()
+                poem_models.update_metric_repos_all_tenants(probekey=probekey)
+                bump_resource_version('probe')
+                bump_resource_version('history')
 
                 # update Metric history in case probekey name has changed:
                 if request.data['name'] != old_name:
-                    for schema in schemas:
-                        with schema_context(schema):
-                            metrics = poem_models.Metric.objects.filter(
-                                probekey=probekey
-                            )
-
-                            for metric in metrics:
-                                vers = poem_models.TenantHistory.objects.filter(
-                                    object_id=metric.id
-                                )
-
-                                for ver in vers:
-                                    serialized_data = json.loads(
-                                        ver.serialized_data
-                                    )
-
-                                    serialized_data[0]['fields']['probekey'] = \
-                                        [request.data['name'],
-                                         package.version]
-
-                                    ver.serialized_data = json.dumps(
-                                        serialized_data
-                                    )
-                                    ver.save()
+                    raise_tenant_errors(run_in_tenants(
+                        self._rename_metrics_probe, probekey,
+                        [request.data['name'], package.version]
+                    ))
 
             return Response(status=status.HTTP_201_CREATED)
 
@@ -4,9 +4,12 @@ from django.contrib.contenttypes.models import ContentType
 
 import json
 
-from Poem.api.internal_views.utils import one_value_inline, two_value_inline
+from Poem.api.conditional import ConditionalGetMixin
+from Poem.api.internal_views.utils import one_value_inline
+from Poem.api.pagination import CursorPage, is_summary
 from Poem.api.views import NotFound
-from Poem.helpers.versioned_comments import new_comment
+from Poem.helpers.inline_codec import decode_inline
+from Poem.helpers.versioned_comments import tenant_comment
 from Poem.poem import models as poem_models
 
 from rest_framework import status
@@ -15,10 +18,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 
-class ListTenantVersions(APIView):
+class ListTenantVersions(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('tenanthistory',)
 
-    def get(self, request, obj, name=None):
+    def get(self, request, obj, name=None, current=False):
         models = {
             'metric': poem_models.Metric,
             'metricprofile': poem_models.MetricProfiles,
@@ -42,150 +46,138 @@ class ListTenantVersions(APIView):
 
                 raise NotFound(status=404, detail=msg)
 
+            if current:
+                ver = poem_models.get_latest_history(obj.id, ct)
+                if ver is None:
+                    raise NotFound(status=404, detail='Version not found.')
+
+                return Response(self._get_version(obj, ver))
+
+            page = CursorPage(request, (int,))
+            summary = is_summary(request)
+
             vers = poem_models.TenantHistory.objects.filter(
                 object_id=obj.id,
                 content_type=ct
-            ).order_by('date_created')
+            ).order_by('-id')
+            if summary:
+                vers = vers.defer('data', 'delta')
+
+            else:
+                vers = vers.select_related('snapshot')
+
+            if page.cursor:
+                vers = vers.filter(id__lt=page.cursor[0])
 
-            if vers.count() == 0:
+            results = [
+                self._get_version(obj, ver, summary) for ver in page.items(
+                    page.slice(vers), key=lambda ver: [ver.id]
+                )
+            ]
+
+            if not results and not page.cursor:
                 raise NotFound(status=404, detail='Version not found.')
 
-            else:
-                results = []
-                for ver in vers:
-                    version = datetime.datetime.strftime(
-                        ver.date_created, '%Y%m%d-%H%M%S'
-                    )
-                    fields0 = json.loads(ver.serialized_data)[0]['fields']
-
-                    if isinstance(obj, poem_models.Metric):
-                        if fields0['probekey']:
-                            probeversion = '{} ({})'.format(
-                                fields0['probekey'][0], fields0['probekey'][1]
-                            )
-                        else:
-                            probeversion = ''
-
-                        if 'description' in fields0:
-                            description = fields0['description']
-                        else:
-                            description = ''
-
-                        if 'group' in fields0 and fields0['group']:
-                            group = fields0['group'][0]
-
-                        else:
-                            group = ''
-
-                        tags = []
-                        if 'tags' in fields0:
-                            tags = [tag[0] for tag in fields0['tags']]
-
-                        fields = {
-                            'name': fields0['name'],
-                            'mtype': fields0['mtype'][0],
-                            'tags': tags,
-                            'group': group,
-                            'probeversion': probeversion,
-                            'description': description,
-                            'parent': one_value_inline(fields0['parent']),
-                            'probeexecutable': one_value_inline(
-                                fields0['probeexecutable']
-                            ),
-                            'config': two_value_inline(fields0['config']),
-                            'attribute': two_value_inline(
-                                fields0['attribute']
-                            ),
-                            'dependancy': two_value_inline(
-                                fields0['dependancy']
-                            ),
-                            'flags': two_value_inline(fields0['flags']),
-                            'files': two_value_inline(fields0['files']),
-                            'parameter': two_value_inline(
-                                fields0['parameter']
-                            ),
-                            'fileparameter': two_value_inline(
-                                fields0['fileparameter']
-                            )
-                        }
-
-                    elif isinstance(obj, poem_models.MetricProfiles):
-                        mi = [
-                            {
-                                'service': item[0], 'metric': item[1]
-                            } for item in fields0['metricinstances']
-                        ]
-                        fields = {
-                            'name': fields0['name'],
-                            'groupname': fields0['groupname'],
-                            'description': fields0.get('description', ''),
-                            'apiid': fields0['apiid'],
-                            'metricinstances': sorted(
-                                mi, key=lambda k: k['service'].lower()
-                            )
-                        }
-
-                    else:
-                        fields = fields0
-
-                    try:
-                        comment = []
-                        untracked_fields = [
-                            'mtype', 'parent', 'probeexecutable',
-                            'attribute', 'dependancy', 'flags', 'files',
-                            'parameter', 'fileparameter'
-                        ]
-                        if isinstance(obj, poem_models.Metric):
-                            untracked_fields.append('name')
-
-                        for item in json.loads(ver.comment):
-                            if 'changed' in item:
-                                action = 'changed'
-
-                            elif 'added' in item:
-                                action = 'added'
-
-                            else:
-                                action = 'deleted'
-
-                            if 'object' not in item[action]:
-                                new_fields = []
-                                for field in item[action]['fields']:
-                                    if field not in untracked_fields:
-                                        new_fields.append(field)
-
-                                if new_fields:
-                                    comment.append(
-                                        {action: {'fields': new_fields}}
-                                    )
-
-                            else:
-                                if item[action]['fields'][0] not in \
-                                        untracked_fields:
-                                    if item[action]['fields'][0] == 'config':
-                                        if 'path' in item[action]['object']:
-                                            item[action]['object'].remove('path')
-                                    comment.append(item)
-
-                        comment = json.dumps(comment)
-
-                    except json.JSONDecodeError:
-                        comment = ver.comment
-
-                    results.append(dict(
-                        id=ver.id,
-                        object_repr=ver.object_repr,
-                        fields=fields,
-                        user=ver.user,
-                        date_created=datetime.datetime.strftime(
-                            ver.date_created, '%Y-%m-%d %H:%M:%S'
-                        ),
-                        comment=new_comment(comment),
-                        version=version
-                    ))
-
-                results = sorted(results, key=lambda k: k['id'], reverse=True)
-                return Response(results)
+            response = page.add_headers(Response(results))
+
+            # older versions are moved to archive by archive_history
+            boundary = poem_models.get_archive_boundary(obj.id, ct)
+            if boundary:
+                response['X-Archived-Versions'] = boundary[0]
+                response['X-Archived-Until'] = datetime.datetime.strftime(
+                    boundary[1], '%Y-%m-%d %H:%M:%S'
+                )
+
+            return response
 
         else:
             return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    def _get_version(self, obj, ver, summary=False):
+        result = dict(
+            id=ver.id,
+            object_repr=ver.object_repr,
+            user=ver.user,
+            date_created=datetime.datetime.strftime(
+                ver.date_created, '%Y-%m-%d %H:%M:%S'
+            ),
+            comment=ver.rendered_comment or tenant_comment(
+                ver.comment, isinstance(obj, poem_models.Metric)
+            ),
+            version=datetime.datetime.strftime(
+                ver.date_created, '%Y%m%d-%H%M%S'
+            )
+        )
+
+        # summary leaves out fields, so serialized data is not decoded
+        if not summary:
+            result['fields'] = self._get_fields(obj, ver)
+
+        return result
+
+    @staticmethod
+    def _get_fields(obj, ver):
+        fields0 = json.loads(ver.serialized_data)[0]['fields']
+
+        if isinstance(obj, poem_models.Metric):
+            if fields0['probekey']:
+                probeversion = '{} ({})'.format(
+                    fields0['probekey'][0], fields0['probekey'][1]
+                )
+            else:
+                probeversion = ''
+
+            if 'description' in fields0:
+                description = fields0['description']
+            else:
+                description = ''
+
+            if 'group' in fields0 and fields0['group']:
+                group = fields0['group'][0]
+
+            else:
+                group = ''
+
+            tags = []
+            if 'tags' in fields0:
+                tags = [tag[0] for tag in fields0['tags']]
+
+            fields = {
+                'name': fields0['name'],
+                'mtype': fields0['mtype'][0],
+                'tags': tags,
+                'group': group,
+                'probeversion': probeversion,
+                'description': description,
+                'parent': one_value_inline(fields0['parent']),
+                'probeexecutable': one_value_inline(
+                    fields0['probeexecutable']
+                ),
+                'config': decode_inline(fields0['config']),
+                'attribute': decode_inline(fields0['attribute']),
+                'dependancy': decode_inline(fields0['dependancy']),
+                'flags': decode_inline(fields0['flags']),
+                'files': decode_inline(fields0['files']),
+                'parameter': decode_inline(fields0['parameter']),
+                'fileparameter': decode_inline(fields0['fileparameter'])
+            }
+
+        elif isinstance(obj, poem_models.MetricProfiles):
+            mi = [
+                {'service': item[0], 'metric': item[1]}
+                for item in fields0['metricinstances']
+            ]
+            fields = {
+                'name': fields0['name'],
+                'groupname': fields0['groupname'],
+                'description': fields0.get('description', ''),
+                'apiid': fields0['apiid'],
+                'metricinstances': sorted(
+                    mi, key=lambda k: k['service'].lower()
+                )
+            }
+
+        else:
+            fields = fields0
+
+        return fields
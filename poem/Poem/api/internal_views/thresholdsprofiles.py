@@ -2,7 +2,7 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 
 from Poem.api import serializers
-from Poem.api.internal_views.utils import sync_webapi
+from Poem.api.internal_views.utils import sync_webapi_if_stale
 from Poem.api.views import NotFound
 from Poem.helpers.history_helpers import create_profile_history
 from Poem.poem.models import ThresholdsProfiles, GroupOfThresholdsProfiles, \
@@ -18,7 +18,7 @@ class ListThresholdsProfiles(APIView):
     authentication_classes = (SessionAuthentication,)
 
     def get(self, request, name=None):
-        sync_webapi(settings.WEBAPI_THRESHOLDS, ThresholdsProfiles)
+        sync_webapi_if_stale(settings.WEBAPI_THRESHOLDS, ThresholdsProfiles)
 
         if name:
             try:
@@ -129,3 +129,23 @@ class ListPublicThresholdsProfiles(ListThresholdsProfiles):
 
     def delete(self, request, apiid=None):
         return self._denied()
+
+
+class ListThresholdsProfilesForMetric(APIView):
+    authentication_classes = (SessionAuthentication,)
+
+    def get(self, request, name):
+        sync_webapi_if_stale(settings.WEBAPI_THRESHOLDS, ThresholdsProfiles)
+
+        profiles = ThresholdsProfiles.objects.filter(
+            rules__metric=name
+        ).distinct()
+
+        return Response(
+            profiles.order_by('name').values_list('name', flat=True)
+        )
+
+
+class ListPublicThresholdsProfilesForMetric(ListThresholdsProfilesForMetric):
+    authentication_classes = ()
+    permission_classes = ()
@@ -1,13 +1,39 @@
+import hashlib
 import json
+import logging
+import threading
+import time
 
-import requests
-from Poem.api.models import MyAPIKey
+from Poem.helpers import webapi
+from Poem.helpers.inline_codec import encode_inline
 from Poem.helpers.history_helpers import create_profile_history
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
 from tenant_schemas.utils import schema_context, get_public_schema_name
 
+logger = logging.getLogger('POEM')
+
+# profiles synced with WEB-API less than SYNC_FRESH seconds ago are served
+# from DB without asking WEB-API
+SYNC_FRESH = 60
+
+_synced = dict()
+_refreshing = set()
+_syncing = dict()
+_sync_lock = threading.Lock()
+
+
+class _Sync:
+    """
+    Sync in progress, whose outcome is shared with the callers waiting for
+    it.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
 
 def one_value_inline(input):
     if input:
@@ -16,131 +42,280 @@ def one_value_inline(input):
         return ''
 
 
-def two_value_inline(input):
-    results = []
+def inline_metric_for_db(data):
+    return encode_inline(data)
+
+
+def _create_sync_history(instance, profile):
+    if isinstance(instance, poem_models.MetricProfiles):
+        services = []
+        for service in profile['services']:
+            for metric in service['metrics']:
+                services.append(
+                    dict(service=service['service'], metric=metric)
+                )
+        create_profile_history(
+            instance, services, 'poem', profile.get('description', '')
+        )
+
+    elif isinstance(instance, poem_models.Aggregation):
+        aggr_data = {
+            'endpoint_group': profile['endpoint_group'],
+            'metric_operation': profile['metric_operation'],
+            'profile_operation': profile['profile_operation'],
+            'metric_profile': profile['metric_profile']['name'],
+            'groups': profile['groups']
+        }
+        create_profile_history(instance, aggr_data, 'poem')
+
+    elif isinstance(instance, poem_models.ThresholdsProfiles):
+        create_profile_history(instance, {'rules': profile['rules']}, 'poem')
+
+
+def _sync_profile_contents(model, instances, profiles):
+    """
+    Updates local copy of profiles' contents (metrics of metric profiles,
+    groups of aggregations, rules of thresholds profiles), only for
+    profiles whose contents have changed.
+    """
+    if model is poem_models.MetricProfiles:
+        from_webapi = poem_models.metrics_from_webapi
+        get_contents = poem_models.get_profile_metrics
+        set_contents = poem_models.set_profile_metrics
+
+    elif model is poem_models.Aggregation:
+        from_webapi = poem_models.aggregation_from_webapi
+        get_contents = poem_models.get_aggregation_contents
+        set_contents = poem_models.set_aggregation_contents
 
-    if input:
-        data = json.loads(input)
+    else:
+        from_webapi = poem_models.thresholds_rules_from_webapi
+        get_contents = poem_models.get_thresholds_rules
+        set_contents = poem_models.set_thresholds_rules
 
-        for item in data:
-            if len(item.split(' ')) == 1:
-                results.append({
-                    'key': item.split(' ')[0],
-                    'value': ''
-                })
-            else:
-                val = ' '.join(item.split(' ')[1:])
-                results.append(({'key': item.split(' ')[0],
-                                 'value': val}))
+    current = get_contents([instance.id for instance in instances])
 
-    return results
+    changed = dict()
+    for instance in instances:
+        profile = profiles.get(instance.apiid)
+        if profile is None:
+            continue
 
+        contents = from_webapi(profile)
+        if contents != current.get(instance.id, set()):
+            changed[instance] = contents
 
-def inline_metric_for_db(data):
-    result = []
+    if changed:
+        set_contents(changed)
 
-    for item in data:
-        if item['key']:
-            result.append('{} {}'.format(item['key'], item['value']))
 
-    if result:
-        return json.dumps(result)
+def sync_lock_id(schema, api):
+    """
+    Returns id of Postgres advisory lock guarding sync of tenant's profiles
+    from the given WEB-API endpoint: signed 64-bit integer made from hash
+    of both, so that locks of different syncs do not collide.
+    """
+    return int.from_bytes(
+        hashlib.sha256('{}:{}'.format(schema, api).encode()).digest()[:8],
+        'big', signed=True
+    )
 
-    else:
-        return ''
 
+def _lock_sync(api):
+    """
+    Takes advisory lock of the sync, held by DB session until it is released
+    with _unlock_sync(), so it is not tied to a transaction. Returns False
+    if the lock was held by another process; in that case it waits until the
+    other process is done syncing the profiles, without keeping the lock.
+    """
+    lock = sync_lock_id(connection.schema_name, api)
 
-def two_value_inline_dict(input):
-    results = dict()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [lock])
+        if cursor.fetchone()[0]:
+            return True
 
-    if input:
-        data = json.loads(input)
+        cursor.execute('SELECT pg_advisory_lock(%s)', [lock])
+        cursor.execute('SELECT pg_advisory_unlock(%s)', [lock])
+        return False
 
-        for item in data:
-            if len(item.split(' ')) == 1:
-                results.update({item.split(' ')[0]: ''})
-            else:
-                val = ' '.join(item.split(' ')[1:])
-                results.update(({item.split(' ')[0]: val}))
 
-    return results
+def _unlock_sync(api):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_unlock(%s)',
+            [sync_lock_id(connection.schema_name, api)]
+        )
 
 
 def sync_webapi(api, model):
-    token = MyAPIKey.objects.get(name="WEB-API")
-
-    headers = {'Accept': 'application/json', 'x-api-key': token.token}
-    response = requests.get(api,
-                            headers=headers,
-                            timeout=180)
-    response.raise_for_status()
-    data = response.json()['data']
-
-    data_api = set([p['id'] for p in data])
-    data_db = set(model.objects.all().values_list('apiid', flat=True))
-    entries_not_indb = data_api.difference(data_db)
-    entries_indb = data_api.intersection(data_db)
-
-    new_entries = []
-    for p in data:
-        if p['id'] in entries_not_indb:
-            new_entries.append(
-                dict(name=p['name'], description=p.get('description', ''),
-                     apiid=p['id'], groupname='')
-            )
-
-    if new_entries:
-        for entry in new_entries:
-            instance = model.objects.create(**entry)
-
-            if isinstance(instance, poem_models.MetricProfiles):
-                services = []
-                for item in data:
-                    if item['id'] == instance.apiid:
-                        for service in item['services']:
-                            for metric in service['metrics']:
-                                services.append(
-                                    dict(
-                                        service=service['service'],
-                                        metric=metric
-                                    )
-                                )
-                        description = item.get('description', '')
-                create_profile_history(instance, services, 'poem', description)
-
-            if isinstance(instance, poem_models.Aggregation):
-                for item in data:
-                    if item['id'] == instance.apiid:
-                        aggr_data = {
-                            'endpoint_group': item['endpoint_group'],
-                            'metric_operation': item['metric_operation'],
-                            'profile_operation': item['profile_operation'],
-                            'metric_profile': item['metric_profile']['name'],
-                            'groups': item['groups']
-                        }
-                create_profile_history(instance, aggr_data, 'poem')
-
-            if isinstance(instance, poem_models.ThresholdsProfiles):
-                for item in data:
-                    if item['id'] == instance.apiid:
-                        tp_data = {'rules': item['rules']}
-                create_profile_history(instance, tp_data, 'poem')
-
-    entries_deleted_onapi = data_db.difference(data_api)
-    for p in entries_deleted_onapi:
-        instance = model.objects.get(apiid=p)
+    """
+    Reconciles tenant's profiles with the ones in WEB-API: missing profiles
+    are created with their initial history, profiles whose name or
+    description changed are updated, and profiles no longer in WEB-API are
+    deleted together with their history. Local copy of profiles' contents
+    is updated as well. Changes are written in one transaction.
+
+    Only one process syncs tenant's profiles of a kind at a time. Others
+    wait for it to finish and return without fetching profiles from
+    WEB-API, using the ones it has synced. Lock is taken before profiles
+    are fetched, but no transaction is held while waiting for WEB-API.
+    """
+    if not _lock_sync(api):
+        return
+
+    try:
+        data = webapi.get_data(api)
+        profiles = dict((p['id'], p) for p in data)
+
+        with transaction.atomic():
+            _reconcile(model, profiles)
+
+    finally:
+        _unlock_sync(api)
+
+
+def _reconcile(model, profiles):
+    # profiles is dict of WEB-API profiles by their ids
+    instances = list(model.objects.all())
+    apiids = set(instance.apiid for instance in instances)
+
+    changed = []
+    deleted = []
+    for instance in instances:
+        profile = profiles.get(instance.apiid)
+        if profile is None:
+            deleted.append(instance.id)
+            continue
+
+        description = profile.get('description', '')
+        if instance.name != profile['name'] or \
+                instance.description != description:
+            instance.name = profile['name']
+            instance.description = description
+            changed.append(instance)
+
+    if deleted:
         poem_models.TenantHistory.objects.filter(
-            object_id=instance.id,
+            object_id__in=deleted,
             content_type=ContentType.objects.get_for_model(model)
         ).delete()
-        instance.delete()
-
-    for p in data:
-        if p['id'] in entries_indb:
-            instance = model.objects.get(apiid=p['id'])
-            instance.name = p['name']
-            instance.description = p.get('description', '')
-            instance.save()
+        model.objects.filter(id__in=deleted).delete()
+
+    if changed:
+        model.objects.bulk_update(changed, ['name', 'description'])
+
+    new_entries = [
+        model(
+            name=p['name'], description=p.get('description', ''),
+            apiid=apiid, groupname=''
+        ) for apiid, p in profiles.items() if apiid not in apiids
+    ]
+    _sync_profile_contents(model, instances, profiles)
+
+    if new_entries:
+        for instance in model.objects.bulk_create(new_entries):
+            _create_sync_history(instance, profiles[instance.apiid])
+
+
+def _refresh_webapi(schema, api, model):
+    try:
+        with schema_context(schema):
+            sync_webapi(api, model)
+
+        with _sync_lock:
+            _synced[(schema, api)] = time.monotonic()
+
+    except Exception as e:
+        logger.error('{}: Error syncing {} from WEB-API: {}'.format(
+            schema.upper(), api, repr(e)
+        ))
+
+    finally:
+        with _sync_lock:
+            _refreshing.discard((schema, api))
+
+        connection.close()
+
+
+def _sync_once(key, api, model):
+    """
+    Syncs profiles, unless another thread is already syncing them, in which
+    case it waits for it and shares its outcome.
+    """
+    with _sync_lock:
+        sync = _syncing.get(key)
+        waiting = sync is not None
+        if not waiting:
+            sync = _syncing[key] = _Sync()
+
+    if waiting:
+        sync.done.wait()
+        if sync.error:
+            raise sync.error
+
+        return
+
+    try:
+        sync_webapi(api, model)
+
+    except Exception as e:
+        sync.error = e
+        raise
+
+    finally:
+        with _sync_lock:
+            del _syncing[key]
+
+        sync.done.set()
+
+
+def sync_webapi_if_stale(api, model):
+    """
+    Syncs profiles from WEB-API only if they have not been synced recently.
+    Stale profiles are refreshed in background thread, and only the first
+    request of the tenant waits for WEB-API, together with requests coming
+    while it waits. If that fails, profiles already in the DB are served,
+    and sync is tried again with the next request.
+    """
+    key = (connection.schema_name, api)
+
+    with _sync_lock:
+        synced = _synced.get(key)
+        if synced is not None:
+            if time.monotonic() - synced < SYNC_FRESH or key in _refreshing:
+                return
+
+            _refreshing.add(key)
+
+    if synced is None:
+        try:
+            _sync_once(key, api, model)
+
+        except Exception as e:
+            # profiles synced by another process are better than no profiles
+            if not model.objects.exists():
+                raise
+
+            logger.error(
+                '{}: Error syncing {} from WEB-API, serving profiles last '
+                'synced: {}'.format(key[0].upper(), api, repr(e))
+            )
+            return
+
+        with _sync_lock:
+            _synced[key] = time.monotonic()
+
+    else:
+        threading.Thread(
+            target=_refresh_webapi, args=(key[0], api, model), daemon=True
+        ).start()
+
+
+def clear_sync_cache():
+    with _sync_lock:
+        _synced.clear()
+        _refreshing.clear()
 
 
 def get_tenant_resources(schema_name):
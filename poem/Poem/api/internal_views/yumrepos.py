@@ -1,5 +1,6 @@
 from django.db import IntegrityError
 
+from Poem.api.conditional import ConditionalGetMixin
 from Poem.api.views import NotFound
 from Poem.poem_super_admin import models as admin_models
 
@@ -9,8 +10,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 
-class ListYumRepos(APIView):
+class ListYumRepos(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('yumrepo',)
 
     def get(self, request, name=None, tag=None):
         if name and tag:
@@ -108,8 +110,9 @@ class ListYumRepos(APIView):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class ListOSTags(APIView):
+class ListOSTags(ConditionalGetMixin, APIView):
     authentication_classes = (SessionAuthentication,)
+    conditional_resources = ('yumrepo',)
 
     def get(self, request):
         tags = admin_models.OSTag.objects.all().values_list('name', flat=True)
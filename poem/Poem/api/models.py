@@ -1,8 +1,20 @@
-from django.db import models
+import hashlib
+import threading
+import time
+
+from Poem.tenants.models import get_resource_versions
+from django.db import connection, models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 from rest_framework_api_key.crypto import KeyGenerator
 from rest_framework_api_key.models import AbstractAPIKey, BaseAPIKeyManager
 
+# how long a validated key is trusted without hashing it again (seconds)
+APIKEY_CACHE_TTL = 300
+APIKEY_CACHE_SIZE = 1024
+
 
 class MyKeyGenerator(KeyGenerator):
     """
@@ -42,7 +54,40 @@ class MyAPIKeyManager(BaseAPIKeyManager):
 
         return obj, key
 
+    _valid_keys = dict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(key):
+        return (
+            connection.schema_name,
+            hashlib.sha256(key.encode('utf-8')).hexdigest()
+        )
+
+    @staticmethod
+    def _keys_version():
+        versions = get_resource_versions(['apikey'])
+        ver = versions.get((connection.schema_name, 'apikey'))
+
+        return ver.version if ver else 0
+
+    def clear_cache(self):
+        with self._lock:
+            self._valid_keys.clear()
+
     def is_valid(self, key):
+        """
+        Validates key, hashing it only if it is not found in the cache of
+        recently validated keys. Cache entries are dropped after TTL, when
+        the key expires, or when any key in the schema is changed.
+        """
+        cache_key = self._cache_key(key)
+        version = self._keys_version()
+
+        entry = self._valid_keys.get(cache_key)
+        if entry and entry[0] == version and entry[1] > time.monotonic():
+            return True
+
         queryset = self.get_usable_keys()
 
         try:
@@ -57,6 +102,18 @@ class MyAPIKeyManager(BaseAPIKeyManager):
         if api_key.has_expired:
             return False
 
+        ttl = APIKEY_CACHE_TTL
+        if api_key.expiry_date:
+            ttl = min(
+                ttl, (api_key.expiry_date - timezone.now()).total_seconds()
+            )
+
+        with self._lock:
+            if len(self._valid_keys) >= APIKEY_CACHE_SIZE:
+                self._valid_keys.clear()
+
+            self._valid_keys[cache_key] = (version, time.monotonic() + ttl)
+
         return True
 
 
@@ -64,3 +121,10 @@ class MyAPIKey(AbstractAPIKey):
     objects = MyAPIKeyManager()
 
     token = models.CharField(max_length=100)
+
+
+@receiver(post_save, sender=MyAPIKey)
+@receiver(post_delete, sender=MyAPIKey)
+def apikey_changed(sender, **kwargs):
+    # other processes see the bumped 'apikey' version on their next request
+    MyAPIKey.objects.clear_cache()
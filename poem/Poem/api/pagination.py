@@ -0,0 +1,112 @@
+import base64
+import binascii
+import json
+
+from rest_framework.exceptions import ParseError
+
+MAX_LIMIT = 1000
+
+
+def is_summary(request):
+    """
+    Returns True if request asks only for summary of items (?summary=1),
+    without their full contents.
+    """
+    return request.query_params.get('summary', '').lower() in \
+        ['1', 'true', 'yes']
+
+
+def encode_cursor(values):
+    # padding is left out, so that cursor needs no quoting in URL
+    return base64.urlsafe_b64encode(
+        json.dumps(values, separators=(',', ':')).encode()
+    ).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(
+            (cursor + '=' * (-len(cursor) % 4)).encode()
+        ).decode())
+
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ParseError('Invalid cursor.')
+
+
+class CursorPage:
+    """
+    Keyset pagination of list views, enabled with ?limit=N query parameter.
+    Cursor is opaque to clients and holds values of ordering keys of the
+    last item of the previous page, of the given types, so that pages are
+    fetched from index without counting or skipping rows. Cursor of the
+    next page is sent in X-Next-Cursor header and in Link header with
+    rel="next"; there is no next page if they are missing. Without limit,
+    all items are listed.
+    """
+    def __init__(self, request, types):
+        self.request = request
+        self.cursor = None
+        self.next_cursor = None
+
+        limit = request.query_params.get('limit')
+        if limit is None:
+            self.limit = None
+
+        else:
+            try:
+                self.limit = int(limit)
+
+            except ValueError:
+                raise ParseError('Invalid limit.')
+
+            if self.limit < 1:
+                raise ParseError('Invalid limit.')
+
+            self.limit = min(self.limit, MAX_LIMIT)
+
+            cursor = request.query_params.get('cursor')
+            if cursor:
+                self.cursor = decode_cursor(cursor)
+                if not isinstance(self.cursor, list) or \
+                        len(self.cursor) != len(types) or \
+                        not all(isinstance(value, type_) for value, type_ in
+                                zip(self.cursor, types)):
+                    raise ParseError('Invalid cursor.')
+
+    def slice(self, queryset):
+        """
+        Returns queryset limited to the page, with one extra row telling
+        if there is the next page.
+        """
+        if self.limit is None:
+            return queryset
+
+        return queryset[:self.limit + 1]
+
+    def items(self, objects, key):
+        """
+        Returns objects of the page, fetched with slice(). key returns list
+        of ordering values of object, stored in the next page's cursor.
+        Objects are returned as they are if pagination is not requested.
+        """
+        if self.limit is None:
+            return objects
+
+        objects = list(objects)
+        if len(objects) > self.limit:
+            objects = objects[:self.limit]
+            self.next_cursor = encode_cursor(key(objects[-1]))
+
+        return objects
+
+    def add_headers(self, response):
+        if self.next_cursor:
+            query = self.request.query_params.copy()
+            query['cursor'] = self.next_cursor
+            url = self.request.build_absolute_uri(
+                '{}?{}'.format(self.request.path, query.urlencode())
+            )
+            response['X-Next-Cursor'] = self.next_cursor
+            response['Link'] = '<{}>; rel="next"'.format(url)
+
+        return response
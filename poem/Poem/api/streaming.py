@@ -0,0 +1,97 @@
+from django.db.models import CharField, Func, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+CHUNK_SIZE = 500
+
+
+class CollateC(Func):
+    """
+    Orders strings by code points, the same way Python sorts them, so
+    queryset ordering matches sorted() regardless of database locale.
+    """
+    template = '(%(expressions)s) COLLATE "C"'
+    output_field = CharField()
+
+
+def iterate_chunked(queryset, *prefetch, chunk_size=CHUNK_SIZE):
+    """
+    Iterates over queryset fetching chunk_size rows at a time. Related
+    objects given in prefetch are fetched for each chunk separately, since
+    iterator() ignores prefetch_related().
+    """
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+
+        if len(chunk) == chunk_size:
+            prefetch_related_objects(chunk, *prefetch)
+            yield from chunk
+            chunk = []
+
+    if chunk:
+        prefetch_related_objects(chunk, *prefetch)
+        yield from chunk
+
+
+def can_stream(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+
+    return isinstance(renderer, JSONRenderer) and \
+        renderer.get_indent(request.accepted_media_type, {}) is None
+
+
+def render_json_list(items, renderer):
+    separator = (SHORT_SEPARATORS if renderer.compact else LONG_SEPARATORS)[0]
+    separator = separator.encode()
+
+    yield b'['
+    for i, item in enumerate(items):
+        if i:
+            yield separator + renderer.render(item)
+
+        else:
+            yield renderer.render(item)
+
+    yield b']'
+
+
+class StreamingListResponse(StreamingHttpResponse):
+    """
+    Streaming response with JSON list of items, rendered one by one as they
+    are consumed from the iterable. Like Response.data, data gives list of
+    the items; reading it collects them before the content is streamed.
+    """
+    def __init__(self, items, renderer, **kwargs):
+        self._items = items
+        self._renderer = renderer
+        self._data = None
+        super().__init__(
+            render_json_list(items, renderer),
+            content_type=renderer.media_type, **kwargs
+        )
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = list(self._items)
+            self.streaming_content = render_json_list(
+                self._data, self._renderer
+            )
+
+        return self._data
+
+
+def list_response(request, items):
+    """
+    Returns response with list of items. If plain JSON is requested, items
+    are rendered one by one as they are consumed from the iterable, and the
+    output is the same as the one of JSONRenderer for the whole list.
+    """
+    if can_stream(request):
+        return StreamingListResponse(iter(items), request.accepted_renderer)
+
+    else:
+        return Response(list(items))
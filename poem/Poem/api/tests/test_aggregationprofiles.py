@@ -3,6 +3,7 @@ from collections import OrderedDict
 from unittest.mock import patch
 
 from Poem.api import views_internal as views
+from Poem.helpers.history_helpers import create_profile_history
 from Poem.poem import models as poem_models
 from Poem.users.models import CustUser
 from django.contrib.contenttypes.models import ContentType
@@ -112,7 +113,7 @@ class ListAggregationsAPIViewTests(TenantTestCase):
             content_type=self.ct
         )
 
-    @patch('Poem.api.internal_views.aggregationprofiles.sync_webapi',
+    @patch('Poem.api.internal_views.aggregationprofiles.sync_webapi_if_stale',
            side_effect=mocked_func)
     def test_get_all_aggregations(self, func):
         request = self.factory.get(self.url)
@@ -136,7 +137,7 @@ class ListAggregationsAPIViewTests(TenantTestCase):
             ]
         )
 
-    @patch('Poem.api.internal_views.aggregationprofiles.sync_webapi',
+    @patch('Poem.api.internal_views.aggregationprofiles.sync_webapi_if_stale',
            side_effect=mocked_func)
     def test_get_aggregation_by_name(self, func):
         request = self.factory.get(self.url + 'TEST_PROFILE')
@@ -152,7 +153,7 @@ class ListAggregationsAPIViewTests(TenantTestCase):
             ])
         )
 
-    @patch('Poem.api.internal_views.aggregationprofiles.sync_webapi',
+    @patch('Poem.api.internal_views.aggregationprofiles.sync_webapi_if_stale',
            side_effect=mocked_func)
     def test_get_aggregation_if_wrong_name(self, func):
         request = self.factory.get(self.url + 'nonexisting')
@@ -364,3 +365,69 @@ class ListAggregationsAPIViewTests(TenantTestCase):
         self.assertEqual(
             response.data, {'detail': 'Aggregation profile not specified!'}
         )
+
+
+class ListAggregationsForMetricProfileAPIViewTests(TenantTestCase):
+    def setUp(self):
+        self.factory = TenantRequestFactory(self.tenant)
+        self.view = views.ListAggregationsForMetricProfile.as_view()
+        self.url = '/api/v2/internal/aggregationsformetricprofile/'
+        self.user = CustUser.objects.create(username='testuser')
+
+        aggr1 = poem_models.Aggregation.objects.create(
+            name='TEST_PROFILE',
+            apiid='00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+            groupname='EGI'
+        )
+        aggr2 = poem_models.Aggregation.objects.create(
+            name='ANOTHER-PROFILE',
+            apiid='12341234-oooo-kkkk-aaaa-aaeekkccnnee'
+        )
+        aggr3 = poem_models.Aggregation.objects.create(
+            name='OTHER-PROFILE',
+            apiid='11110000-aaaa-kkkk-aaaa-aaeekkccnnee'
+        )
+
+        poem_models.set_aggregation_contents({
+            aggr1: ('PROFILE1', [('Group1', 'ARC-CE'), ('Group2', 'VOMS')]),
+            aggr2: ('PROFILE1', []),
+            aggr3: ('PROFILE2', [('Group1', 'ARC-CE')])
+        })
+
+    @patch('Poem.api.internal_views.aggregationprofiles.sync_webapi_if_stale',
+           side_effect=mocked_func)
+    def test_get_aggregations_for_metric_profile(self, func):
+        request = self.factory.get(self.url + 'PROFILE1')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'PROFILE1')
+        self.assertEqual(
+            list(response.data), ['ANOTHER-PROFILE', 'TEST_PROFILE']
+        )
+
+    @patch('Poem.api.internal_views.aggregationprofiles.sync_webapi_if_stale',
+           side_effect=mocked_func)
+    def test_get_aggregations_for_unused_metric_profile(self, func):
+        request = self.factory.get(self.url + 'PROFILE3')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'PROFILE3')
+        self.assertEqual(list(response.data), [])
+
+    def test_aggregation_contents_are_saved_with_history(self):
+        aggr = poem_models.Aggregation.objects.get(name='TEST_PROFILE')
+        create_profile_history(aggr, {
+            'endpoint_group': 'sites',
+            'metric_operation': 'AND',
+            'profile_operation': 'AND',
+            'metric_profile': 'PROFILE2',
+            'groups': [
+                {
+                    'name': 'Group1',
+                    'operation': 'AND',
+                    'services': [{'name': 'VOMS', 'operation': 'OR'}]
+                }
+            ]
+        }, 'testuser')
+        self.assertEqual(
+            poem_models.get_aggregation_contents([aggr.id]),
+            {aggr.id: ('PROFILE2', {('Group1', 'VOMS')})}
+        )
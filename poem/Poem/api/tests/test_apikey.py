@@ -1,9 +1,12 @@
 import datetime
+from unittest.mock import patch
 
 from Poem.api import views_internal as views
 from Poem.api.models import MyAPIKey
 from Poem.users.models import CustUser
+from django.utils import timezone
 from rest_framework import status
+from rest_framework_api_key.models import AbstractAPIKey
 from rest_framework.test import force_authenticate
 from tenant_schemas.test.cases import TenantTestCase
 from tenant_schemas.test.client import TenantRequestFactory
@@ -159,3 +162,75 @@ class ListAPIKeysAPIViewTests(TenantTestCase):
         self.assertEqual(
             response.data['detail'], 'API key name must be defined'
         )
+
+
+class MyAPIKeyCacheTests(TenantTestCase):
+    def setUp(self):
+        self.factory = TenantRequestFactory(self.tenant)
+        self.view = views.ListAPIKeys.as_view()
+        self.url = '/api/v2/internal/apikeys/'
+        self.user = CustUser.objects.create_user(
+            username='testuser', is_superuser=True
+        )
+
+        key, k = MyAPIKey.objects.create_key(name='EGI')
+        self.id = key.id
+        self.token = key.token
+
+    def tearDown(self):
+        MyAPIKey.objects.clear_cache()
+
+    @patch.object(AbstractAPIKey, 'is_valid', autospec=True)
+    def test_validated_key_is_hashed_only_once(self, mock_valid):
+        mock_valid.return_value = True
+        self.assertTrue(MyAPIKey.objects.is_valid(self.token))
+        self.assertTrue(MyAPIKey.objects.is_valid(self.token))
+        self.assertTrue(MyAPIKey.objects.is_valid(self.token))
+        self.assertEqual(mock_valid.call_count, 1)
+
+    @patch.object(AbstractAPIKey, 'is_valid', autospec=True)
+    def test_invalid_key_is_not_cached(self, mock_valid):
+        mock_valid.return_value = False
+        self.assertFalse(MyAPIKey.objects.is_valid(self.token))
+        self.assertFalse(MyAPIKey.objects.is_valid(self.token))
+        self.assertEqual(mock_valid.call_count, 2)
+        self.assertFalse(MyAPIKey.objects.is_valid('nonexisting'))
+
+    def test_revoked_key_is_invalid_immediately(self):
+        self.assertTrue(MyAPIKey.objects.is_valid(self.token))
+        data = {'id': self.id, 'name': 'EGI', 'revoked': True}
+        content, content_type = encode_data(data)
+        request = self.factory.put(self.url, content, content_type=content_type)
+        force_authenticate(request, user=self.user)
+        response = self.view(request)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(MyAPIKey.objects.is_valid(self.token))
+
+    def test_deleted_key_is_invalid_immediately(self):
+        self.assertTrue(MyAPIKey.objects.is_valid(self.token))
+        request = self.factory.delete(self.url + 'EGI')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'EGI')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(MyAPIKey.objects.is_valid(self.token))
+
+    def test_key_changed_in_other_process_is_invalid(self):
+        self.assertTrue(MyAPIKey.objects.is_valid(self.token))
+        # update() sends no signals, so only the version bump done by the
+        # other process is seen here
+        MyAPIKey.objects.filter(id=self.id).update(revoked=True)
+        self.assertTrue(MyAPIKey.objects.is_valid(self.token))
+        with patch.object(MyAPIKey.objects, 'clear_cache'):
+            MyAPIKey.objects.get(id=self.id).save()
+        self.assertFalse(MyAPIKey.objects.is_valid(self.token))
+
+    @patch('Poem.api.models.time.monotonic')
+    def test_expired_key_is_not_served_from_cache(self, mock_time):
+        mock_time.return_value = 1000.
+        key = MyAPIKey.objects.get(id=self.id)
+        key.expiry_date = timezone.now() + datetime.timedelta(seconds=10)
+        key.save()
+        self.assertTrue(MyAPIKey.objects.is_valid(self.token))
+        mock_time.return_value = 1011.
+        with patch.object(AbstractAPIKey, 'has_expired', True):
+            self.assertFalse(MyAPIKey.objects.is_valid(self.token))
@@ -6,6 +6,7 @@ from Poem.api import views_internal as views
 from Poem.api.models import MyAPIKey
 from Poem.poem import models as poem_models
 from Poem.users.models import CustUser
+from rest_framework import status
 from rest_framework.test import force_authenticate
 from tenant_schemas.test.cases import TenantTestCase
 from tenant_schemas.test.client import TenantRequestFactory
@@ -286,3 +287,34 @@ class GetIsTenantSchemaAPIViewTests(TenantTestCase):
             response.data,
             {'isTenantSchema': False}
         )
+
+
+class GetWebAPIStatsAPIViewTests(TenantTestCase):
+    def setUp(self):
+        self.factory = TenantRequestFactory(self.tenant)
+        self.view = views.GetWebAPIStats.as_view()
+        self.url = '/api/v2/internal/webapistats/'
+        self.user = CustUser.objects.create_user(username='testuser')
+        self.superuser = CustUser.objects.create_user(
+            username='superuser', is_superuser=True
+        )
+
+    @patch('Poem.api.internal_views.app.webapi.get_stats')
+    def test_get_stats_superuser(self, mock_stats):
+        mock_stats.return_value = {
+            'GET https://mock.api.url': {
+                'calls': 2, 'errors': 0, 'bytes': 100, 'time_total': 1.,
+                'time_max': 0.6, 'time_avg': 0.5
+            }
+        }
+        request = self.factory.get(self.url)
+        force_authenticate(request, user=self.superuser)
+        response = self.view(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, mock_stats.return_value)
+
+    def test_get_stats_regular_user(self):
+        request = self.factory.get(self.url)
+        force_authenticate(request, user=self.user)
+        response = self.view(request)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -1,13 +1,25 @@
 import datetime
+import copy
+import io
 import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
 from unittest.mock import patch, call
 
 import requests
+from Poem.api.internal_views import utils
 from Poem.api.models import MyAPIKey
-from Poem.helpers.history_helpers import create_comment, update_comment
+from Poem.helpers import history_codec, history_partitions, inline_codec, \
+    tenant_helpers, webapi, webapi_server
+from Poem.helpers.history_helpers import create_comment, update_comment, \
+    analyze_differences
 from Poem.helpers.metrics_helpers import import_metrics, update_metrics, \
     update_metrics_in_profiles, get_metrics_in_profiles, \
-    delete_metrics_from_profile
+    MetricProfilesWriteBack
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
 from Poem.tenants.models import Tenant
@@ -16,15 +28,20 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core import serializers
 from django.core.management import call_command
-from django.db import connection
+from django.core.management.base import CommandError
+from django.db import NotSupportedError, connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.test.testcases import TransactionTestCase
 from tenant_schemas.test.cases import TenantTestCase
 from tenant_schemas.utils import get_tenant_model, get_public_schema_name, \
     schema_context
 
-from .utils_test import mocked_func, mocked_web_api_metric_profile, \
+from .utils_test import MockResponse, mocked_func, \
+    deepdiff_analyze_differences, \
     mocked_web_api_metric_profile_put, mocked_web_api_metric_profiles, \
     mocked_web_api_metric_profiles_empty, \
+    mocked_web_api_metric_profiles_not_found, \
     mocked_web_api_metric_profiles_wrong_token
 
 ALLOWED_TEST_DOMAIN = '.test.com'
@@ -961,6 +978,384 @@ class HistoryHelpersTests(TenantTestCase):
         comment = create_comment(tp, self.ct_tp, json.dumps(data))
         self.assertEqual(comment, 'Initial version.')
 
+    def test_history_heads_point_to_latest_versions(self):
+        head = admin_models.ProbeHistoryHead.objects.get(object_id=self.probe1)
+        self.assertEqual(head.history, self.probe_history3)
+        self.assertEqual(head.previous, self.probe_history2)
+        head = poem_models.TenantHistoryHead.objects.get(
+            object_id=self.metric1.id, content_type=self.ct_metric
+        )
+        history = poem_models.TenantHistory.objects.get(
+            object_id=self.metric1.id, content_type=self.ct_metric
+        )
+        self.assertEqual(head.history, history)
+        self.assertEqual(head.serialized_data, history.serialized_data)
+
+    def test_tenant_history_head_follows_latest_version(self):
+        history = poem_models.TenantHistory.objects.get(
+            object_id=self.metric1.id, content_type=self.ct_metric
+        )
+        self.metric1.description = 'New description.'
+        self.metric1.save()
+        serialized_data = serializers.serialize(
+            'json', [self.metric1],
+            use_natural_foreign_keys=True,
+            use_natural_primary_keys=True
+        )
+        history2 = poem_models.TenantHistory.objects.create(
+            object_id=self.metric1.id,
+            serialized_data=serialized_data,
+            object_repr=self.metric1.__str__(),
+            comment='[{"changed": {"fields": ["description"]}}]',
+            user='testuser',
+            content_type=self.ct_metric
+        )
+        history.serialized_data = '[]'
+        history.save()
+        head = poem_models.TenantHistoryHead.objects.get(
+            object_id=self.metric1.id, content_type=self.ct_metric
+        )
+        self.assertEqual(head.history, history2)
+        self.assertEqual(head.serialized_data, serialized_data)
+        history2.serialized_data = '[{"fields": {}}]'
+        history2.save()
+        head.refresh_from_db()
+        self.assertEqual(head.serialized_data, '[{"fields": {}}]')
+        history2.delete()
+        self.assertFalse(
+            poem_models.TenantHistoryHead.objects.filter(
+                object_id=self.metric1.id, content_type=self.ct_metric
+            ).exists()
+        )
+        self.assertEqual(
+            poem_models.get_latest_serialized_data(
+                self.metric1.id, self.ct_metric
+            ), '[]'
+        )
+
+    def test_create_comment_reads_only_history_head(self):
+        metric = poem_models.Metric.objects.get(id=self.metric1.id)
+        metric.description = 'New description.'
+        serialized_data = serializers.serialize(
+            'json', [metric],
+            use_natural_foreign_keys=True,
+            use_natural_primary_keys=True
+        )
+        with CaptureQueriesContext(connection) as queries:
+            comment = create_comment(metric, self.ct_metric, serialized_data)
+        tables = [
+            query['sql'].split(' FROM ')[1].split(' ')[0]
+            for query in queries if ' FROM ' in query['sql']
+        ]
+        self.assertEqual(tables, ['"poem_tenanthistoryhead"'])
+        self.assertEqual(
+            comment, '[{"changed": {"fields": ["description"]}}]'
+        )
+
+    def test_comments_without_history_heads(self):
+        comments = [
+            create_comment(self.probe1),
+            update_comment(self.probe1),
+            create_comment(self.mt1),
+            update_comment(self.mt1)
+        ]
+        admin_models.ProbeHistoryHead.objects.all().delete()
+        admin_models.MetricTemplateHistoryHead.objects.all().delete()
+        self.assertEqual(
+            [
+                create_comment(self.probe1),
+                update_comment(self.probe1),
+                create_comment(self.mt1),
+                update_comment(self.mt1)
+            ], comments
+        )
+        package = admin_models.Package.objects.create(
+            name='package-1',
+            version='2.0.1'
+        )
+        admin_models.ProbeHistory.objects.create(
+            object_id=self.probe1,
+            name=self.probe1.name,
+            package=package,
+            description=self.probe1.description,
+            comment='Head restored.',
+            repository=self.probe1.repository,
+            docurl=self.probe1.docurl,
+            version_comment='[{"changed": {"fields": ["comment"]}}]',
+            version_user='testuser'
+        )
+        head = admin_models.ProbeHistoryHead.objects.get(object_id=self.probe1)
+        self.assertEqual(head.history.comment, 'Head restored.')
+        self.assertEqual(head.previous, self.probe_history3)
+
+
+def normalize_comment(comment):
+    # order of changes reported by DeepDiff depends on hashing of strings
+    if comment == 'Initial version.':
+        return comment
+
+    return sorted(
+        json.dumps(item, sort_keys=True) for item in json.loads(comment)
+    )
+
+
+class AnalyzeDifferencesTests(SimpleTestCase):
+    """
+    Compares comments of analyze_differences with the ones of DeepDiff based
+    implementation it replaced, on serialized objects of each kind with
+    random changes.
+    """
+    metric = {
+        'name': 'argo.AMS-Check',
+        'mtype': ['Active'],
+        'tags': [['test_tag1'], ['test_tag2']],
+        'probekey': ['ams-probe', '0.1.7'],
+        'description': 'Description of argo.AMS-Check.',
+        'group': ['EGI'],
+        'parent': '',
+        'probeexecutable': '["ams-probe"]',
+        'config': '["maxCheckAttempts 3", "timeout 60", '
+                  '"path /usr/libexec/argo-monitoring/probes/argo", '
+                  '"interval 5", "retryInterval 3"]',
+        'attribute': '["argo.ams_TOKEN --token"]',
+        'dependancy': '',
+        'flags': '["OBSESS 1"]',
+        'files': '',
+        'parameter': '["--project EGI"]',
+        'fileparameter': ''
+    }
+    probe = {
+        'name': 'ams-probe',
+        'package': ['nagios-plugins-argo', '0.1.7'],
+        'description': 'Probe is inspecting AMS service.',
+        'comment': 'Initial version.',
+        'repository': 'https://github.com/ARGOeu/nagios-plugins-argo',
+        'docurl': 'https://github.com/ARGOeu/nagios-plugins-argo/README.md'
+    }
+    metricprofile = {
+        'name': 'ARGO-MON',
+        'description': 'Central ARGO-MON profile.',
+        'apiid': '00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+        'groupname': 'ARGO',
+        'metricinstances': [
+            ['AMGA', 'org.nagios.SAML-SP'],
+            ['APEL', 'org.apel.APEL-Pub'],
+            ['APEL', 'org.apel.APEL-Sync']
+        ]
+    }
+    aggregation = {
+        'name': 'TEST_PROFILE',
+        'description': '',
+        'apiid': '00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+        'groupname': 'EGI',
+        'endpoint_group': 'sites',
+        'metric_operation': 'AND',
+        'profile_operation': 'AND',
+        'metric_profile': 'TEST_PROFILE',
+        'groups': [
+            {
+                'name': 'Group1',
+                'operation': 'AND',
+                'services': [
+                    {'name': 'AMGA', 'operation': 'OR'},
+                    {'name': 'APEL', 'operation': 'OR'}
+                ]
+            },
+            {
+                'name': 'Group2',
+                'operation': 'OR',
+                'services': [{'name': 'VOMS', 'operation': 'OR'}]
+            }
+        ]
+    }
+    thresholds = {
+        'name': 'TEST_PROFILE',
+        'description': '',
+        'apiid': '00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+        'groupname': 'GROUP',
+        'rules': [
+            {
+                'host': 'hostFoo',
+                'metric': 'metricA',
+                'thresholds': 'freshness=1s;10;9:;0;25 entries=1;3;0:2;10'
+            },
+            {
+                'endpoint_group': 'TEST-SITE-51',
+                'metric': 'metricB',
+                'thresholds': 'freshness=1s;10;9:;0;25'
+            }
+        ]
+    }
+    values = [
+        '', None, 'new', 'AND', 'OR', 'metricA', 'test_tag1', 1, 1.0, True,
+        [], ['new'], ['ams-probe', '0.1.8'], [['test_tag3']]
+    ]
+    inline_keys = ['timeout', 'interval', 'new', 'a[b]', "it's", '--token']
+    inlines = [
+        'config', 'attribute', 'dependancy', 'flags', 'files', 'parameter',
+        'fileparameter'
+    ]
+
+    def mutate_inline(self, rnd, value):
+        items = json.loads(value) if value else []
+        choice = rnd.randrange(4)
+        if choice == 0 or not items:
+            items.append('{} {}'.format(
+                rnd.choice(self.inline_keys), rnd.choice(['1', '2', ''])
+            ))
+
+        elif choice == 1:
+            del items[rnd.randrange(len(items))]
+
+        elif choice == 2:
+            i = rnd.randrange(len(items))
+            items[i] = items[i].split(' ')[0] + ' changed'
+
+        else:
+            rnd.shuffle(items)
+
+        return json.dumps(items) if items else ''
+
+    def mutate_list(self, rnd, value):
+        choice = rnd.randrange(5)
+        if choice == 0 and value:
+            del value[rnd.randrange(len(value))]
+
+        elif choice == 1 and value:
+            value.append(copy.deepcopy(rnd.choice(value)))
+
+        elif choice == 2:
+            rnd.shuffle(value)
+
+        elif choice == 3 and value and isinstance(value[0], dict):
+            item = rnd.choice(value)
+            key = rnd.choice(list(item))
+            if isinstance(item[key], list):
+                self.mutate_list(rnd, item[key])
+
+            else:
+                item[key] = rnd.choice(self.values)
+
+        elif choice == 3 and value and isinstance(value[0], list):
+            self.mutate_list(rnd, rnd.choice(value))
+
+        elif value:
+            i = rnd.randrange(len(value))
+            if isinstance(value[i], str):
+                value[i] = value[i] + '-new'
+
+            else:
+                value.insert(i, copy.deepcopy(value[i]))
+                self.mutate_list(rnd, [value[i]])
+
+        else:
+            value.append(rnd.choice(self.values))
+
+    def mutate(self, rnd, data):
+        data = copy.deepcopy(data)
+        for i in range(rnd.randint(1, 4)):
+            field = rnd.choice(list(data) + ['new_field'])
+            value = data.get(field)
+            choice = rnd.randrange(4)
+            if choice == 0:
+                data[field] = copy.deepcopy(rnd.choice(self.values))
+
+            elif choice == 1 and field in data and rnd.random() < 0.2:
+                del data[field]
+
+            elif isinstance(value, list):
+                self.mutate_list(rnd, value)
+
+            elif field in self.inlines and isinstance(value, str):
+                try:
+                    data[field] = self.mutate_inline(rnd, value)
+
+                except ValueError:
+                    data[field] = 'new'
+
+            elif isinstance(value, str):
+                data[field] = value + ' new'
+
+        return data
+
+    def assertSameComments(self, data, n=300):
+        rnd = random.Random(data['name'])
+        for i in range(n):
+            old = self.mutate(rnd, data) if i % 3 == 0 else data
+            new = self.mutate(rnd, data)
+            try:
+                expected = normalize_comment(
+                    deepdiff_analyze_differences(old, new)
+                )
+
+            except Exception as e:
+                with self.assertRaises(type(e)):
+                    analyze_differences(old, new)
+
+                continue
+
+            self.assertEqual(
+                normalize_comment(analyze_differences(old, new)), expected,
+                msg='{} -> {}'.format(old, new)
+            )
+
+    def test_initial_version(self):
+        self.assertEqual(
+            analyze_differences('', self.metric), 'Initial version.'
+        )
+
+    def test_metric(self):
+        self.assertSameComments(self.metric)
+
+    def test_probe(self):
+        self.assertSameComments(self.probe)
+
+    def test_metric_profile(self):
+        self.assertSameComments(self.metricprofile)
+
+    def test_aggregation_profile(self):
+        self.assertSameComments(self.aggregation)
+
+    def test_thresholds_profile(self):
+        self.assertSameComments(self.thresholds)
+        self.assertSameComments(
+            dict(self.thresholds, rules=json.dumps(self.thresholds['rules'])),
+            n=50
+        )
+
+    def test_large_metric_profile(self):
+        rnd = random.Random(0)
+        old = dict(self.metricprofile, metricinstances=[
+            ['service{}'.format(i % 50), 'metric{}'.format(i)]
+            for i in range(5000)
+        ])
+        new = dict(self.metricprofile, metricinstances=[
+            item for item in old['metricinstances'] if rnd.random() > 0.01
+        ] + [['service', 'metric{}'.format(i)] for i in range(30)])
+        self.assertEqual(
+            normalize_comment(analyze_differences(old, new)),
+            normalize_comment(deepdiff_analyze_differences(old, new))
+        )
+        self.assertEqual(
+            analyze_differences(old, dict(old, name='NEW')),
+            '[{"changed": {"fields": ["name"]}}]'
+        )
+
+    def test_repeated_group_names(self):
+        groups = [
+            {'name': 'Group{}'.format(i % 3), 'operation': 'AND',
+             'services': [{'name': 'service{}'.format(i), 'operation': 'OR'}]}
+            for i in range(10)
+        ]
+        old = dict(self.aggregation, groups=groups)
+        new = dict(self.aggregation, groups=[
+            dict(group, operation='OR') for group in groups[3:]
+        ] + [dict(groups[0], name='Group4')])
+        self.assertEqual(
+            normalize_comment(analyze_differences(old, new)),
+            normalize_comment(deepdiff_analyze_differences(old, new))
+        )
+
 
 class MetricsHelpersTests(TransactionTestCase):
     """
@@ -996,6 +1391,9 @@ class MetricsHelpersTests(TransactionTestCase):
                      verbosity=0)
 
     def setUp(self):
+        webapi.clear_tokens()
+        webapi.clear_breakers()
+        utils.clear_sync_cache()
         self.sync_shared()
         self.add_allowed_test_domain()
         tenant_domain = 'tenant.test.com'
@@ -2427,7 +2825,7 @@ class MetricsHelpersTests(TransactionTestCase):
             '["maxCheckAttempts 4", "timeout 70", ' \
             '"path /usr/libexec/argo-monitoring/probes/argo", ' \
             '"interval 6", "retryInterval 4"]'
-        metrictemplate.attribute = '[argo.ams_TOKEN2 --token]'
+        metrictemplate.attribute = '["argo.ams_TOKEN2 --token"]'
         metrictemplate.dependency = '["dep-key dep-val"]'
         metrictemplate.parameter = '["par-key par-val"]'
         metrictemplate.flags = '["flag-key flag-val"]'
@@ -2582,7 +2980,7 @@ class MetricsHelpersTests(TransactionTestCase):
             config='["maxCheckAttempts 4", "timeout 70", '
                    '"path /usr/libexec/argo-monitoring/probes/argo", '
                    '"interval 6", "retryInterval 4"]',
-            attribute='[argo.ams_TOKEN2 --token]',
+            attribute='["argo.ams_TOKEN2 --token"]',
             dependency='["dep-key dep-val"]',
             parameter='["par-key par-val"]',
             flags='["flag-key flag-val"]',
@@ -2771,13 +3169,14 @@ class MetricsHelpersTests(TransactionTestCase):
         self.assertEqual(metric.parameter, '["--project EGI"]')
         self.assertEqual(metric.fileparameter, '')
 
-    @patch('Poem.helpers.metrics_helpers.requests.put')
-    @patch('Poem.helpers.metrics_helpers.requests.get')
-    @patch('Poem.helpers.metrics_helpers.MyAPIKey.objects.get')
+    @patch('Poem.helpers.webapi.requests.Session.put')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
     def test_update_metrics_in_profiles(self, mock_key, mock_get, mock_put):
         with self.settings(WEBAPI_METRIC='https://mock.api.url'):
             mock_key.return_value = MyAPIKey(name='WEB-API', token='mock_key')
             mock_get.side_effect = mocked_web_api_metric_profiles
+            mock_put.side_effect = mocked_web_api_metric_profile_put
             msgs = update_metrics_in_profiles('metric1', 'new.metric1')
             mock_put.assert_called_once()
             mock_put.assert_called_with(
@@ -2805,12 +3204,13 @@ class MetricsHelpersTests(TransactionTestCase):
                             }
                         ]
                     }
-                )
+                ),
+                timeout=180
             )
             self.assertEqual(msgs, [])
 
-    @patch('Poem.helpers.metrics_helpers.requests.get')
-    @patch('Poem.helpers.metrics_helpers.MyAPIKey.objects.get')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
     def test_update_metrics_in_profiles_wrong_token(self, mock_key, mock_get):
         with self.settings(WEBAPI_METRIC='https://mock.api.url'):
             mock_key.return_value = MyAPIKey(name='WEB-API', token='wrong_key')
@@ -2836,9 +3236,9 @@ class MetricsHelpersTests(TransactionTestCase):
                 ]
             )
 
-    @patch('Poem.helpers.metrics_helpers.requests.put')
-    @patch('Poem.helpers.metrics_helpers.requests.get')
-    @patch('Poem.helpers.metrics_helpers.MyAPIKey.objects.get')
+    @patch('Poem.helpers.webapi.requests.Session.put')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
     def test_update_metrics_in_profiles_if_response_empty(
             self, mock_key, mock_get, mock_put
     ):
@@ -2849,9 +3249,9 @@ class MetricsHelpersTests(TransactionTestCase):
             self.assertEqual(msgs, [])
             self.assertFalse(mock_put.called)
 
-    @patch('Poem.helpers.metrics_helpers.requests.put')
-    @patch('Poem.helpers.metrics_helpers.requests.get')
-    @patch('Poem.helpers.metrics_helpers.MyAPIKey.objects.get')
+    @patch('Poem.helpers.webapi.requests.Session.put')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
     def test_update_metrics_in_profiles_if_same_name(
             self, mock_key, mock_get, mock_put
     ):
@@ -2862,8 +3262,8 @@ class MetricsHelpersTests(TransactionTestCase):
             self.assertEqual(msgs, [])
             self.assertFalse(mock_put.called)
 
-    @patch('Poem.helpers.metrics_helpers.requests.get')
-    @patch('Poem.helpers.metrics_helpers.MyAPIKey.objects.get')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
     def test_get_metrics_in_profiles(self, mock_key, mock_get):
         with self.settings(WEBAPI_METRIC='https://mock.api.url'):
             mock_key.return_value = MyAPIKey(name='WEB-API', token='mock_key')
@@ -2887,8 +3287,8 @@ class MetricsHelpersTests(TransactionTestCase):
                 }
             )
 
-    @patch('Poem.helpers.metrics_helpers.requests.get')
-    @patch('Poem.helpers.metrics_helpers.MyAPIKey.objects.get')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
     def test_get_metrics_in_profiles_wrong_token(self, mock_key, mock_get):
         with self.settings(WEBAPI_METRIC='https://mock.api.url'):
             mock_key.return_value = MyAPIKey(name='WEB-API', token='wrong_key')
@@ -2908,8 +3308,8 @@ class MetricsHelpersTests(TransactionTestCase):
                 'Error fetching WEB API data: API key not found.'
             )
 
-    @patch('Poem.helpers.metrics_helpers.requests.get')
-    @patch('Poem.helpers.metrics_helpers.MyAPIKey.objects.get')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
     def test_get_metrics_in_profiles_if_response_empty(
             self, mock_key, mock_get
     ):
@@ -2924,31 +3324,25 @@ class MetricsHelpersTests(TransactionTestCase):
             )
             self.assertEqual(metrics, {})
 
-    @patch('Poem.helpers.metrics_helpers.requests.put')
-    @patch('Poem.helpers.metrics_helpers.requests.get')
-    @patch('Poem.helpers.metrics_helpers.poem_models.MetricProfiles.objects.'
-           'get')
-    @patch('Poem.helpers.metrics_helpers.MyAPIKey.objects.get')
-    def test_delete_metrics_from_profiles(
-            self, mock_key, mock_profile, mock_get, mock_put
-    ):
+    @patch('Poem.helpers.webapi.requests.Session.put')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
+    def test_writeback_remove_metrics(self, mock_key, mock_get, mock_put):
         with self.settings(WEBAPI_METRIC='https://mock.api.url/'):
             mock_key.return_value = MyAPIKey(name='WEB-API', token='mock_key')
-            mock_profile.return_value = poem_models.MetricProfiles(
-                name='PROFILE1', apiid='11111111-2222-3333-4444-555555555555',
-                description='First profile', groupname='TEST'
-            )
-            mock_get.side_effect = mocked_web_api_metric_profile
+            mock_get.side_effect = mocked_web_api_metric_profiles
             mock_put.side_effect = mocked_web_api_metric_profile_put
-            delete_metrics_from_profile(
-                profile='PROFILE1', metrics=['metric3', 'metric4']
-            )
+            writeback = MetricProfilesWriteBack()
+            writeback.remove('metric3')
+            writeback.remove('metric4', 'metric3')
+            failures = writeback.flush()
+            self.assertEqual(failures, [])
             mock_get.assert_called_once_with(
-                'https://mock.api.url/11111111-2222-3333-4444-555555555555',
+                'https://mock.api.url/',
                 headers={'Accept': 'application/json', 'x-api-key': 'mock_key'},
                 timeout=180
             )
-            data = {
+            data1 = {
                 "id": "11111111-2222-3333-4444-555555555555",
                 "name": "PROFILE1",
                 "description": "First profile",
@@ -2962,61 +3356,1505 @@ class MetricsHelpersTests(TransactionTestCase):
                     }
                 ]
             }
-            mock_put.assert_called_once_with(
-                'https://mock.api.url/11111111-2222-3333-4444-555555555555',
-                headers={'Accept': 'application/json', 'x-api-key': 'mock_key'},
-                data=json.dumps(data)
+            data2 = {
+                "id": "66666666-7777-8888-9999-000000000000",
+                "name": "PROFILE2",
+                "description": "Second profile",
+                "services": [
+                    {
+                        "service": "service3",
+                        "metrics": [
+                            "metric5",
+                            "metric2"
+                        ]
+                    },
+                    {
+                        "service": "service4",
+                        "metrics": [
+                            "metric7"
+                        ]
+                    }
+                ]
+            }
+            self.assertEqual(mock_put.call_count, 2)
+            mock_put.assert_has_calls([
+                call(
+                    'https://mock.api.url/11111111-2222-3333-4444-555555555555',
+                    headers={
+                        'Accept': 'application/json', 'x-api-key': 'mock_key'
+                    },
+                    data=json.dumps(data1),
+                    timeout=180
+                ),
+                call(
+                    'https://mock.api.url/66666666-7777-8888-9999-000000000000',
+                    headers={
+                        'Accept': 'application/json', 'x-api-key': 'mock_key'
+                    },
+                    data=json.dumps(data2),
+                    timeout=180
+                )
+            ], any_order=True)
+
+    @patch('Poem.helpers.webapi.requests.Session.put')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
+    def test_writeback_sends_each_profile_once(
+            self, mock_key, mock_get, mock_put
+    ):
+        with self.settings(WEBAPI_METRIC='https://mock.api.url/'):
+            mock_key.return_value = MyAPIKey(name='WEB-API', token='mock_key')
+            mock_get.side_effect = mocked_web_api_metric_profiles
+            mock_put.side_effect = mocked_web_api_metric_profile_put
+            writeback = MetricProfilesWriteBack()
+            writeback.rename('metric1', 'new.metric1')
+            writeback.rename('metric4', 'new.metric4')
+            writeback.remove('metric7')
+            self.assertEqual(writeback.flush(), [])
+            mock_get.assert_called_once()
+            self.assertEqual(mock_put.call_count, 2)
+            sent = dict(
+                (c[0][0].split('/')[-1], json.loads(c[1]['data']))
+                for c in mock_put.call_args_list
             )
+            self.assertEqual(
+                sent['11111111-2222-3333-4444-555555555555']['services'],
+                [
+                    {
+                        'service': 'service1',
+                        'metrics': ['new.metric1', 'metric2']
+                    },
+                    {
+                        'service': 'service2',
+                        'metrics': ['metric3', 'new.metric4']
+                    }
+                ]
+            )
+            self.assertEqual(
+                sent['66666666-7777-8888-9999-000000000000']['services'],
+                [
+                    {
+                        'service': 'service3',
+                        'metrics': ['metric3', 'metric5', 'metric2']
+                    }
+                ]
+            )
+
+            # queued changes are sent only once
+            self.assertEqual(writeback.flush(), [])
+            mock_get.assert_called_once()
+            self.assertEqual(mock_put.call_count, 2)
 
-    @patch('Poem.helpers.metrics_helpers.requests.get')
-    @patch('Poem.helpers.metrics_helpers.poem_models.MetricProfiles.objects.'
-           'get')
-    @patch('Poem.helpers.metrics_helpers.MyAPIKey.objects.get')
-    def test_delete_metrics_from_profiles_wrong_token(
-            self, mock_key, mock_profile, mock_get
+    @patch('Poem.helpers.webapi.requests.Session.put')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
+    def test_writeback_if_metrics_not_in_profiles(
+            self, mock_key, mock_get, mock_put
     ):
         with self.settings(WEBAPI_METRIC='https://mock.api.url/'):
-            mock_key.return_value = MyAPIKey(name='WEB-API', token='wrong_key')
-            mock_profile.return_value = poem_models.MetricProfiles(
-                name='PROFILE1', apiid='11111111-2222-3333-4444-555555555555',
-                description='First profile', groupname='TEST'
+            mock_key.return_value = MyAPIKey(name='WEB-API', token='mock_key')
+            mock_get.side_effect = mocked_web_api_metric_profiles
+            writeback = MetricProfilesWriteBack()
+            writeback.remove('metric8')
+            writeback.rename('metric9', 'new.metric9')
+            self.assertEqual(writeback.flush(), [])
+            mock_get.assert_called_once()
+            self.assertFalse(mock_put.called)
+
+    @patch('Poem.helpers.webapi.requests.Session.put')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
+    def test_writeback_if_put_fails(self, mock_key, mock_get, mock_put):
+        def put(url, **kwargs):
+            if url.endswith('66666666-7777-8888-9999-000000000000'):
+                return mocked_web_api_metric_profiles_not_found()
+
+            return mocked_web_api_metric_profile_put()
+
+        with self.settings(WEBAPI_METRIC='https://mock.api.url/'):
+            mock_key.return_value = MyAPIKey(name='WEB-API', token='mock_key')
+            mock_get.side_effect = mocked_web_api_metric_profiles
+            mock_put.side_effect = put
+            writeback = MetricProfilesWriteBack()
+            writeback.remove('metric2', 'metric3', 'metric4')
+            failures = writeback.flush()
+            self.assertEqual(mock_put.call_count, 2)
+            self.assertEqual(len(failures), 1)
+            self.assertEqual(
+                failures[0][:2], ('PROFILE2', ['metric2', 'metric3'])
             )
+            self.assertIsInstance(
+                failures[0][2], requests.exceptions.HTTPError
+            )
+
+    @patch('Poem.helpers.webapi.requests.Session.put')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    @patch('Poem.helpers.webapi.MyAPIKey.objects.get')
+    def test_writeback_wrong_token(self, mock_key, mock_get, mock_put):
+        with self.settings(WEBAPI_METRIC='https://mock.api.url/'):
+            mock_key.return_value = MyAPIKey(name='WEB-API', token='wrong_key')
             mock_get.side_effect = mocked_web_api_metric_profiles_wrong_token
+            writeback = MetricProfilesWriteBack()
+            writeback.remove('metric3', 'metric4')
+            self.assertRaises(requests.exceptions.HTTPError, writeback.flush)
+            self.assertFalse(mock_put.called)
+
+    def test_writeback_nonexisting_key(self):
+        with self.settings(WEBAPI_METRIC='https://mock.api.url/'):
+            writeback = MetricProfilesWriteBack()
+            writeback.remove('metric3', 'metric4')
+            self.assertRaises(MyAPIKey.DoesNotExist, writeback.flush)
+
+
+class InlineFieldTests(TenantTestCase):
+    def setUp(self):
+        self.mtype = admin_models.MetricTemplateType.objects.create(
+            name='Active'
+        )
+        self.mt = admin_models.MetricTemplate.objects.create(
+            name='argo.AMS-Check',
+            mtype=self.mtype,
+            config='["maxCheckAttempts 3", "timeout 60", '
+                   '"path /usr/libexec/argo-monitoring/probes/argo"]',
+            attribute='["argo.ams_TOKEN --token"]',
+            flags='["OBSESS", "NOHOSTNAME "]',
+            parameter='["-p 1", "-p 2"]'
+        )
+
+    def test_inline_fields_stored_as_key_value_objects(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT config, flags, parameter, files FROM '
+                'poem_super_admin_metrictemplate WHERE id = %s',
+                [self.mt.id]
+            )
+            config, flags, parameter, files = cursor.fetchone()
+        self.assertEqual(
+            config,
+            [
+                {'key': 'maxCheckAttempts', 'value': '3'},
+                {'key': 'timeout', 'value': '60'},
+                {
+                    'key': 'path',
+                    'value': '/usr/libexec/argo-monitoring/probes/argo'
+                }
+            ]
+        )
+        self.assertEqual(
+            flags,
+            [
+                {'key': 'OBSESS', 'value': None},
+                {'key': 'NOHOSTNAME', 'value': ''}
+            ]
+        )
+        self.assertEqual(
+            parameter,
+            [{'key': '-p', 'value': '1'}, {'key': '-p', 'value': '2'}]
+        )
+        self.assertEqual(files, [])
+
+    def test_inline_fields_read_in_legacy_format(self):
+        mt = admin_models.MetricTemplate.objects.get(id=self.mt.id)
+        self.assertEqual(
+            mt.config,
+            '["maxCheckAttempts 3", "timeout 60", '
+            '"path /usr/libexec/argo-monitoring/probes/argo"]'
+        )
+        self.assertEqual(mt.flags, '["OBSESS", "NOHOSTNAME "]')
+        self.assertEqual(mt.parameter, '["-p 1", "-p 2"]')
+        self.assertEqual(mt.files, '')
+        self.assertEqual(
+            mt.flags.pairs,
+            [
+                {'key': 'OBSESS', 'value': None},
+                {'key': 'NOHOSTNAME', 'value': ''}
+            ]
+        )
+
+    def test_inline_fields_not_limited_in_length(self):
+        config = json.dumps(
+            ['key{} {}'.format(i, 'v' * 50) for i in range(50)]
+        )
+        self.mt.config = config
+        self.mt.save()
+        mt = admin_models.MetricTemplate.objects.get(id=self.mt.id)
+        self.assertGreater(len(mt.config), 1024)
+        self.assertEqual(mt.config, config)
+
+
+class InlineCodecTests(TenantTestCase):
+    def setUp(self):
+        self.raw = '["maxCheckAttempts 3", "timeout 60", ' \
+                   '"path /usr/libexec/argo-monitoring/probes/argo", ' \
+                   '"NOVALUE", "-p a b"]'
+        self.data = [
+            {'key': 'maxCheckAttempts', 'value': '3'},
+            {'key': 'timeout', 'value': '60'},
+            {
+                'key': 'path',
+                'value': '/usr/libexec/argo-monitoring/probes/argo'
+            },
+            {'key': 'NOVALUE', 'value': ''},
+            {'key': '-p', 'value': 'a b'}
+        ]
+
+    def test_decode_inline(self):
+        self.assertEqual(inline_codec.decode_inline(self.raw), self.data)
+        self.assertEqual(inline_codec.decode_inline(''), [])
+
+    def test_decode_inline_dict(self):
+        self.assertEqual(
+            inline_codec.decode_inline_dict(self.raw),
+            {
+                'maxCheckAttempts': '3',
+                'timeout': '60',
+                'path': '/usr/libexec/argo-monitoring/probes/argo',
+                'NOVALUE': '',
+                '-p': 'a b'
+            }
+        )
+        self.assertEqual(inline_codec.decode_inline_dict(''), {})
+
+    def test_encode_inline_inverse_of_decode(self):
+        encoded = inline_codec.encode_inline(self.data)
+        self.assertEqual(inline_codec.decode_inline(encoded), self.data)
+        self.assertEqual(
+            inline_codec.encode_inline([{'key': '', 'value': 'val'}]), ''
+        )
+        self.assertEqual(
+            inline_codec.decode_inline_dict(
+                inline_codec.encode_inline_dict({'key1': 'a b', 'key2': ''})
+            ),
+            {'key1': 'a b', 'key2': ''}
+        )
+
+    def test_encode_inline_pairs_restores_original(self):
+        self.assertEqual(
+            inline_codec.encode_inline_pairs(
+                inline_codec.decode_inline_pairs(self.raw)
+            ),
+            self.raw
+        )
+
+    def test_decoded_values_are_cached(self):
+        inline_codec._parse.cache_clear()
+        inline_codec.decode_inline(self.raw)
+        inline_codec.decode_inline_dict(self.raw)
+        result = inline_codec.decode_inline(self.raw)
+        result[0]['value'] = 'changed'
+        self.assertEqual(inline_codec._parse.cache_info().misses, 1)
+        self.assertEqual(inline_codec._parse.cache_info().hits, 2)
+        self.assertEqual(inline_codec.decode_inline(self.raw), self.data)
+
+    def test_decode_value_read_from_db(self):
+        mt = admin_models.MetricTemplate.objects.create(
+            name='argo.AMS-Check',
+            mtype=admin_models.MetricTemplateType.objects.create(
+                name='Active'
+            ),
+            config=self.raw
+        )
+        mt = admin_models.MetricTemplate.objects.get(id=mt.id)
+        inline_codec._parse.cache_clear()
+        self.assertEqual(inline_codec.decode_inline(mt.config), self.data)
+        self.assertEqual(inline_codec._parse.cache_info().misses, 0)
+
+
+def serialized_profile(name, metricinstances, **fields):
+    return json.dumps([{
+        'model': 'poem.metricprofiles',
+        'fields': dict(
+            name=name, groupname='TEST', apiid='00000000-oooo-kkkk-aaaa',
+            metricinstances=metricinstances, **fields
+        )
+    }])
+
+
+class HistoryCodecTests(SimpleTestCase):
+    def setUp(self):
+        self.mis = [
+            ['service-{}'.format(i % 50), 'metric-{}'.format(i)]
+            for i in range(3000)
+        ]
+        self.base = serialized_profile('PROFILE', self.mis)
+
+    def test_delta_of_changed_metric_instances(self):
+        mis = copy.deepcopy(self.mis)
+        del mis[10]
+        mis.insert(2000, ['service-new', 'metric-new'])
+        mis[2500][0] = 'service-changed'
+        text = serialized_profile('PROFILE', mis)
+        delta = history_codec.encode_delta(self.base, text)
+        self.assertLess(len(delta), 200)
+        self.assertEqual(history_codec.decode_delta(self.base, delta), text)
+
+    def test_delta_of_added_removed_and_reordered_fields(self):
+        text = json.dumps([{
+            'model': 'poem.metricprofiles',
+            'fields': {
+                'description': 'New field.',
+                'metricinstances': self.mis,
+                'name': 'PROFILE2',
+                'apiid': '00000000-oooo-kkkk-aaaa'
+            }
+        }])
+        delta = history_codec.encode_delta(self.base, text)
+        self.assertEqual(
+            json.loads(delta),
+            {
+                'set': {'description': 'New field.', 'name': 'PROFILE2'},
+                'removed': ['groupname'],
+                'order': ['description', 'metricinstances', 'name', 'apiid']
+            }
+        )
+        self.assertEqual(history_codec.decode_delta(self.base, delta), text)
+
+    def test_no_delta_if_not_worth_it(self):
+        self.assertIsNone(
+            history_codec.encode_delta(
+                serialized_profile('PROFILE', [['AMGA', 'metric']]), self.base
+            )
+        )
+        self.assertIsNone(
+            history_codec.encode_delta(
+                serialized_profile('PROFILE', []), json.dumps([])
+            )
+        )
+        self.assertIsNone(
+            history_codec.encode_delta(
+                self.base, json.dumps(
+                    [{'model': 'poem.aggregation', 'fields': {}}]
+                )
+            )
+        )
+
+    def test_no_delta_if_text_is_not_rebuilt_exactly(self):
+        text = self.base.replace('", "', '","', 1)
+        self.assertIsNone(history_codec.encode_delta(self.base, text))
+
+
+class TenantHistoryStorageTests(TenantTestCase):
+    def setUp(self):
+        # TenantTestCase does not apply settings overridden on class
+        storage = override_settings(
+            HISTORY_STORAGE='delta', HISTORY_KEYFRAME_INTERVAL=3
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        self.ct = ContentType.objects.get_for_model(poem_models.MetricProfiles)
+        self.mis = [
+            ['service-{}'.format(i % 50), 'metric-{}'.format(i)]
+            for i in range(1000)
+        ]
+        self.versions = []
+        for i in range(8):
+            self.mis.append(['service-new', 'metric-new-{}'.format(i)])
+            self.versions.append(self.create_version(
+                serialized_profile('PROFILE', self.mis, description=str(i))
+            ))
+
+    def create_version(self, text, object_id=1):
+        return poem_models.TenantHistory.objects.create(
+            object_id=object_id,
+            serialized_data=text,
+            object_repr='PROFILE',
+            content_type=self.ct,
+            comment='',
+            user='testuser'
+        )
+
+    def get_versions(self, object_id=1):
+        return poem_models.TenantHistory.objects.filter(
+            object_id=object_id, content_type=self.ct
+        ).select_related('snapshot').order_by('date_created', 'id')
+
+    def test_keyframes_and_deltas(self):
+        versions = self.get_versions()
+        self.assertEqual(
+            [bool(ver.delta) for ver in versions],
+            [False, True, True, True, False, True, True, True]
+        )
+        self.assertEqual(
+            [ver.snapshot_id for ver in versions],
+            [versions[0].snapshot_id] * 4 + [versions[4].snapshot_id] * 4
+        )
+        self.assertEqual(poem_models.TenantHistorySnapshot.objects.count(), 2)
+        for ver in versions:
+            self.assertEqual(ver.data, '')
+            self.assertLess(len(ver.delta), 200)
+        self.assertEqual(
+            [ver.serialized_data for ver in versions],
+            [ver.serialized_data for ver in self.versions]
+        )
+        self.assertEqual(
+            poem_models.TenantHistoryHead.objects.get(
+                object_id=1, content_type=self.ct
+            ).serialized_data,
+            self.versions[-1].serialized_data
+        )
+
+    def test_identical_snapshots_are_stored_once(self):
+        text = self.versions[4].serialized_data
+        ver = self.create_version(text)
+        self.assertEqual(ver.snapshot_id, self.versions[4].snapshot_id)
+        self.assertEqual(ver.delta, '')
+        ver = self.create_version(text, object_id=2)
+        self.assertEqual(ver.snapshot_id, self.versions[4].snapshot_id)
+        self.assertEqual(poem_models.TenantHistorySnapshot.objects.count(), 2)
+        self.assertEqual(self.get_versions(2)[0].serialized_data, text)
+
+    def test_rewriting_version_keeps_other_versions(self):
+        texts = [ver.serialized_data for ver in self.versions]
+        ver = self.get_versions()[0]
+        data = json.loads(ver.serialized_data)
+        data[0]['fields']['groupname'] = 'NEW_GROUP'
+        ver.serialized_data = json.dumps(data)
+        ver.save()
+        texts[0] = json.dumps(data)
+        self.assertEqual(
+            [ver.serialized_data for ver in self.get_versions()], texts
+        )
+
+    @override_settings(HISTORY_STORAGE='full')
+    def test_full_storage(self):
+        ver = self.create_version(serialized_profile('PROFILE', []))
+        self.assertIsNone(ver.snapshot_id)
+        self.assertEqual(ver.data, serialized_profile('PROFILE', []))
+
+    def test_convert_history(self):
+        texts = [ver.serialized_data for ver in self.versions]
+        self.assertEqual(
+            poem_models.convert_history(self.ct.id, '1', delta=False), 8
+        )
+        versions = self.get_versions()
+        self.assertEqual([ver.data for ver in versions], texts)
+        self.assertEqual(
+            [ver.snapshot_id for ver in versions], [None] * 8
+        )
+        self.assertEqual(poem_models.delete_unused_snapshots(), 2)
+        self.assertEqual(poem_models.convert_history(self.ct.id, '1'), 8)
+        self.assertEqual(poem_models.convert_history(self.ct.id, '1'), 0)
+        versions = self.get_versions()
+        self.assertEqual(
+            [bool(ver.delta) for ver in versions],
+            [False, True, True, True, False, True, True, True]
+        )
+        self.assertEqual([ver.serialized_data for ver in versions], texts)
+
+    def test_probe_version_update_keeps_deltas(self):
+        package = admin_models.Package.objects.create(
+            name='package-1', version='1.0.0'
+        )
+        probe = admin_models.Probe.objects.create(
+            name='probe-1', package=package, description='Description.',
+            comment='Comment.', repository='https://repository.url',
+            docurl='https://doc.url', user='testuser',
+            datetime=datetime.datetime.now()
+        )
+        probekey = admin_models.ProbeHistory.objects.create(
+            object_id=probe, name=probe.name, package=package,
+            description=probe.description, comment=probe.comment,
+            repository=probe.repository, docurl=probe.docurl,
+            version_comment='Initial version.', version_user='testuser'
+        )
+        metric = poem_models.Metric.objects.create(
+            name='metric-1',
+            mtype=poem_models.MetricType.objects.create(name='Active'),
+            probekey=probekey
+        )
+        ct = ContentType.objects.get_for_model(poem_models.Metric)
+        for i in range(5):
+            metric.description = 'Version {}.'.format(i)
+            metric.save()
+            poem_models.TenantHistory.objects.create(
+                object_id=metric.id,
+                serialized_data=serializers.serialize(
+                    'json', [metric], use_natural_foreign_keys=True,
+                    use_natural_primary_keys=True
+                ),
+                object_repr=metric.__str__(),
+                content_type=ct,
+                comment='',
+                user='testuser'
+            )
+
+        package.version = '1.0.1'
+        package.save()
+
+        versions = poem_models.TenantHistory.objects.filter(
+            object_id=metric.id, content_type=ct
+        ).select_related('snapshot').order_by('date_created', 'id')
+        self.assertEqual(
+            [bool(ver.delta) for ver in versions],
+            [False, True, True, True, False]
+        )
+        self.assertEqual(
+            [json.loads(ver.serialized_data)[0]['fields']['probekey']
+             for ver in versions], [['probe-1', '1.0.1']] * 5
+        )
+        self.assertEqual(
+            [json.loads(ver.serialized_data)[0]['fields']['description']
+             for ver in versions],
+            ['Version {}.'.format(i) for i in range(5)]
+        )
+        self.assertEqual(
+            poem_models.TenantHistoryHead.objects.get(
+                object_id=metric.id, content_type=ct
+            ).serialized_data, versions[4].serialized_data
+        )
+        # snapshots of the old probe version are deleted
+        self.assertEqual(poem_models.TenantHistorySnapshot.objects.count(), 4)
+
+    def test_convert_history_command(self):
+        texts = [ver.serialized_data for ver in self.versions]
+        out = io.StringIO()
+        call_command(
+            'convert_history', '--to', 'full', '--schema',
+            connection.schema_name, stdout=out
+        )
+        self.assertEqual(
+            out.getvalue(),
+            '{}: 8 history entries converted, 2 unused snapshots '
+            'deleted.\n'.format(connection.schema_name.upper())
+        )
+        self.assertEqual(
+            [ver.data for ver in self.get_versions()], texts
+        )
+        self.assertFalse(poem_models.TenantHistorySnapshot.objects.exists())
+
+
+class HistoryPartitionsTests(TenantTestCase):
+    def setUp(self):
+        # partitions holding snapshots are not detached
+        storage = override_settings(HISTORY_STORAGE='full')
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        self.table = poem_models.TenantHistory._meta.db_table
+        self.ct = ContentType.objects.get_for_model(poem_models.MetricProfiles)
+        self.today = datetime.date.today()
+        for i, date in enumerate([
+            datetime.datetime(2020, 1, 15), datetime.datetime(2020, 3, 2),
+            None
+        ]):
+            history = self.create_version(str(i))
+            if date:
+                poem_models.TenantHistory.objects.filter(
+                    id=history.id
+                ).update(date_created=date)
+
+    def create_version(self, text):
+        return poem_models.TenantHistory.objects.create(
+            object_id=1,
+            serialized_data=text,
+            object_repr='PROFILE',
+            content_type=self.ct,
+            comment='',
+            user='testuser'
+        )
+
+    def month(self, months=0):
+        return history_partitions.partition_name(
+            self.table, history_partitions._month(self.today, months)
+        )
+
+    def test_partition_table(self):
+        self.assertFalse(history_partitions.is_partitioned(self.table))
+        self.assertTrue(history_partitions.partition_table(self.table))
+        self.assertTrue(history_partitions.is_partitioned(self.table))
+        self.assertFalse(history_partitions.partition_table(self.table))
+        partitions = history_partitions.get_partitions(self.table)
+        self.assertEqual(
+            partitions[:3], [
+                ('poem_tenanthistory_p202001', datetime.date(2020, 1, 1)),
+                ('poem_tenanthistory_p202002', datetime.date(2020, 2, 1)),
+                ('poem_tenanthistory_p202003', datetime.date(2020, 3, 1))
+            ]
+        )
+        self.assertEqual(
+            [name for name, month in partitions[-4:]],
+            [self.month(), self.month(1), self.month(2), self.month(3)]
+        )
+        self.assertEqual(
+            [ver.serialized_data for ver in
+             poem_models.TenantHistory.objects.order_by('date_created')],
+            ['0', '1', '2']
+        )
+        history = self.create_version('3')
+        self.assertEqual(
+            poem_models.get_latest_history('1', self.ct), history
+        )
+        self.assertEqual(
+            poem_models.get_latest_serialized_data('1', self.ct), '3'
+        )
+        history.delete()
+        self.assertFalse(
+            poem_models.TenantHistoryHead.objects.filter(
+                history_id=history.id
+            ).exists()
+        )
+
+    def test_create_partitions(self):
+        history_partitions.partition_table(self.table, months=1)
+        self.assertEqual(
+            history_partitions.get_partitions(self.table)[-1][0],
+            self.month(1)
+        )
+        self.assertEqual(
+            history_partitions.create_partitions(self.table, months=3),
+            [self.month(2), self.month(3)]
+        )
+        self.assertEqual(
+            history_partitions.create_partitions(self.table, months=3), []
+        )
+
+    def test_latest_version_read_from_its_partition(self):
+        history_partitions.partition_table(self.table)
+        history = self.create_version('3')
+        head = poem_models.TenantHistoryHead.objects.get(history=history)
+        self.assertEqual(head.date_created, history.date_created)
+        plan = poem_models.TenantHistory.objects.filter(
+            id=head.history_id, date_created=head.date_created
+        ).explain()
+        self.assertIn(self.month(), plan)
+        self.assertNotIn('poem_tenanthistory_p2020', plan)
+
+    def test_detach_partitions(self):
+        history_partitions.partition_table(self.table)
+        self.assertEqual(
+            history_partitions.detach_partitions(
+                self.table, datetime.date(2020, 3, 1)
+            ),
+            ['poem_tenanthistory_p202001', 'poem_tenanthistory_p202002']
+        )
+        self.assertEqual(
+            history_partitions.get_partitions(self.table)[0][0],
+            'poem_tenanthistory_p202003'
+        )
+        self.assertEqual(
+            [ver.serialized_data for ver in
+             poem_models.TenantHistory.objects.order_by('date_created')],
+            ['1', '2']
+        )
+
+    def test_partitioning_needs_postgresql_11(self):
+        with patch.object(connection, 'pg_version', 100012):
+            self.assertRaises(
+                NotSupportedError,
+                history_partitions.partition_table, self.table
+            )
+            with self.assertRaises(CommandError) as context:
+                call_command(
+                    'partition_history', '--convert',
+                    '--schema', connection.schema_name
+                )
+            self.assertEqual(
+                str(context.exception),
+                'History tables cannot be partitioned: PostgreSQL 11 or '
+                'newer is needed.'
+            )
+            out = io.StringIO()
+            call_command(
+                'partition_history', '--schema', connection.schema_name,
+                stdout=out
+            )
+            self.assertIn('History table is not partitioned', out.getvalue())
+
+        self.assertFalse(history_partitions.is_partitioned(self.table))
+
+    def test_partitions_in_use_are_not_detached(self):
+        # object not changed since January 2020
+        history = poem_models.TenantHistory.objects.create(
+            object_id=2,
+            serialized_data='unchanged',
+            object_repr='PROFILE2',
+            content_type=self.ct,
+            comment='',
+            user='testuser'
+        )
+        history.date_created = datetime.datetime(2020, 1, 20)
+        poem_models.TenantHistory.objects.filter(id=history.id).update(
+            date_created=history.date_created
+        )
+        poem_models.TenantHistoryHead.objects.filter(
+            history=history
+        ).update(date_created=history.date_created)
+        history_partitions.partition_table(self.table)
+        out = io.StringIO()
+        call_command(
+            'partition_history', '--detach-before', '2020-04-01',
+            '--schema', connection.schema_name, stdout=out
+        )
+        self.assertIn(
+            '0 partitions created, 2 partitions detached: '
+            'poem_tenanthistory_p202002, poem_tenanthistory_p202003',
+            out.getvalue()
+        )
+        self.assertEqual(
+            poem_models.get_latest_history('2', self.ct), history
+        )
+
+        with override_settings(HISTORY_STORAGE='delta'):
+            poem_models.convert_history(self.ct.id, '1')
+
+        self.assertEqual(
+            history_partitions.detach_partitions(
+                self.table, datetime.date(2020, 4, 1),
+                'snapshot_id IS NOT NULL'
+            ), []
+        )
+
+    def test_partition_history_command(self):
+        schema = connection.schema_name
+        out = io.StringIO()
+        call_command('partition_history', '--schema', schema, stdout=out)
+        self.assertEqual(
+            out.getvalue(),
+            '{}: History table is not partitioned; use --convert to '
+            'partition it.\n'.format(schema.upper())
+        )
+        out = io.StringIO()
+        call_command(
+            'partition_history', '--convert', '--months', '1',
+            '--schema', schema, stdout=out
+        )
+        self.assertEqual(
+            out.getvalue(),
+            '{0}: History table partitioned.\n'
+            '{0}: 0 partitions created, 0 partitions detached.\n'.format(
+                schema.upper()
+            )
+        )
+        out = io.StringIO()
+        call_command(
+            'partition_history', '--detach-before', '2020-02-01',
+            '--schema', schema, stdout=out
+        )
+        self.assertEqual(
+            out.getvalue(),
+            '{}: 2 partitions created, 1 partitions detached: '
+            'poem_tenanthistory_p202001.\n'.format(schema.upper())
+        )
+
+
+class HistoryArchiveTests(TenantTestCase):
+    def setUp(self):
+        # counts of deleted snapshots depend on history storage
+        storage = override_settings(HISTORY_STORAGE='full')
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        self.ct = ContentType.objects.get_for_model(poem_models.MetricProfiles)
+        now = datetime.datetime.now()
+        self.versions = []
+        for i, days in enumerate([100, 80, 60, 40, 20, 0]):
+            history = poem_models.TenantHistory.objects.create(
+                object_id=1,
+                serialized_data=serialized_profile(
+                    'PROFILE', [['service', 'metric-{}'.format(i)]]
+                ),
+                object_repr='PROFILE',
+                content_type=self.ct,
+                comment='',
+                user='testuser'
+            )
+            if days:
+                history.date_created = now - datetime.timedelta(days=days)
+                poem_models.TenantHistory.objects.filter(
+                    id=history.id
+                ).update(date_created=history.date_created)
+
+            self.versions.append(history)
+
+    def get_ids(self):
+        return list(
+            poem_models.TenantHistory.objects.filter(
+                object_id=1, content_type=self.ct
+            ).order_by('date_created').values_list('id', flat=True)
+        )
+
+    def test_keep_versions(self):
+        self.assertEqual(poem_models.archive_history(self.ct.id, '1', 3), 3)
+        self.assertEqual(
+            self.get_ids(), [ver.id for ver in self.versions[3:]]
+        )
+        archive = poem_models.TenantHistoryArchive.objects.get()
+        self.assertEqual(archive.versions, 3)
+        self.assertEqual(archive.date_from, self.versions[0].date_created)
+        self.assertEqual(archive.date_until, self.versions[2].date_created)
+        archived = archive.get_versions()
+        self.assertEqual(
+            [ver['id'] for ver in archived],
+            [ver.id for ver in self.versions[:3]]
+        )
+        self.assertEqual(
+            archived[0]['serialized_data'], self.versions[0].serialized_data
+        )
+        self.assertEqual(archived[0]['user'], 'testuser')
+        self.assertEqual(
+            poem_models.get_archive_boundary('1', self.ct),
+            (3, self.versions[2].date_created)
+        )
+        self.assertEqual(poem_models.archive_history(self.ct.id, '1', 3), 0)
+
+    def test_keep_days(self):
+        self.assertEqual(
+            poem_models.archive_history(self.ct.id, '1', keep_days=50), 3
+        )
+        self.assertEqual(
+            self.get_ids(), [ver.id for ver in self.versions[3:]]
+        )
+
+    def test_keep_versions_or_days(self):
+        self.assertEqual(
+            poem_models.archive_history(self.ct.id, '1', 2, keep_days=70), 2
+        )
+        self.assertEqual(
+            self.get_ids(), [ver.id for ver in self.versions[2:]]
+        )
+        self.assertEqual(
+            poem_models.archive_history(self.ct.id, '1', 4, keep_days=10), 0
+        )
+
+    def test_latest_version_is_kept(self):
+        self.assertEqual(
+            poem_models.archive_history(self.ct.id, '1', 0, keep_days=0), 5
+        )
+        self.assertEqual(self.get_ids(), [self.versions[-1].id])
+        self.assertEqual(
+            poem_models.get_latest_history('1', self.ct), self.versions[-1]
+        )
+
+    def test_archive_in_batches(self):
+        self.assertEqual(
+            poem_models.archive_history(self.ct.id, '1', 1, batch_size=2), 5
+        )
+        self.assertEqual(
+            [
+                archive.versions for archive in
+                poem_models.TenantHistoryArchive.objects.order_by('id')
+            ], [2, 2, 1]
+        )
+        self.assertEqual(
+            poem_models.get_archive_boundary('1', self.ct),
+            (5, self.versions[4].date_created)
+        )
+        self.assertIsNone(poem_models.get_archive_boundary('2', self.ct))
+
+    def test_archive_delta_encoded_history(self):
+        with override_settings(HISTORY_STORAGE='delta'):
+            poem_models.convert_history(self.ct.id, '1')
+            self.assertEqual(
+                poem_models.archive_history(self.ct.id, '1', 2), 4
+            )
+
+        self.assertEqual(
+            [
+                ver['serialized_data'] for ver in
+                poem_models.TenantHistoryArchive.objects.get().get_versions()
+            ],
+            [ver.serialized_data for ver in self.versions[:4]]
+        )
+        self.assertEqual(
+            [
+                ver.serialized_data for ver in
+                poem_models.TenantHistory.objects.filter(
+                    id__in=self.get_ids()
+                ).select_related('snapshot').order_by('date_created')
+            ],
+            [ver.serialized_data for ver in self.versions[4:]]
+        )
+
+    def test_archive_history_command(self):
+        schema = connection.schema_name
+        out = io.StringIO()
+        with override_settings(CONFIG_FILE='/nonexisting/poem.conf'):
+            call_command('archive_history', '--schema', schema, stdout=out)
+
+        self.assertEqual(
+            out.getvalue(),
+            '{}: No history retention set; skipping.\n'.format(schema.upper())
+        )
+
+        with tempfile.NamedTemporaryFile('w', suffix='.conf') as conf:
+            conf.write(
+                '[GENERAL_{}]\nHistoryKeepVersions = 2\n'.format(
+                    schema.upper()
+                )
+            )
+            conf.flush()
+            out = io.StringIO()
+            with override_settings(CONFIG_FILE=conf.name):
+                call_command(
+                    'archive_history', '--schema', schema, stdout=out
+                )
+
+        self.assertEqual(
+            out.getvalue(),
+            '{}: 4 history entries archived, 0 unused snapshots '
+            'deleted.\n'.format(schema.upper())
+        )
+        out = io.StringIO()
+        call_command(
+            'archive_history', '--keep-versions', '1', '--schema', schema,
+            stdout=out
+        )
+        self.assertEqual(
+            out.getvalue(),
+            '{}: 1 history entries archived, 0 unused snapshots '
+            'deleted.\n'.format(schema.upper())
+        )
+        self.assertEqual(self.get_ids(), [self.versions[-1].id])
+
+
+class WebAPITests(TenantTestCase):
+    def setUp(self):
+        webapi.clear_tokens()
+        webapi.clear_stats()
+        webapi.clear_breakers()
+        self.key = MyAPIKey.objects.create(name='WEB-API', token='mock_key')
+        self.data = {'data': [{'id': '1', 'name': 'PROFILE1'}]}
+
+    def tearDown(self):
+        webapi.clear_tokens()
+        webapi.clear_stats()
+        webapi.clear_breakers()
+
+    def test_session_is_shared(self):
+        session = webapi.get_session()
+        self.assertIs(webapi.get_session(), session)
+        adapter = session.get_adapter('https://mock.api.url')
+        self.assertEqual(
+            adapter.max_retries.total, settings.WEBAPI_RETRIES
+        )
+        self.assertEqual(
+            adapter.max_retries.status_forcelist, webapi.RETRY_STATUSES
+        )
+        session = webapi.get_session(retries=False)
+        self.assertIs(webapi.get_session(retries=False), session)
+        adapter = session.get_adapter('https://mock.api.url')
+        self.assertEqual(adapter.max_retries.total, 0)
+        self.assertFalse(adapter.max_retries.read)
+
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_token_is_cached(self, mock_get):
+        mock_get.return_value = MockResponse(self.data, 200)
+        webapi.get_data('https://mock.api.url')
+        MyAPIKey.objects.filter(name='WEB-API').update(token='new_key')
+        webapi.get_data('https://mock.api.url')
+        self.assertEqual(
+            mock_get.call_args_list[1][1]['headers']['x-api-key'], 'mock_key'
+        )
+        self.key.refresh_from_db()
+        self.key.save()
+        webapi.get_data('https://mock.api.url')
+        self.assertEqual(
+            mock_get.call_args_list[2][1]['headers']['x-api-key'], 'new_key'
+        )
+
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_token_is_refreshed_if_unauthorized(self, mock_get):
+        def get(url, headers, timeout):
+            if headers['x-api-key'] == 'new_key':
+                return MockResponse(self.data, 200)
+
+            else:
+                return mocked_web_api_metric_profiles_wrong_token()
+
+        mock_get.side_effect = get
+        webapi.get_token()
+        MyAPIKey.objects.filter(name='WEB-API').update(token='new_key')
+        data = webapi.get_data('https://mock.api.url')
+        self.assertEqual(data, self.data['data'])
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('Poem.helpers.webapi.requests.Session.put')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_stats(self, mock_get, mock_put):
+        mock_get.side_effect = [
+            MockResponse(self.data, 200),
+            mocked_web_api_metric_profiles_not_found(),
+            requests.exceptions.ConnectionError
+        ]
+        mock_put.side_effect = mocked_web_api_metric_profile_put
+        webapi.get_data('https://mock.api.url')
+        self.assertRaises(
+            requests.exceptions.HTTPError,
+            webapi.get_data, 'https://mock.api.url', '1'
+        )
+        self.assertRaises(
+            requests.exceptions.ConnectionError,
+            webapi.get_data, 'https://mock.api.url'
+        )
+        webapi.put_data('https://mock.api.url', '1', self.data['data'][0])
+        mock_put.assert_called_once_with(
+            'https://mock.api.url/1',
+            headers={'Accept': 'application/json', 'x-api-key': 'mock_key'},
+            data=json.dumps(self.data['data'][0]),
+            timeout=settings.WEBAPI_TIMEOUT
+        )
+        stats = webapi.get_stats()
+        self.assertEqual(
+            sorted(stats.keys()),
+            ['GET https://mock.api.url', 'PUT https://mock.api.url']
+        )
+        get_stats = stats['GET https://mock.api.url']
+        self.assertEqual(get_stats['calls'], 3)
+        self.assertEqual(get_stats['errors'], 2)
+        self.assertEqual(
+            get_stats['bytes'],
+            len(json.dumps(self.data)) + len('404 page not found')
+        )
+        self.assertEqual(stats['PUT https://mock.api.url']['calls'], 1)
+        self.assertEqual(stats['PUT https://mock.api.url']['errors'], 0)
+
+
+    @patch('Poem.helpers.webapi.logger')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_breaker_opens_if_calls_fail(self, mock_get, mock_logger):
+        mock_get.side_effect = requests.exceptions.ConnectionError
+        for i in range(settings.WEBAPI_BREAKER_MIN_CALLS):
+            self.assertRaises(
+                requests.exceptions.ConnectionError,
+                webapi.get_data, 'https://mock.api.url'
+            )
+        self.assertEqual(
+            webapi.get_breaker('https://mock.api.url').state, 'open'
+        )
+        self.assertRaises(
+            webapi.WebAPIUnavailable, webapi.get_data, 'https://mock.api.url'
+        )
+        self.assertRaises(
+            webapi.WebAPIUnavailable,
+            webapi.put_data, 'https://mock.api.url', '1', self.data['data'][0]
+        )
+        self.assertEqual(
+            mock_get.call_count, settings.WEBAPI_BREAKER_MIN_CALLS
+        )
+        self.assertEqual(
+            webapi.get_stats()['GET https://mock.api.url']['breaker'], 'open'
+        )
+        mock_logger.warning.assert_called_once()
+
+        # other endpoints are not affected
+        mock_get.side_effect = None
+        mock_get.return_value = MockResponse(self.data, 200)
+        self.assertEqual(
+            webapi.get_data('https://other.api.url'), self.data['data']
+        )
+
+    @patch('Poem.helpers.webapi.logger')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_breaker_stays_closed_if_client_errors(self, mock_get, mock_log):
+        mock_get.side_effect = mocked_web_api_metric_profiles_not_found
+        for i in range(settings.WEBAPI_BREAKER_MIN_CALLS + 1):
             self.assertRaises(
                 requests.exceptions.HTTPError,
-                delete_metrics_from_profile,
-                profile='PROFILE1', metrics=['metric3', 'metric4']
+                webapi.get_data, 'https://mock.api.url'
             )
-            mock_get.assert_called_once_with(
-                'https://mock.api.url/11111111-2222-3333-4444-555555555555',
-                headers={'Accept': 'application/json',
-                         'x-api-key': 'wrong_key'},
-                timeout=180
+        self.assertEqual(
+            webapi.get_breaker('https://mock.api.url').state, 'closed'
+        )
+
+    @patch('Poem.helpers.webapi.logger')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_breaker_half_open_probe(self, mock_get, mock_logger):
+        breaker = webapi.get_breaker('https://mock.api.url')
+        mock_get.side_effect = requests.exceptions.ConnectionError
+        with self.settings(WEBAPI_BREAKER_COOLDOWN=0):
+            for i in range(settings.WEBAPI_BREAKER_MIN_CALLS):
+                self.assertRaises(
+                    requests.exceptions.ConnectionError,
+                    webapi.get_data, 'https://mock.api.url'
+                )
+            self.assertEqual(breaker.state, 'half-open')
+
+            # failed probe opens breaker again
+            self.assertRaises(
+                requests.exceptions.ConnectionError,
+                webapi.get_data, 'https://mock.api.url'
+            )
+            self.assertEqual(
+                mock_get.call_count, settings.WEBAPI_BREAKER_MIN_CALLS + 1
             )
 
-    @patch(
-        'Poem.helpers.metrics_helpers.poem_models.MetricProfiles.objects.get'
-    )
-    def test_delete_metrics_from_profiles_nonexisting_key(self, mock_profile):
-        mock_profile.return_value = poem_models.MetricProfiles(
-            name='PROFILE1', apiid='11111111-2222-3333-4444-555555555555',
-            description='First profile', groupname='TEST'
-        )
-        with self.assertRaises(Exception) as context:
-            delete_metrics_from_profile(
-                profile='PROFILE1', metrics=['metric3', 'metric4']
+        self.assertEqual(breaker.state, 'open')
+
+        with self.settings(WEBAPI_BREAKER_COOLDOWN=0):
+            # only one probe at a time
+            self.assertTrue(breaker.acquire())
+            self.assertRaises(webapi.WebAPIUnavailable, breaker.acquire)
+            breaker.record(False, probe=True)
+            self.assertEqual(breaker.state, 'closed')
+
+            mock_get.side_effect = None
+            mock_get.return_value = MockResponse(self.data, 200)
+            self.assertEqual(
+                webapi.get_data('https://mock.api.url'), self.data['data']
+            )
+
+    @patch('Poem.helpers.webapi.logger')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_probe_recorded_on_unexpected_error(self, mock_get, mock_logger):
+        breaker = webapi.get_breaker('https://mock.api.url')
+        with self.settings(
+                WEBAPI_BREAKER_MIN_CALLS=1, WEBAPI_BREAKER_COOLDOWN=0
+        ):
+            breaker.record(True)
+            self.assertEqual(breaker.state, 'half-open')
+            mock_get.side_effect = ValueError
+            self.assertRaises(
+                ValueError, webapi.get_data, 'https://mock.api.url'
             )
+            # failed probe opens breaker again, without blocking the next one
+            self.assertEqual(breaker.state, 'half-open')
+            mock_get.side_effect = None
+            mock_get.return_value = MockResponse(self.data, 200)
+            self.assertEqual(
+                webapi.get_data('https://mock.api.url'), self.data['data']
+            )
+            self.assertEqual(breaker.state, 'closed')
+
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_deadline(self, mock_get):
+        mock_get.return_value = MockResponse(self.data, 200)
+        self.assertIsNone(webapi.get_deadline())
+        with webapi.deadline(20), patch(
+                'Poem.helpers.webapi.get_session', wraps=webapi.get_session
+        ) as mock_session:
+            self.assertIsNotNone(webapi.get_deadline())
+            webapi.get_data('https://mock.api.url')
+            # retries are left out, so that call ends within the deadline
+            mock_session.assert_called_once_with(retries=False)
+            timeout = mock_get.call_args[1]['timeout']
+            self.assertLessEqual(timeout, 20)
+            self.assertGreater(timeout, 0)
+
+            with webapi.deadline(0):
+                self.assertRaises(
+                    webapi.WebAPIUnavailable,
+                    webapi.get_data, 'https://mock.api.url'
+                )
+
+        self.assertIsNone(webapi.get_deadline())
+        self.assertEqual(mock_get.call_count, 1)
+        webapi.get_data('https://mock.api.url')
         self.assertEqual(
-            str(context.exception),
-            'Error deleting metric from profile: API key not found.'
+            mock_get.call_args[1]['timeout'], settings.WEBAPI_TIMEOUT
+        )
+
+    def test_deadline_middleware(self):
+        deadlines = []
+
+        def get_response(request):
+            deadlines.append(webapi.get_deadline())
+            return 'response'
+
+        middleware = webapi.WebAPIDeadlineMiddleware(get_response)
+        start = time.monotonic()
+        self.assertEqual(middleware('request'), 'response')
+        self.assertGreater(deadlines[0], start)
+        self.assertLessEqual(
+            deadlines[0], time.monotonic() + settings.WEBAPI_REQUEST_BUDGET
+        )
+        self.assertIsNone(webapi.get_deadline())
+
+    @patch('Poem.helpers.webapi.logger')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_get_stale_data(self, mock_get, mock_logger):
+        mock_get.side_effect = [
+            MockResponse(self.data, 200),
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ConnectionError
+        ]
+        self.assertEqual(
+            webapi.get_data('https://mock.api.url', stale_ok=True),
+            self.data['data']
+        )
+        self.assertEqual(
+            webapi.get_data('https://mock.api.url', stale_ok=True),
+            self.data['data']
+        )
+        mock_logger.warning.assert_called_once()
+        self.assertRaises(
+            requests.exceptions.ConnectionError,
+            webapi.get_data, 'https://mock.api.url'
+        )
+
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_stale_data_not_used_if_client_error(self, mock_get):
+        mock_get.side_effect = [
+            MockResponse(self.data, 200),
+            mocked_web_api_metric_profiles_wrong_token()
+        ]
+        webapi.get_data('https://mock.api.url', stale_ok=True)
+        self.assertRaises(
+            requests.exceptions.HTTPError,
+            webapi.get_data, 'https://mock.api.url', stale_ok=True
+        )
+
+def _schema_and_thread(fail=None):
+    if connection.schema_name == fail:
+        raise ValueError('Failed in {}'.format(fail))
+
+    return connection.schema_name, threading.get_ident()
+
+
+def _marker_and_backend():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT name FROM marker')
+        marker = cursor.fetchone()[0]
+        cursor.execute('SELECT pg_backend_pid()')
+        return connection.schema_name, marker, cursor.fetchone()[0]
+
+
+class WebAPIServerTests(TenantTestCase):
+    def setUp(self):
+        webapi.clear_tokens()
+        webapi.clear_breakers()
+        utils.clear_sync_cache()
+        MyAPIKey.objects.create(name='WEB-API', token='mock_key')
+        self.fixtures = tempfile.mkdtemp()
+        self.profiles = mocked_web_api_metric_profiles().json()['data']
+        with open(
+                os.path.join(self.fixtures, 'metric_profiles.json'), 'w'
+        ) as f:
+            json.dump(self.profiles, f)
+
+        self.server = None
+        self.start()
+
+    def start(self, **kwargs):
+        if self.server:
+            self.stop()
+
+        self.server = webapi_server.make_server(
+            self.fixtures, port=0, token='mock_key', **kwargs
         )
+        threading.Thread(target=self.server.serve_forever).start()
+        self.url = 'http://localhost:{}/api/v2/'.format(
+            self.server.server_port
+        )
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
 
-    def test_delete_metrics_from_profiles_missing_profile(self):
-        with self.assertRaises(Exception) as context:
-            delete_metrics_from_profile(
-                profile='PROFILE1', metrics=['metric3', 'metric4']
+    def tearDown(self):
+        self.stop()
+        shutil.rmtree(self.fixtures)
+        webapi.clear_tokens()
+        webapi.clear_breakers()
+
+    def test_get_profiles(self):
+        self.assertEqual(
+            webapi.get_data(self.url + 'metric_profiles'), self.profiles
+        )
+        self.assertEqual(
+            webapi.get_data(
+                self.url + 'metric_profiles',
+                '66666666-7777-8888-9999-000000000000'
+            ),
+            [self.profiles[1]]
+        )
+        self.assertEqual(webapi.get_data(self.url + 'thresholds_profiles'), [])
+
+    def test_get_missing_profile(self):
+        with self.assertRaises(requests.exceptions.HTTPError) as context:
+            webapi.get_data(self.url + 'metric_profiles', 'nonexisting')
+        self.assertEqual(context.exception.response.status_code, 404)
+
+        with self.assertRaises(requests.exceptions.HTTPError) as context:
+            webapi.get_data(self.url + 'nonexisting_profiles')
+        self.assertEqual(context.exception.response.status_code, 404)
+
+    def test_wrong_token(self):
+        webapi.clear_tokens()
+        MyAPIKey.objects.filter(name='WEB-API').update(token='wrong_key')
+        with self.assertRaises(requests.exceptions.HTTPError) as context:
+            webapi.get_data(self.url + 'metric_profiles')
+        self.assertEqual(context.exception.response.status_code, 401)
+
+    def test_put_profile(self):
+        data = dict(self.profiles[0], services=[])
+        webapi.put_data(self.url + 'metric_profiles', data['id'], data)
+        profile = webapi.get_data(self.url + 'metric_profiles', data['id'])[0]
+        self.assertEqual(profile['services'], [])
+        self.assertEqual(profile['name'], 'PROFILE1')
+
+        # fixture is not changed
+        self.start()
+        self.assertEqual(
+            webapi.get_data(self.url + 'metric_profiles', data['id']),
+            [self.profiles[0]]
+        )
+
+        with self.assertRaises(requests.exceptions.HTTPError) as context:
+            webapi.put_data(self.url + 'metric_profiles', 'nonexisting', data)
+        self.assertEqual(context.exception.response.status_code, 404)
+
+    def test_put_profile_persist(self):
+        self.start(persist=True)
+        data = dict(self.profiles[0], services=[])
+        webapi.put_data(self.url + 'metric_profiles', data['id'], data)
+        self.start()
+        profile = webapi.get_data(self.url + 'metric_profiles', data['id'])[0]
+        self.assertEqual(profile['services'], [])
+
+    def test_latency(self):
+        self.start(latency=0.2)
+        start = time.monotonic()
+        webapi.get_data(self.url + 'metric_profiles')
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_failure_injection(self):
+        self.start(failure_rate=1, failure_status=500)
+        with self.assertRaises(requests.exceptions.HTTPError) as context:
+            webapi.get_data(self.url + 'metric_profiles')
+        self.assertEqual(context.exception.response.status_code, 500)
+
+    def test_metric_profiles_writeback(self):
+        with self.settings(WEBAPI_METRIC=self.url + 'metric_profiles'):
+            self.assertIn('metric3', get_metrics_in_profiles('test'))
+            writeback = MetricProfilesWriteBack()
+            writeback.remove('metric3')
+            writeback.rename('metric1', 'new.metric1')
+            self.assertEqual(writeback.flush(), [])
+            self.assertEqual(
+                get_metrics_in_profiles('test'),
+                {
+                    'new.metric1': ['PROFILE1'],
+                    'metric2': ['PROFILE1', 'PROFILE2'],
+                    'metric4': ['PROFILE1'],
+                    'metric5': ['PROFILE2'],
+                    'metric7': ['PROFILE2']
+                }
             )
+            self.assertFalse(poem_models.MetricProfileMetric.objects.filter(
+                metric='metric3'
+            ).exists())
+            # profiles are always fetched again, local copy may be stale
+            self.server.store.put('metric_profiles', self.profiles[0]['id'], {
+                'name': 'PROFILE1', 'services': []
+            })
+            self.assertNotIn('metric4', get_metrics_in_profiles('test'))
+
+
+class TenantHelpersTests(TenantTestCase):
+    def test_get_tenant_schemas(self):
+        self.assertEqual(tenant_helpers.get_tenant_schemas(), ['test'])
+
+    def test_run_in_tenants_in_transaction(self):
+        schemas = ['test', get_public_schema_name(), 'test']
+        results = tenant_helpers.run_in_tenants(
+            _schema_and_thread, fail=get_public_schema_name(),
+            schemas=schemas, workers=3
+        )
+        self.assertEqual([r.schema for r in results], schemas)
         self.assertEqual(
-            str(context.exception),
-            'Error deleting metric from profile: Profile not found.'
+            results[0].result, ('test', threading.get_ident())
+        )
+        self.assertEqual(results[2].result, results[0].result)
+        self.assertIsNone(results[1].result)
+        self.assertIsInstance(results[1].error, ValueError)
+        self.assertEqual(connection.schema_name, 'test')
+        with self.assertRaises(ValueError):
+            tenant_helpers.raise_tenant_errors(results)
+
+    def test_run_in_tenants_default_schemas(self):
+        results = tenant_helpers.run_in_tenants(_schema_and_thread)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].schema, 'test')
+        self.assertIsNone(results[0].error)
+        tenant_helpers.raise_tenant_errors(results)
+
+
+class TenantHelpersConcurrentTests(TransactionTestCase):
+    def _create_schema(self, schema):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA {}'.format(schema))
+            cursor.execute(
+                'CREATE TABLE {}.marker (name text)'.format(schema)
+            )
+            cursor.execute(
+                'INSERT INTO {}.marker VALUES (%s)'.format(schema), [schema]
+            )
+        self.addCleanup(
+            connection.cursor().execute,
+            'DROP SCHEMA IF EXISTS {} CASCADE'.format(schema)
         )
+
+    def _backends(self, pids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pid FROM pg_stat_activity WHERE pid = ANY(%s)',
+                [list(pids)]
+            )
+            return set(row[0] for row in cursor.fetchall())
+
+    def test_run_in_tenants_in_own_schemas(self):
+        self.assertFalse(connection.in_atomic_block)
+        schemas = ['tenant_a', 'tenant_b', 'tenant_c', 'tenant_a']
+        for schema in set(schemas):
+            self._create_schema(schema)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            own_pid = cursor.fetchone()[0]
+
+        results = tenant_helpers.run_in_tenants(
+            _marker_and_backend, schemas=schemas, workers=2
+        )
+        self.assertEqual([r.error for r in results], [None] * 4)
+        self.assertEqual(
+            [r.result[:2] for r in results],
+            [(schema, schema) for schema in schemas]
+        )
+        pids = set(r.result[2] for r in results)
+        self.assertNotIn(own_pid, pids)
+        self.assertLessEqual(len(pids), 2)
+        self.assertEqual(connection.schema_name, get_public_schema_name())
+
+        # backends of worker connections exit shortly after being closed
+        for i in range(50):
+            if not self._backends(pids):
+                break
+
+            time.sleep(0.1)
+
+        self.assertEqual(self._backends(pids), set())
+
+    def test_run_in_tenants_concurrently(self):
+        public = get_public_schema_name()
+        results = tenant_helpers.run_in_tenants(
+            _schema_and_thread, fail='nonexisting', schemas=[public] * 4,
+            workers=2
+        )
+        self.assertEqual([r.schema for r in results], [public] * 4)
+        self.assertTrue(all(r.error is None for r in results))
+        self.assertEqual(set(r.result[0] for r in results), {public})
+        threads = set(r.result[1] for r in results)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertLessEqual(len(threads), 2)
+
+    def test_run_in_tenants_carries_deadline(self):
+        public = get_public_schema_name()
+        with webapi.deadline(10):
+            end = webapi.get_deadline()
+            results = tenant_helpers.run_in_tenants(
+                webapi.get_deadline, schemas=[public] * 2, workers=2
+            )
+        self.assertEqual([r.error for r in results], [None, None])
+        for result in results:
+            self.assertAlmostEqual(result.result, end, places=3)
+
+    def test_run_in_tenants_collects_errors(self):
+        public = get_public_schema_name()
+        results = tenant_helpers.run_in_tenants(
+            _schema_and_thread, fail=public, schemas=[public] * 3,
+            workers=3
+        )
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertIsNone(result.result)
+            self.assertEqual(str(result.error), 'Failed in public')
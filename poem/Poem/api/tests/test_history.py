@@ -5,6 +5,7 @@ from Poem.api import views_internal as views
 from Poem.poem_super_admin import models as admin_models
 from Poem.users.models import CustUser
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import force_authenticate
 from tenant_schemas.test.cases import TenantTestCase
 from tenant_schemas.test.client import TenantRequestFactory
@@ -692,3 +693,129 @@ class ListVersionsAPIViewTests(TenantTestCase):
                 }
             ]
         )
+
+    def test_get_all_metrictemplate_versions(self):
+        request = self.factory.get(self.url + 'metrictemplate/')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metrictemplate')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(
+            [ver['object_repr'] for ver in data],
+            sorted(
+                ver.__str__() for ver in
+                admin_models.MetricTemplateHistory.objects.all()
+            )
+        )
+        self.assertEqual(
+            [ver['id'] for ver in data],
+            [self.ver4.id, self.ver5.id, self.ver6.id, self.ver7.id]
+        )
+
+    def test_get_all_versions_streamed_same_as_rendered(self):
+        for obj in ['probe', 'metrictemplate']:
+            request = self.factory.get(self.url + obj + '/')
+            force_authenticate(request, user=self.user)
+            streamed = b''.join(self.view(request, obj).streaming_content)
+
+            request = self.factory.get(
+                self.url + obj + '/', HTTP_ACCEPT='application/json; indent=4'
+            )
+            force_authenticate(request, user=self.user)
+            response = self.view(request, obj)
+            self.assertFalse(response.streaming)
+            self.assertEqual(streamed, JSONRenderer().render(response.data))
+
+    def get_pages(self, obj, name=None, **params):
+        url = self.url + obj + '/' + (name if name else '')
+        pages = []
+        cursor = None
+        while True:
+            query = dict(params)
+            if cursor:
+                query['cursor'] = cursor
+            request = self.factory.get(url, query)
+            force_authenticate(request, user=self.user)
+            if name:
+                response = self.view(request, obj, name)
+                pages.append(response.data)
+
+            else:
+                response = self.view(request, obj)
+                pages.append(json.loads(b''.join(response.streaming_content)))
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            if 'X-Next-Cursor' not in response:
+                self.assertNotIn('Link', response)
+                return pages
+
+            cursor = response['X-Next-Cursor']
+            self.assertIn('cursor=' + cursor, response['Link'])
+
+    def test_get_all_versions_paginated(self):
+        for obj, sizes in [('probe', [2, 1]), ('metrictemplate', [2, 2])]:
+            request = self.factory.get(self.url + obj + '/')
+            force_authenticate(request, user=self.user)
+            data = json.loads(
+                b''.join(self.view(request, obj).streaming_content)
+            )
+            pages = self.get_pages(obj, limit=2)
+            self.assertEqual([len(page) for page in pages], sizes)
+            self.assertEqual(sum(pages, []), data)
+
+    def test_get_versions_of_probe_paginated(self):
+        pages = self.get_pages('probe', 'poem-probe-new', limit=1)
+        self.assertEqual(
+            [[ver['id'] for ver in page] for page in pages],
+            [[self.ver2.id], [self.ver1.id]]
+        )
+
+    def test_get_versions_summary(self):
+        request = self.factory.get(self.url + 'probe/poem-probe-new')
+        force_authenticate(request, user=self.user)
+        data = self.view(request, 'probe', 'poem-probe-new').data
+        for ver in data:
+            del ver['fields']
+        self.assertEqual(
+            self.get_pages('probe', 'poem-probe-new', summary='1'), [data]
+        )
+        request = self.factory.get(self.url + 'metrictemplate/')
+        force_authenticate(request, user=self.user)
+        data = json.loads(
+            b''.join(self.view(request, 'metrictemplate').streaming_content)
+        )
+        for ver in data:
+            del ver['fields']
+        self.assertEqual(
+            self.get_pages('metrictemplate', summary='true'), [data]
+        )
+
+    def test_get_versions_with_invalid_pagination(self):
+        for params in [
+            {'limit': 'a'}, {'limit': '0'}, {'limit': '1', 'cursor': 'xx'},
+            {'limit': '1', 'cursor': 'WzFd'},
+            {'limit': '1', 'cursor': 'WzEsIjEiXQ'}
+        ]:
+            request = self.factory.get(self.url + 'probe/', params)
+            force_authenticate(request, user=self.user)
+            response = self.view(request, 'probe')
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+    def test_comments_rendered_when_version_is_saved(self):
+        self.assertEqual(
+            self.ver2.version_rendered_comment,
+            'Changed name, comment, description, repository and docurl.'
+        )
+        request = self.factory.get(self.url + 'probe/poem-probe-new')
+        force_authenticate(request, user=self.user)
+        data = self.view(request, 'probe', 'poem-probe-new').data
+        # versions saved bypassing the model have their comments rendered
+        # when listed
+        admin_models.ProbeHistory.objects.update(version_rendered_comment='')
+        request = self.factory.get(self.url + 'probe/poem-probe-new')
+        force_authenticate(request, user=self.user)
+        self.assertEqual(
+            self.view(request, 'probe', 'poem-probe-new').data, data
+        )
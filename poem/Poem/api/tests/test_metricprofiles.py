@@ -130,7 +130,7 @@ class ListMetricProfilesAPIViewTests(TenantTestCase):
             content_type=self.ct
         )
 
-    @patch('Poem.api.internal_views.metricprofiles.sync_webapi')
+    @patch('Poem.api.internal_views.metricprofiles.sync_webapi_if_stale')
     def test_get_all_metric_profiles(self, func):
         func.side_effect = mocked_func
         request = self.factory.get(self.url)
@@ -154,7 +154,7 @@ class ListMetricProfilesAPIViewTests(TenantTestCase):
             ]
         )
 
-    @patch('Poem.api.internal_views.metricprofiles.sync_webapi')
+    @patch('Poem.api.internal_views.metricprofiles.sync_webapi_if_stale')
     def test_get_metric_profile_by_name(self, func):
         func.side_effect = mocked_func
         request = self.factory.get(self.url + 'TEST_PROFILE')
@@ -170,7 +170,7 @@ class ListMetricProfilesAPIViewTests(TenantTestCase):
             ])
         )
 
-    @patch('Poem.api.internal_views.metricprofiles.sync_webapi')
+    @patch('Poem.api.internal_views.metricprofiles.sync_webapi_if_stale')
     def test_get_metric_profile_if_wrong_name(self, func):
         func.side_effect = mocked_func
         request = self.factory.get(self.url + 'nonexisting')
@@ -382,3 +382,48 @@ class ListMetricProfilesAPIViewTests(TenantTestCase):
         self.assertEqual(
             response.data, {'detail': 'Metric profile not specified!'}
         )
+
+
+class ListMetricProfilesForMetricAPIViewTests(TenantTestCase):
+    def setUp(self):
+        self.factory = TenantRequestFactory(self.tenant)
+        self.view = views.ListMetricProfilesForMetric.as_view()
+        self.url = '/api/v2/internal/metricprofilesformetric/'
+        self.user = CustUser.objects.create(username='testuser')
+
+        mp1 = poem_models.MetricProfiles.objects.create(
+            name='TEST_PROFILE',
+            apiid='00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+            groupname='EGI'
+        )
+        mp2 = poem_models.MetricProfiles.objects.create(
+            name='ANOTHER-PROFILE',
+            apiid='12341234-oooo-kkkk-aaaa-aaeekkccnnee'
+        )
+
+        poem_models.set_profile_metrics({
+            mp1: [
+                ('AMGA', 'org.nagios.SAML-SP'),
+                ('APEL', 'org.apel.APEL-Pub'),
+                ('ARC-CE', 'org.apel.APEL-Pub')
+            ],
+            mp2: [('APEL', 'org.apel.APEL-Pub')]
+        })
+
+    @patch('Poem.api.internal_views.metricprofiles.sync_webapi_if_stale')
+    def test_get_metric_profiles_for_metric(self, func):
+        func.side_effect = mocked_func
+        request = self.factory.get(self.url + 'org.apel.APEL-Pub')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'org.apel.APEL-Pub')
+        self.assertEqual(
+            list(response.data), ['ANOTHER-PROFILE', 'TEST_PROFILE']
+        )
+
+    @patch('Poem.api.internal_views.metricprofiles.sync_webapi_if_stale')
+    def test_get_metric_profiles_for_metric_not_in_profiles(self, func):
+        func.side_effect = mocked_func
+        request = self.factory.get(self.url + 'org.apel.APEL-Sync')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'org.apel.APEL-Sync')
+        self.assertEqual(list(response.data), [])
@@ -5,10 +5,12 @@ from unittest.mock import patch, call
 import requests
 from Poem.api import views_internal as views
 from Poem.api.internal_views.utils import inline_metric_for_db
+from Poem.helpers.webapi import WebAPIUnavailable
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
 from Poem.tenants.models import Tenant
 from Poem.users.models import CustUser
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core import serializers
 from django.test.client import encode_multipart
@@ -21,6 +23,17 @@ from .utils_test import mocked_func, encode_data, mocked_inline_metric_for_db, \
     MockResponse
 
 
+def mocked_metric_profiles(profiles):
+    return [
+        {
+            'id': name.lower(),
+            'name': name,
+            'description': '',
+            'services': [{'service': 'ARGO.AMS', 'metrics': metrics}]
+        } for name, metrics in profiles.items()
+    ]
+
+
 class ListAllMetricsAPIViewTests(TenantTestCase):
     def setUp(self):
         self.factory = TenantRequestFactory(self.tenant)
@@ -554,6 +567,32 @@ class ListMetricAPIViewTests(TenantTestCase):
         self.assertEqual(serialized_data['parameter'], metric.parameter)
         self.assertEqual(serialized_data['fileparameter'], metric.fileparameter)
 
+    def test_get_metric_list_keeps_order_of_tags(self):
+        self.metric1.tags.add(
+            admin_models.MetricTags.objects.create(name='a_tag')
+        )
+        request = self.factory.get(self.url)
+        force_authenticate(request, user=self.user)
+        response = self.view(request)
+        self.assertEqual(
+            response.data[0]['tags'], ['test_tag1', 'test_tag2', 'a_tag']
+        )
+
+    def test_get_metric_list_etag_changes_after_group_delete(self):
+        request = self.factory.get(self.url)
+        force_authenticate(request, user=self.user)
+        etag = self.view(request)['ETag']
+        poem_models.GroupOfMetrics.objects.get(name='EGI').delete()
+        request = self.factory.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, user=self.user)
+        response = self.view(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(
+            [metric['group'] for metric in
+             json.loads(b''.join(response.streaming_content))], ['', '']
+        )
+
     def test_delete_metric(self):
         self.assertEqual(poem_models.Metric.objects.all().count(), 2)
         request = self.factory.delete(self.url + 'org.apel.APEL-Pub')
@@ -1265,11 +1304,10 @@ class UpdateMetricsVersionsTests(TenantTestCase):
         response = self.view(request)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
-    @patch('Poem.api.internal_views.metrics.delete_metrics_from_profile')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
     @patch('Poem.api.internal_views.metrics.update_metrics')
-    def test_update_metrics_versions(self, mock_update, mock_delete):
+    def test_update_metrics_versions(self, mock_update, mock_put):
         mock_update.side_effect = mocked_func
-        mock_delete.side_effect = mocked_func
         data = {
             'name': self.package2.name,
             'version': self.package2.version
@@ -1280,7 +1318,7 @@ class UpdateMetricsVersionsTests(TenantTestCase):
         force_authenticate(request, user=self.user)
         response = self.view(request)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertFalse(mock_delete.called)
+        self.assertFalse(mock_put.called)
         self.assertEqual(mock_update.call_count, 2)
         mock_update.has_calls([
             call(self.mt1_history2, 'argo.AMS-Check', self.probehistory1),
@@ -1296,15 +1334,17 @@ class UpdateMetricsVersionsTests(TenantTestCase):
             }
         )
 
-    @patch('Poem.api.internal_views.metrics.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrics.get_metrics_in_profiles')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
     @patch('Poem.api.internal_views.metrics.update_metrics')
     def test_update_metrics_version_if_metric_template_was_renamed(
-            self, mock_update, mock_get, mock_delete
+            self, mock_update, mock_get, mock_put
     ):
         mock_update.side_effect = mocked_func
-        mock_get.return_value = {'argo.AMS-Check ': ['PROFILE1']}
-        mock_delete.side_effect = mocked_func
+        mock_get.return_value = mocked_metric_profiles(
+            {'PROFILE1': ['argo.AMS-Check ']}
+        )
+        mock_put.side_effect = mocked_func
         probe1 = admin_models.Probe.objects.create(
             name='ams-probe-new',
             package=self.package3,
@@ -1359,7 +1399,7 @@ class UpdateMetricsVersionsTests(TenantTestCase):
         force_authenticate(request, user=self.user)
         response = self.view(request)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertFalse(mock_delete.called)
+        self.assertFalse(mock_put.called)
         self.assertEqual(mock_update.call_count, 1)
         mock_update.has_calls([
             call(mt1_history3, 'argo.AMS-Check', self.probehistory1)
@@ -1374,18 +1414,18 @@ class UpdateMetricsVersionsTests(TenantTestCase):
             }
         )
 
-    @patch('Poem.api.internal_views.metrics.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrics.get_metrics_in_profiles')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
     @patch('Poem.api.internal_views.metrics.update_metrics')
     def test_metrics_deleted_if_their_probes_do_not_exist_in_new_package(
-            self, mock_update, mock_get, mock_delete
+            self, mock_update, mock_get, mock_put
     ):
         mock_update.side_effect = mocked_func
-        mock_get.return_value = {
-            'argo.AMSPublisher-Check': ['PROFILE1'],
-            'argo.AMS-Check': ['PROFILE1', 'PROFILE2']
-        }
-        mock_delete.side_effect = mocked_func
+        mock_get.return_value = mocked_metric_profiles({
+            'PROFILE1': ['argo.AMSPublisher-Check', 'argo.AMS-Check'],
+            'PROFILE2': ['argo.AMS-Check']
+        })
+        mock_put.side_effect = mocked_func
         self.probe1.package = self.package3
         self.probe1.save()
         probehistory1 = admin_models.ProbeHistory.objects.create(
@@ -1440,8 +1480,10 @@ class UpdateMetricsVersionsTests(TenantTestCase):
                            'updated.'
             }
         )
-        mock_delete.assert_called_once_with(
-            'PROFILE1', ['argo.AMSPublisher-Check']
+        mock_get.assert_called_once_with(settings.WEBAPI_METRIC)
+        mock_put.assert_called_once_with(
+            settings.WEBAPI_METRIC, 'profile1',
+            mocked_metric_profiles({'PROFILE1': ['argo.AMS-Check']})[0]
         )
         self.assertEqual(mock_update.call_count, 1)
         mock_update.has_calls([
@@ -1473,18 +1515,18 @@ class UpdateMetricsVersionsTests(TenantTestCase):
             }
         )
 
-    @patch('Poem.api.internal_views.metrics.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrics.get_metrics_in_profiles')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
     @patch('Poem.api.internal_views.metrics.update_metrics')
     def test_metrics_with_update_warning_and_deletion(
-            self,  mock_update, mock_get, mock_delete
+            self,  mock_update, mock_get, mock_put
     ):
         mock_update.side_effect = mocked_func
-        mock_get.return_value = {
-            'argo.AMSPublisher-Check': ['PROFILE1', 'PROFILE2'],
-            'argo.AMS-Check': ['PROFILE1']
-        }
-        mock_delete.side_effect = mocked_func
+        mock_get.return_value = mocked_metric_profiles({
+            'PROFILE1': ['argo.AMSPublisher-Check', 'argo.AMS-Check'],
+            'PROFILE2': ['argo.AMSPublisher-Check']
+        })
+        mock_put.side_effect = mocked_func
         self.probe1.package = self.package3
         self.probe1.save()
         probehistory1 = admin_models.ProbeHistory.objects.create(
@@ -1566,21 +1608,27 @@ class UpdateMetricsVersionsTests(TenantTestCase):
         mock_update.has_calls([
             call(mt1_history3, 'argo.AMS-Check', self.probehistory1)
         ])
-        self.assertEqual(mock_delete.call_count, 2)
-        mock_delete.assert_has_calls([
-            call('PROFILE1', ['argo.AMSPublisher-Check']),
-            call('PROFILE2', ['argo.AMSPublisher-Check'])
+        mock_get.assert_called_once_with(settings.WEBAPI_METRIC)
+        self.assertEqual(mock_put.call_count, 2)
+        mock_put.assert_has_calls([
+            call(
+                settings.WEBAPI_METRIC, 'profile1',
+                mocked_metric_profiles({'PROFILE1': ['argo.AMS-Check']})[0]
+            ),
+            call(
+                settings.WEBAPI_METRIC, 'profile2',
+                dict(mocked_metric_profiles({'PROFILE2': []})[0], services=[])
+            )
         ])
 
-    @patch('Poem.api.internal_views.metrics.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrics.get_metrics_in_profiles')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
     @patch('Poem.api.internal_views.metrics.update_metrics')
     def test_metrics_with_update_warning_and_deletion_if_api_get_exception(
-            self,  mock_update, mock_get, mock_delete
+            self,  mock_update, mock_get, mock_put
     ):
         mock_update.side_effect = mocked_func
         mock_get.side_effect = Exception('Exception')
-        mock_delete.side_effect = mocked_func
         self.probe1.package = self.package3
         self.probe1.save()
         probehistory1 = admin_models.ProbeHistory.objects.create(
@@ -1665,21 +1713,20 @@ class UpdateMetricsVersionsTests(TenantTestCase):
         mock_update.has_calls([
             call(mt1_history3, 'argo.AMS-Check', self.probehistory1)
         ])
-        mock_get.assert_called_once_with(self.tenant.schema_name)
-        self.assertFalse(mock_delete.called)
+        mock_get.assert_called_once_with(settings.WEBAPI_METRIC)
+        self.assertFalse(mock_put.called)
 
-    @patch('Poem.api.internal_views.metrics.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrics.get_metrics_in_profiles')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
     @patch('Poem.api.internal_views.metrics.update_metrics')
     def test_metrics_with_update_warning_and_deletion_if_api_put_exception(
-            self,  mock_update, mock_get, mock_delete
+            self,  mock_update, mock_get, mock_put
     ):
         mock_update.side_effect = mocked_func
-        mock_get.return_value = {
-            'argo.AMSPublisher-Check': ['PROFILE1'],
-            'argo.AMS-Check': ['PROFILE1']
-        }
-        mock_delete.side_effect = Exception('Exception')
+        mock_get.return_value = mocked_metric_profiles({
+            'PROFILE1': ['argo.AMSPublisher-Check', 'argo.AMS-Check']
+        })
+        mock_put.side_effect = Exception('Exception')
         self.probe1.package = self.package3
         self.probe1.save()
         probehistory1 = admin_models.ProbeHistory.objects.create(
@@ -1764,9 +1811,10 @@ class UpdateMetricsVersionsTests(TenantTestCase):
         mock_update.has_calls([
             call(mt1_history3, 'argo.AMS-Check', self.probehistory1)
         ])
-        mock_get.assert_called_once_with(self.tenant.schema_name)
-        mock_delete.assert_called_once_with(
-            'PROFILE1', ['argo.AMSPublisher-Check']
+        mock_get.assert_called_once_with(settings.WEBAPI_METRIC)
+        mock_put.assert_called_once_with(
+            settings.WEBAPI_METRIC, 'profile1',
+            mocked_metric_profiles({'PROFILE1': ['argo.AMS-Check']})[0]
         )
 
     @patch('Poem.api.internal_views.metrics.update_metrics')
@@ -2130,3 +2178,22 @@ class UpdateMetricsVersionsTests(TenantTestCase):
         )
         mock_get.assert_called_once()
         self.assertFalse(mock_update.called)
+
+    @patch('Poem.api.internal_views.metrics.get_metrics_in_profiles')
+    @patch('Poem.api.internal_views.metrics.update_metrics')
+    def test_update_metrics_if_webapi_unavailable_dry_run(
+            self, mock_update, mock_get
+    ):
+        mock_update.side_effect = mocked_func
+        mock_get.side_effect = WebAPIUnavailable()
+        request = self.factory.get(self.url + 'nagios-plugins-argo-0.1.8')
+        request.tenant = self.tenant
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'nagios-plugins-argo-0.1.8')
+        self.assertEqual(
+            response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertEqual(
+            response.data['detail'], 'WEB-API is currently unavailable.'
+        )
+        self.assertFalse(mock_update.called)
@@ -4,12 +4,14 @@ from unittest.mock import patch, call
 
 import requests
 from Poem.api import views_internal as views
+from Poem.api.models import MyAPIKey
 from Poem.helpers.history_helpers import create_comment
 from Poem.helpers.versioned_comments import new_comment
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
 from Poem.tenants.models import Tenant
 from Poem.users.models import CustUser
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core import serializers
 from rest_framework import status
@@ -21,6 +23,36 @@ from tenant_schemas.utils import get_public_schema_name, schema_context
 from .utils_test import mocked_inline_metric_for_db, mocked_func, encode_data
 
 
+mock_metric_profiles = [
+    {
+        'id': '11111111-2222-3333-4444-555555555555',
+        'name': 'PROFILE1',
+        'description': 'First profile',
+        'services': [
+            {
+                'service': 'ARGO.AMS',
+                'metrics': ['test.AMS-Check', 'argo.AMSPublisher-Check']
+            }
+        ]
+    },
+    {
+        'id': '66666666-7777-8888-9999-000000000000',
+        'name': 'PROFILE2',
+        'description': 'Second profile',
+        'services': [
+            {
+                'service': 'ARGO.AMS',
+                'metrics': ['test.AMS-Check']
+            },
+            {
+                'service': 'eu.argo.ams',
+                'metrics': ['argo.AMS-Check']
+            }
+        ]
+    }
+]
+
+
 class ListMetricTemplatesAPIViewTests(TenantTestCase):
     def setUp(self):
         self.factory = TenantRequestFactory(self.tenant)
@@ -2626,12 +2658,11 @@ class BulkDeleteMetricTemplatesTests(TenantTestCase):
             user=self.user.username
         )
 
-    @patch(
-        'Poem.api.internal_views.metrictemplates.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrictemplates.get_metrics_in_profiles')
-    def test_bulk_delete_metric_templates(self, mock_get, mock_delete):
-        mock_get.return_value = {'test.AMS-Check': ['PROFILE1', 'PROFILE2']}
-        mock_delete.side_effect = mocked_func
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
+    def test_bulk_delete_metric_templates(self, mock_get, mock_put):
+        mock_get.return_value = mock_metric_profiles
+        mock_put.side_effect = mocked_func
         data = {
             'metrictemplates': ['argo.AMS-Check', 'test.AMS-Check']
         }
@@ -2669,18 +2700,42 @@ class BulkDeleteMetricTemplatesTests(TenantTestCase):
             len(poem_models.TenantHistory.objects.filter(object_id=metric_id)),
             0
         )
-        self.assertEqual(mock_delete.call_count, 2)
-        mock_delete.assert_has_calls([
-            call('PROFILE1', ['test.AMS-Check']),
-            call('PROFILE2', ['test.AMS-Check'])
+        mock_get.assert_called_once_with(settings.WEBAPI_METRIC)
+        self.assertEqual(mock_put.call_count, 2)
+        mock_put.assert_has_calls([
+            call(
+                settings.WEBAPI_METRIC, mock_metric_profiles[0]['id'], {
+                    'id': mock_metric_profiles[0]['id'],
+                    'name': 'PROFILE1',
+                    'description': 'First profile',
+                    'services': [
+                        {
+                            'service': 'ARGO.AMS',
+                            'metrics': ['argo.AMSPublisher-Check']
+                        }
+                    ]
+                }
+            ),
+            call(
+                settings.WEBAPI_METRIC, mock_metric_profiles[1]['id'], {
+                    'id': mock_metric_profiles[1]['id'],
+                    'name': 'PROFILE2',
+                    'description': 'Second profile',
+                    'services': [
+                        {
+                            'service': 'eu.argo.ams',
+                            'metrics': ['argo.AMS-Check']
+                        }
+                    ]
+                }
+            )
         ])
 
-    @patch(
-        'Poem.api.internal_views.metrictemplates.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrictemplates.get_metrics_in_profiles')
-    def test_bulk_delete_one_metric_templates(self, mock_get, mock_delete):
-        mock_get.return_value = {'test.AMS-Check': ['PROFILE1', 'PROFILE2']}
-        mock_delete.side_effect = mocked_func
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
+    def test_bulk_delete_one_metric_templates(self, mock_get, mock_put):
+        mock_get.return_value = mock_metric_profiles
+        mock_put.side_effect = mocked_func
         data = {'metrictemplates': ['test.AMS-Check']}
         assert self.metric
         metric_id = self.metric.id
@@ -2708,22 +2763,43 @@ class BulkDeleteMetricTemplatesTests(TenantTestCase):
             len(poem_models.TenantHistory.objects.filter(object_id=metric_id)),
             0
         )
-        self.assertEqual(mock_delete.call_count, 2)
-        mock_delete.assert_has_calls([
-            call('PROFILE1', ['test.AMS-Check']),
-            call('PROFILE2', ['test.AMS-Check'])
+        mock_get.assert_called_once_with(settings.WEBAPI_METRIC)
+        self.assertEqual(mock_put.call_count, 2)
+        mock_put.assert_has_calls([
+            call(
+                settings.WEBAPI_METRIC, mock_metric_profiles[0]['id'], {
+                    'id': mock_metric_profiles[0]['id'],
+                    'name': 'PROFILE1',
+                    'description': 'First profile',
+                    'services': [
+                        {
+                            'service': 'ARGO.AMS',
+                            'metrics': ['argo.AMSPublisher-Check']
+                        }
+                    ]
+                }
+            ),
+            call(
+                settings.WEBAPI_METRIC, mock_metric_profiles[1]['id'], {
+                    'id': mock_metric_profiles[1]['id'],
+                    'name': 'PROFILE2',
+                    'description': 'Second profile',
+                    'services': [
+                        {
+                            'service': 'eu.argo.ams',
+                            'metrics': ['argo.AMS-Check']
+                        }
+                    ]
+                }
+            )
         ])
 
-    @patch(
-        'Poem.api.internal_views.metrictemplates.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrictemplates.get_metrics_in_profiles')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
     def test_bulk_delete_metric_templates_if_get_exception(
-            self, mock_get, mock_delete
+            self, mock_get, mock_put
     ):
-        mock_get.side_effect = Exception(
-            'Error fetching WEB API data: API key not found'
-        )
-        mock_delete.side_effect = mocked_func
+        mock_get.side_effect = MyAPIKey.DoesNotExist
         data = {
             'metrictemplates': ['argo.AMS-Check', 'test.AMS-Check']
         }
@@ -2737,7 +2813,7 @@ class BulkDeleteMetricTemplatesTests(TenantTestCase):
                         "successfully deleted.",
                 "warning": "test: Metrics are not removed from metric "
                            "profiles. Unable to get metric profiles: "
-                           "Error fetching WEB API data: API key not found"
+                           "Error fetching WEB API data: API key not found."
             }
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -2747,14 +2823,12 @@ class BulkDeleteMetricTemplatesTests(TenantTestCase):
         )
         assert self.metric, metric_history
 
-    @patch(
-        'Poem.api.internal_views.metrictemplates.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrictemplates.get_metrics_in_profiles')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
     def test_bulk_delete_metric_templates_if_get_requests_exception(
-            self, mock_get, mock_delete
+            self, mock_get, mock_put
     ):
         mock_get.side_effect = requests.exceptions.HTTPError('Exception')
-        mock_delete.side_effect = mocked_func
         data = {
             'metrictemplates': ['argo.AMS-Check', 'test.AMS-Check']
         }
@@ -2776,15 +2850,14 @@ class BulkDeleteMetricTemplatesTests(TenantTestCase):
         )
         assert self.metric, metric_history
 
-    @patch(
-        'Poem.api.internal_views.metrictemplates.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrictemplates.get_metrics_in_profiles')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
     def test_bulk_delete_metric_templates_if_delete_profile_exception(
-            self, mock_get, mock_delete
+            self, mock_get, mock_put
     ):
-        mock_get.return_value = {'test.AMS-Check': ['PROFILE1', 'PROFILE2']}
-        mock_delete.side_effect = Exception(
-            'Error deleting metric from profile: Something went wrong'
+        mock_get.return_value = mock_metric_profiles
+        mock_put.side_effect = requests.exceptions.HTTPError(
+            '500 Server Error: Something went wrong'
         )
         data = {
             'metrictemplates': ['argo.AMS-Check', 'test.AMS-Check']
@@ -2799,11 +2872,11 @@ class BulkDeleteMetricTemplatesTests(TenantTestCase):
                 "info": "Metric templates argo.AMS-Check, test.AMS-Check "
                         "successfully deleted.",
                 "warning": "test: Metric test.AMS-Check not deleted "
-                           "from profile PROFILE1: Error deleting metric from "
-                           "profile: Something went wrong; "
+                           "from profile PROFILE1: 500 Server Error: "
+                           "Something went wrong; "
                            "test: Metric test.AMS-Check not deleted from "
-                           "profile PROFILE2: Error deleting metric from "
-                           "profile: Something went wrong"
+                           "profile PROFILE2: 500 Server Error: "
+                           "Something went wrong"
             }
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -2826,20 +2899,55 @@ class BulkDeleteMetricTemplatesTests(TenantTestCase):
             len(poem_models.TenantHistory.objects.filter(object_id=metric_id)),
             0
         )
-        self.assertEqual(mock_delete.call_count, 2)
-        mock_delete.assert_has_calls([
-            call('PROFILE1', ['test.AMS-Check']),
-            call('PROFILE2', ['test.AMS-Check'])
+        mock_get.assert_called_once_with(settings.WEBAPI_METRIC)
+        self.assertEqual(mock_put.call_count, 2)
+        mock_put.assert_has_calls([
+            call(
+                settings.WEBAPI_METRIC, mock_metric_profiles[0]['id'], {
+                    'id': mock_metric_profiles[0]['id'],
+                    'name': 'PROFILE1',
+                    'description': 'First profile',
+                    'services': [
+                        {
+                            'service': 'ARGO.AMS',
+                            'metrics': ['argo.AMSPublisher-Check']
+                        }
+                    ]
+                }
+            ),
+            call(
+                settings.WEBAPI_METRIC, mock_metric_profiles[1]['id'], {
+                    'id': mock_metric_profiles[1]['id'],
+                    'name': 'PROFILE2',
+                    'description': 'Second profile',
+                    'services': [
+                        {
+                            'service': 'eu.argo.ams',
+                            'metrics': ['argo.AMS-Check']
+                        }
+                    ]
+                }
+            )
         ])
 
-    @patch(
-        'Poem.api.internal_views.metrictemplates.delete_metrics_from_profile')
-    @patch('Poem.api.internal_views.metrictemplates.get_metrics_in_profiles')
+    @patch('Poem.helpers.metrics_helpers.webapi.put_data')
+    @patch('Poem.helpers.metrics_helpers.webapi.get_data')
     def test_bulk_delete_metric_templates_if_metric_not_in_profile(
-            self, mock_get, mock_delete
+            self, mock_get, mock_put
     ):
-        mock_get.return_value = {}
-        mock_delete.side_effect = mocked_func
+        mock_get.return_value = [
+            {
+                'id': '11111111-2222-3333-4444-555555555555',
+                'name': 'PROFILE1',
+                'description': 'First profile',
+                'services': [
+                    {
+                        'service': 'ARGO.AMS',
+                        'metrics': ['argo.AMSPublisher-Check']
+                    }
+                ]
+            }
+        ]
         data = {
             'metrictemplates': ['argo.AMS-Check', 'test.AMS-Check']
         }
@@ -2874,7 +2982,7 @@ class BulkDeleteMetricTemplatesTests(TenantTestCase):
             len(poem_models.TenantHistory.objects.filter(object_id=metric_id)),
             0
         )
-        self.assertFalse(mock_delete.called)
+        self.assertFalse(mock_put.called)
 
 
 class MetricTagsTests(TenantTestCase):
@@ -591,6 +591,130 @@ class ListTenantVersionsAPIViewTests(TenantTestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.data, {'detail': 'Version not found.'})
 
+    def test_get_current_metric_version(self):
+        request = self.factory.get(
+            self.url + 'metric/argo.AMS-Check-new/current'
+        )
+        force_authenticate(request, user=self.user)
+        response = self.view(
+            request, 'metric', 'argo.AMS-Check-new', current=True
+        )
+        request = self.factory.get(self.url + 'metric/argo.AMS-Check-new')
+        force_authenticate(request, user=self.user)
+        versions = self.view(request, 'metric', 'argo.AMS-Check-new')
+        self.assertEqual(response.data['id'], self.ver2.id)
+        self.assertEqual(response.data, versions.data[0])
+
+    def test_get_current_metric_version_without_history_head(self):
+        poem_models.TenantHistoryHead.objects.all().delete()
+        request = self.factory.get(
+            self.url + 'metric/argo.AMS-Check-new/current'
+        )
+        force_authenticate(request, user=self.user)
+        response = self.view(
+            request, 'metric', 'argo.AMS-Check-new', current=True
+        )
+        self.assertEqual(response.data['id'], self.ver2.id)
+
+    def test_get_versions_of_metric_with_archived_versions(self):
+        request = self.factory.get(self.url + 'metric/argo.AMS-Check-new')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metric', 'argo.AMS-Check-new')
+        self.assertNotIn('X-Archived-Versions', response)
+        ct = ContentType.objects.get_for_model(poem_models.Metric)
+        self.assertEqual(
+            poem_models.archive_history(ct.id, self.metric1.id, 1), 1
+        )
+        request = self.factory.get(self.url + 'metric/argo.AMS-Check-new')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metric', 'argo.AMS-Check-new')
+        self.assertEqual(
+            [ver['id'] for ver in response.data], [self.ver2.id]
+        )
+        self.assertEqual(response['X-Archived-Versions'], '1')
+        self.assertEqual(
+            response['X-Archived-Until'],
+            datetime.datetime.strftime(
+                self.ver1.date_created, '%Y-%m-%d %H:%M:%S'
+            )
+        )
+
+    def test_get_versions_of_metric_paginated(self):
+        request = self.factory.get(self.url + 'metric/argo.AMS-Check-new')
+        force_authenticate(request, user=self.user)
+        data = self.view(request, 'metric', 'argo.AMS-Check-new').data
+        request = self.factory.get(
+            self.url + 'metric/argo.AMS-Check-new', {'limit': 1}
+        )
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metric', 'argo.AMS-Check-new')
+        self.assertEqual(response.data, data[:1])
+        cursor = response['X-Next-Cursor']
+        self.assertEqual(
+            response['Link'],
+            '<http://{}{}metric/argo.AMS-Check-new?limit=1&cursor={}>; '
+            'rel="next"'.format(self.tenant.domain_url, self.url, cursor)
+        )
+        request = self.factory.get(
+            self.url + 'metric/argo.AMS-Check-new',
+            {'limit': 1, 'cursor': cursor}
+        )
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metric', 'argo.AMS-Check-new')
+        self.assertEqual(response.data, data[1:])
+        self.assertNotIn('X-Next-Cursor', response)
+
+    def test_get_versions_of_metric_summary(self):
+        request = self.factory.get(self.url + 'metric/argo.AMS-Check-new')
+        force_authenticate(request, user=self.user)
+        data = self.view(request, 'metric', 'argo.AMS-Check-new').data
+        for ver in data:
+            del ver['fields']
+        request = self.factory.get(
+            self.url + 'metric/argo.AMS-Check-new', {'summary': 'true'}
+        )
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metric', 'argo.AMS-Check-new')
+        self.assertEqual(response.data, data)
+
+    def test_get_versions_of_metric_with_invalid_cursor(self):
+        request = self.factory.get(
+            self.url + 'metric/argo.AMS-Check-new',
+            {'limit': 1, 'cursor': 'WyJhIl0'}
+        )
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metric', 'argo.AMS-Check-new')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'detail': 'Invalid cursor.'})
+
+    def test_metric_version_comments_rendered_when_saved(self):
+        request = self.factory.get(self.url + 'metric/argo.AMS-Check-new')
+        force_authenticate(request, user=self.user)
+        data = self.view(request, 'metric', 'argo.AMS-Check-new').data
+        self.assertEqual(
+            [ver['comment'] for ver in data],
+            [
+                poem_models.TenantHistory.objects.get(
+                    id=ver['id']
+                ).rendered_comment for ver in data
+            ]
+        )
+        # versions saved bypassing the model have their comments rendered
+        # when listed
+        poem_models.TenantHistory.objects.update(rendered_comment='')
+        request = self.factory.get(self.url + 'metric/argo.AMS-Check-new')
+        force_authenticate(request, user=self.user)
+        self.assertEqual(
+            self.view(request, 'metric', 'argo.AMS-Check-new').data, data
+        )
+
+    def test_get_nonexisting_current_metric_version(self):
+        request = self.factory.get(self.url + 'metric/test.AMS-Check/current')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metric', 'test.AMS-Check', current=True)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data, {'detail': 'Version not found.'})
+
     def test_get_nonexisting_metric(self):
         request = self.factory.get(self.url + 'metric/nonexisting')
         force_authenticate(request, user=self.user)
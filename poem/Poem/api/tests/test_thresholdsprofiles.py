@@ -3,6 +3,7 @@ from collections import OrderedDict
 from unittest.mock import patch
 
 from Poem.api import views_internal as views
+from Poem.helpers.history_helpers import create_profile_history
 from Poem.poem import models as poem_models
 from Poem.users.models import CustUser
 from django.contrib.contenttypes.models import ContentType
@@ -91,7 +92,7 @@ class ListThresholdsProfilesAPIViewTests(TenantTestCase):
             content_type=self.ct
         )
 
-    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi')
+    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi_if_stale')
     def test_get_all_thresholds_profiles(self, func):
         func.side_effect = mocked_func
         request = self.factory.get(self.url)
@@ -115,14 +116,14 @@ class ListThresholdsProfilesAPIViewTests(TenantTestCase):
             ]
         )
 
-    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi')
+    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi_if_stale')
     def test_get_thresholds_profiles_if_no_authentication(self, func):
         func.side_effect = mocked_func
         request = self.factory.get(self.url)
         response = self.view(request)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
-    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi')
+    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi_if_stale')
     def test_get_thresholds_profile_by_name(self, func):
         func.side_effect = mocked_func
         request = self.factory.get(self.url + 'TEST_PROFILE')
@@ -138,7 +139,7 @@ class ListThresholdsProfilesAPIViewTests(TenantTestCase):
             ])
         )
 
-    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi')
+    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi_if_stale')
     def test_get_thresholds_profile_by_nonexisting_name(self, func):
         func.side_effect = mocked_func
         request = self.factory.get(self.url + 'nonexisting')
@@ -367,3 +368,64 @@ class ListThresholdsProfilesAPIViewTests(TenantTestCase):
         self.assertEqual(
             response.data, {'detail': 'Thresholds profile not specified!'}
         )
+
+
+class ListThresholdsProfilesForMetricAPIViewTests(TenantTestCase):
+    def setUp(self):
+        self.factory = TenantRequestFactory(self.tenant)
+        self.view = views.ListThresholdsProfilesForMetric.as_view()
+        self.url = '/api/v2/internal/thresholdsprofilesformetric/'
+        self.user = CustUser.objects.create(username='testuser')
+
+        self.tp1 = poem_models.ThresholdsProfiles.objects.create(
+            name='TEST_PROFILE',
+            apiid='00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+            groupname='GROUP'
+        )
+        tp2 = poem_models.ThresholdsProfiles.objects.create(
+            name='ANOTHER_PROFILE',
+            apiid='12341234-oooo-kkkk-aaaa-aaeekkccnnee',
+        )
+
+        poem_models.set_thresholds_rules({
+            self.tp1: [
+                ('hostFoo', '', 'metricA', 'freshness=1s;10;9:;0;25'),
+                ('hostBar', '', 'metricA', 'entries=1;3;0:2;10')
+            ],
+            tp2: [('', 'SITE', 'metricB', 'freshness=1s;10;9:;0;25')]
+        })
+
+    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi_if_stale')
+    def test_get_thresholds_profiles_for_metric(self, func):
+        func.side_effect = mocked_func
+        request = self.factory.get(self.url + 'metricA')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metricA')
+        self.assertEqual(list(response.data), ['TEST_PROFILE'])
+
+    @patch('Poem.api.internal_views.thresholdsprofiles.sync_webapi_if_stale')
+    def test_get_thresholds_profiles_for_metric_without_rules(self, func):
+        func.side_effect = mocked_func
+        request = self.factory.get(self.url + 'metricC')
+        force_authenticate(request, user=self.user)
+        response = self.view(request, 'metricC')
+        self.assertEqual(list(response.data), [])
+
+    def test_thresholds_rules_are_saved_with_history(self):
+        create_profile_history(self.tp1, {
+            'rules': json.dumps([
+                {
+                    'host': 'newHost',
+                    'metric': 'newMetric',
+                    'thresholds': 'entries=1;3;0:2;10'
+                }
+            ])
+        }, 'testuser')
+        self.assertEqual(
+            poem_models.get_thresholds_rules([self.tp1.id]),
+            {
+                self.tp1.id: {
+                    ('newHost', '', 'newMetric', 'entries=1;3;0:2;10')
+                }
+            }
+        )
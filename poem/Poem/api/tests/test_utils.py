@@ -1,16 +1,21 @@
 import datetime
 import json
+import threading
+import time
 from unittest.mock import patch
 
+from Poem.api.internal_views import utils
 from Poem.api.internal_views.utils import sync_webapi, \
-    get_tenant_resources
+    sync_webapi_if_stale, get_tenant_resources
 from Poem.api.models import MyAPIKey
 from Poem.helpers.history_helpers import create_comment
+from Poem.helpers.webapi import WebAPIUnavailable
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
 from Poem.users.models import CustUser
 from django.contrib.contenttypes.models import ContentType
 from django.core import serializers
+from django.db import connection, transaction
 from tenant_schemas.test.cases import TenantTestCase
 from tenant_schemas.utils import get_public_schema_name
 
@@ -109,7 +114,7 @@ class SyncWebApiTests(TenantTestCase):
             groupname='EGI'
         )
 
-    @patch('requests.get')
+    @patch('Poem.helpers.webapi.requests.Session.get')
     def test_sync_webapi_metricprofiles(self, func):
         func.side_effect = mocked_web_api_request
         self.assertEqual(poem_models.MetricProfiles.objects.all().count(), 2)
@@ -146,8 +151,14 @@ class SyncWebApiTests(TenantTestCase):
             serialized_data['metricinstances'],
             [['dg.3GBridge', 'eu.egi.cloud.Swift-CRUD']]
         )
+        self.assertEqual(
+            list(poem_models.MetricProfileMetric.objects.filter(
+                profile__name='NEW_PROFILE'
+            ).values_list('service', 'metric')),
+            [('dg.3GBridge', 'eu.egi.cloud.Swift-CRUD')]
+        )
 
-    @patch('requests.get')
+    @patch('Poem.helpers.webapi.requests.Session.get')
     def test_sync_webapi_aggregationprofiles(self, func):
         func.side_effect = mocked_web_api_request
         self.assertEqual(poem_models.Aggregation.objects.all().count(), 2)
@@ -162,8 +173,15 @@ class SyncWebApiTests(TenantTestCase):
             name='ANOTHER-PROFILE'
         )
         self.assertTrue(poem_models.Aggregation.objects.get(name='NEW_PROFILE'))
+        self.assertEqual(
+            poem_models.get_aggregation_contents(),
+            dict(
+                (aggr.id, ('TEST_PROFILE', set()))
+                for aggr in poem_models.Aggregation.objects.all()
+            )
+        )
 
-    @patch('requests.get')
+    @patch('Poem.helpers.webapi.requests.Session.get')
     def test_sync_webapi_thresholdsprofile(self, func):
         func.side_effect = mocked_web_api_request
         self.assertEqual(
@@ -182,6 +200,351 @@ class SyncWebApiTests(TenantTestCase):
             poem_models.ThresholdsProfiles.objects.get,
             name='ANOTHER-PROFILE'
         )
+        new = poem_models.ThresholdsProfiles.objects.get(name='NEW_PROFILE')
+        self.assertEqual(
+            poem_models.get_thresholds_rules(),
+            {
+                self.tp1.id: {
+                    ('', '', 'httpd.ResponseTime',
+                     'response=20ms;0:300;299:1000'),
+                    ('webserver01.example.foo', '', 'httpd.ResponseTime',
+                     'response=20ms;0:200;199:300'),
+                    ('', 'TEST-SITE-51', 'httpd.ResponseTime',
+                     'response=20ms;0:500;499:1000')
+                },
+                new.id: {
+                    ('', '', 'httpd.ResponseTime',
+                     'response=20ms;0:300;299:1000')
+                }
+            }
+        )
+
+
+
+    @patch('Poem.api.internal_views.utils.webapi.get_data')
+    def test_sync_webapi_updates_only_changed_profiles(self, mock_data):
+        mock_data.return_value = [
+            {
+                'id': '00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+                'name': 'TEST_PROFILE',
+                'services': []
+            },
+            {
+                'id': '12341234-oooo-kkkk-aaaa-aaeekkccnnee',
+                'name': 'RENAMED-PROFILE',
+                'description': 'Renamed profile',
+                'services': []
+            }
+        ]
+        with patch.object(
+                poem_models.MetricProfiles.objects, 'bulk_update',
+                wraps=poem_models.MetricProfiles.objects.bulk_update
+        ) as mock_update:
+            sync_webapi('metric_profiles', poem_models.MetricProfiles)
+            mock_update.assert_called_once_with(
+                [self.mp2], ['name', 'description']
+            )
+            sync_webapi('metric_profiles', poem_models.MetricProfiles)
+            mock_update.assert_called_once()
+        mp2 = poem_models.MetricProfiles.objects.get(id=self.mp2.id)
+        self.assertEqual(mp2.name, 'RENAMED-PROFILE')
+        self.assertEqual(mp2.description, 'Renamed profile')
+        self.assertEqual(poem_models.MetricProfiles.objects.count(), 2)
+
+    @patch('Poem.api.internal_views.utils.webapi.get_data')
+    def test_sync_webapi_updates_profile_metrics(self, mock_data):
+        profile = {
+            'id': '00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+            'name': 'TEST_PROFILE',
+            'services': [
+                {'service': 'AMGA', 'metrics': ['org.nagios.SAML-SP']}
+            ]
+        }
+        mock_data.return_value = [profile]
+        sync_webapi('metric_profiles', poem_models.MetricProfiles)
+        self.assertEqual(
+            poem_models.get_profile_metrics(),
+            {self.mp1.id: {('AMGA', 'org.nagios.SAML-SP')}}
+        )
+        profile['services'].append(
+            {'service': 'APEL', 'metrics': ['org.apel.APEL-Pub']}
+        )
+        with patch(
+                'Poem.api.internal_views.utils.poem_models.set_profile_metrics',
+                wraps=poem_models.set_profile_metrics
+        ) as mock_set:
+            sync_webapi('metric_profiles', poem_models.MetricProfiles)
+            sync_webapi('metric_profiles', poem_models.MetricProfiles)
+            mock_set.assert_called_once()
+        self.assertEqual(
+            poem_models.get_profile_metrics(),
+            {
+                self.mp1.id: {
+                    ('AMGA', 'org.nagios.SAML-SP'),
+                    ('APEL', 'org.apel.APEL-Pub')
+                }
+            }
+        )
+
+    @patch('Poem.api.internal_views.utils.webapi.get_data')
+    def test_sync_webapi_skips_empty_profile_metrics(self, mock_data):
+        mock_data.return_value = [{
+            'id': '00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+            'name': 'TEST_PROFILE',
+            'services': []
+        }]
+        with patch(
+                'Poem.api.internal_views.utils.poem_models.set_profile_metrics',
+                wraps=poem_models.set_profile_metrics
+        ) as mock_set:
+            sync_webapi('metric_profiles', poem_models.MetricProfiles)
+            self.assertFalse(mock_set.called)
+        self.assertEqual(poem_models.get_profile_metrics(), {})
+
+    @patch('Poem.api.internal_views.utils.create_profile_history')
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_sync_webapi_is_atomic(self, mock_get, mock_history):
+        mock_get.side_effect = mocked_web_api_request
+        mock_history.side_effect = Exception('History error')
+        with self.assertRaises(Exception):
+            sync_webapi('metric_profiles', poem_models.MetricProfiles)
+        self.assertEqual(
+            sorted(poem_models.MetricProfiles.objects.values_list(
+                'name', flat=True
+            )), ['ANOTHER-PROFILE', 'TEST_PROFILE']
+        )
+        self.assertEqual(
+            poem_models.TenantHistory.objects.filter(
+                object_id=self.mp2.id
+            ).count(), 1
+        )
+
+@patch('Poem.api.internal_views.utils.threading.Thread')
+@patch('Poem.api.internal_views.utils.sync_webapi')
+class SyncWebApiIfStaleTests(TenantTestCase):
+    def setUp(self):
+        utils.clear_sync_cache()
+
+    def tearDown(self):
+        utils.clear_sync_cache()
+
+    def test_sync_if_cold(self, mock_sync, mock_thread):
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        mock_sync.assert_called_once_with(
+            'metric_profiles', poem_models.MetricProfiles
+        )
+        self.assertFalse(mock_thread.called)
+
+    def test_do_not_sync_if_fresh(self, mock_sync, mock_thread):
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        self.assertEqual(mock_sync.call_count, 1)
+        self.assertFalse(mock_thread.called)
+        sync_webapi_if_stale('aggregation_profiles', poem_models.Aggregation)
+        self.assertEqual(mock_sync.call_count, 2)
+
+    @patch('Poem.api.internal_views.utils.time.monotonic')
+    def test_refresh_in_background_if_stale(
+            self, mock_time, mock_sync, mock_thread
+    ):
+        mock_time.return_value = 1000.
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        mock_time.return_value = 1000. + utils.SYNC_FRESH
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        self.assertEqual(mock_sync.call_count, 1)
+        mock_thread.assert_called_once_with(
+            target=utils._refresh_webapi,
+            args=('test', 'metric_profiles', poem_models.MetricProfiles),
+            daemon=True
+        )
+        mock_thread.return_value.start.assert_called_once()
+
+    @patch('Poem.api.internal_views.utils.connection.close')
+    @patch('Poem.api.internal_views.utils.time.monotonic')
+    def test_background_refresh_marks_fresh(
+            self, mock_time, mock_close, mock_sync, mock_thread
+    ):
+        mock_time.return_value = 1000.
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        mock_time.return_value = 1000. + utils.SYNC_FRESH
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        utils._refresh_webapi(
+            'test', 'metric_profiles', poem_models.MetricProfiles
+        )
+        self.assertEqual(mock_sync.call_count, 2)
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        self.assertEqual(mock_sync.call_count, 2)
+        self.assertEqual(mock_thread.call_count, 1)
+
+    @patch('Poem.api.internal_views.utils.logger')
+    @patch('Poem.api.internal_views.utils.connection.close')
+    @patch('Poem.api.internal_views.utils.time.monotonic')
+    def test_failed_background_refresh_is_retried(
+            self, mock_time, mock_close, mock_logger, mock_sync, mock_thread
+    ):
+        mock_time.return_value = 1000.
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        mock_time.return_value = 1000. + utils.SYNC_FRESH
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        mock_sync.side_effect = Exception('WEB-API unavailable')
+        utils._refresh_webapi(
+            'test', 'metric_profiles', poem_models.MetricProfiles
+        )
+        mock_logger.error.assert_called_once_with(
+            'TEST: Error syncing metric_profiles from WEB-API: '
+            'Exception(\'WEB-API unavailable\')'
+        )
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        self.assertEqual(mock_thread.call_count, 2)
+
+
+    def test_sync_if_cold_and_failed(self, mock_sync, mock_thread):
+        mock_sync.side_effect = WebAPIUnavailable()
+        self.assertRaises(
+            WebAPIUnavailable, sync_webapi_if_stale,
+            'metric_profiles', poem_models.MetricProfiles
+        )
+
+    @patch('Poem.api.internal_views.utils.logger')
+    def test_serve_synced_profiles_if_cold_and_failed(
+            self, mock_logger, mock_sync, mock_thread
+    ):
+        poem_models.MetricProfiles.objects.create(
+            name='TEST_PROFILE', apiid='00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+            groupname=''
+        )
+        mock_sync.side_effect = WebAPIUnavailable()
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        mock_logger.error.assert_called_once_with(
+            'TEST: Error syncing metric_profiles from WEB-API, serving '
+            'profiles last synced: WebAPIUnavailable()'
+        )
+
+        # sync is tried again
+        mock_sync.side_effect = None
+        sync_webapi_if_stale('metric_profiles', poem_models.MetricProfiles)
+        self.assertEqual(mock_sync.call_count, 2)
+        self.assertFalse(mock_thread.called)
+
+
+class SyncWebApiSingleFlightTests(TenantTestCase):
+    def setUp(self):
+        self.key = ('test', 'metric_profiles')
+        self.release = threading.Event()
+        self.results = []
+
+    def call(self):
+        try:
+            utils._sync_once(
+                self.key, 'metric_profiles', poem_models.MetricProfiles
+            )
+            self.results.append(None)
+
+        except Exception as e:
+            self.results.append(e)
+
+    def run_concurrently(self, n):
+        threads = [threading.Thread(target=self.call) for i in range(n)]
+        for thread in threads:
+            thread.start()
+
+        # let all the callers get to the sync
+        time.sleep(0.2)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+    @patch('Poem.api.internal_views.utils.sync_webapi')
+    def test_concurrent_syncs_are_done_once(self, mock_sync):
+        mock_sync.side_effect = lambda *args: self.release.wait()
+        self.run_concurrently(4)
+        mock_sync.assert_called_once_with(
+            'metric_profiles', poem_models.MetricProfiles
+        )
+        self.assertEqual(self.results, [None] * 4)
+        self.assertEqual(utils._syncing, {})
+
+    @patch('Poem.api.internal_views.utils.sync_webapi')
+    def test_concurrent_syncs_share_error(self, mock_sync):
+        error = WebAPIUnavailable()
+
+        def sync(*args):
+            self.release.wait()
+            raise error
+
+        mock_sync.side_effect = sync
+        self.run_concurrently(3)
+        self.assertEqual(mock_sync.call_count, 1)
+        self.assertEqual(self.results, [error] * 3)
+        # failed sync is not reused by the later callers
+        with self.assertRaises(WebAPIUnavailable):
+            utils._sync_once(
+                self.key, 'metric_profiles', poem_models.MetricProfiles
+            )
+        self.assertEqual(mock_sync.call_count, 2)
+
+    @patch('Poem.api.internal_views.utils.webapi.get_data')
+    def test_sync_waits_for_other_process(self, mock_data):
+        poem_models.MetricProfiles.objects.create(
+            name='TEST_PROFILE', apiid='00000000-oooo-kkkk-aaaa-aaeekkccnnee',
+            groupname=''
+        )
+        mock_data.return_value = []
+        locked = threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            'SELECT pg_advisory_xact_lock(%s)',
+                            [utils.sync_lock_id('test', 'metric_profiles')]
+                        )
+                    locked.set()
+                    time.sleep(0.3)
+
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait()
+        start = time.monotonic()
+        sync_webapi('metric_profiles', poem_models.MetricProfiles)
+        thread.join()
+        self.assertGreater(time.monotonic() - start, 0.1)
+        # profiles synced by the other process are used as they are
+        self.assertFalse(mock_data.called)
+        self.assertTrue(poem_models.MetricProfiles.objects.exists())
+        # lock is released
+        sync_webapi('metric_profiles', poem_models.MetricProfiles)
+        self.assertTrue(mock_data.called)
+        self.assertFalse(poem_models.MetricProfiles.objects.exists())
+
+    @patch('Poem.api.internal_views.utils.webapi.get_data')
+    def test_sync_releases_lock_on_error(self, mock_data):
+        mock_data.side_effect = WebAPIUnavailable()
+        self.assertRaises(
+            WebAPIUnavailable,
+            sync_webapi, 'metric_profiles', poem_models.MetricProfiles
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT count(*) FROM pg_locks WHERE locktype = %s AND '
+                'pid = pg_backend_pid()', ['advisory']
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_sync_lock_ids_differ(self):
+        self.assertNotEqual(
+            utils.sync_lock_id('test', 'metric_profiles'),
+            utils.sync_lock_id('test', 'aggregation_profiles')
+        )
+        self.assertNotEqual(
+            utils.sync_lock_id('test', 'metric_profiles'),
+            utils.sync_lock_id('test2', 'metric_profiles')
+        )
 
 
 class BasicResourceInfoTests(TenantTestCase):
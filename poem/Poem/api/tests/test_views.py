@@ -1,9 +1,12 @@
 import datetime
-from unittest.mock import patch, call
+import json
+from unittest.mock import patch
 
 import factory
 from Poem.api import views
+from Poem.api.internal_views import utils
 from Poem.api.models import MyAPIKey
+from Poem.helpers import webapi
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
 from django.db.models.signals import post_save
@@ -11,31 +14,30 @@ from rest_framework import status
 from tenant_schemas.test.cases import TenantTestCase
 from tenant_schemas.test.client import TenantRequestFactory
 
+from .utils_test import MockResponse
 
-def mock_function(profile):
-    if profile == 'ARGO-MON':
-        return {'argo.AMS-Check'}
 
-    if profile == 'MON-TEST':
-        return {
+def mock_function(profiles):
+    metrics = {
+        'ARGO-MON': {'argo.AMS-Check'},
+        'MON-TEST': {
             'argo.AMS-Check', 'eu.seadatanet.org.downloadmanager-check',
             'eu.seadatanet.org.nvs2-check'
-        }
-
-    if profile == 'MON-PASSIVE':
-        return {
+        },
+        'MON-PASSIVE': {
             'argo.AMS-Check', 'eu.seadatanet.org.downloadmanager-check',
             'eu.seadatanet.org.nvs2-check', 'org.apel.APEL-Pub'
-        }
+        },
+        'EMPTY': set(),
+        'TEST-NONEXISTING': {'nonexisting.metric'},
+        'TEST_PROMOO': {'eu.egi.cloud.OCCI-Categories'}
+    }
 
-    if profile == 'EMPTY':
-        return set()
+    ret = set()
+    for profile in profiles:
+        ret = ret.union(metrics[profile])
 
-    if profile == 'TEST-NONEXISTING':
-        return {'nonexisting.metric'}
-
-    if profile == 'TEST_PROMOO':
-        return {'eu.egi.cloud.OCCI-Categories'}
+    return ret
 
 
 @factory.django.mute_signals(post_save)
@@ -676,8 +678,9 @@ class ListMetricsAPIViewTests(TenantTestCase):
     def test_list_metrics(self):
         request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
         response = self.view(request)
+        self.assertEqual(response['Content-Type'], 'application/json')
         self.assertEqual(
-            response.data,
+            json.loads(response.content),
             [
                 {
                     'argo.AMSPublisher-Check': {
@@ -808,6 +811,164 @@ class ListMetricsAPIViewTests(TenantTestCase):
             ]
         )
 
+    def test_list_metrics_snapshot_is_reused(self):
+        self.assertEqual(poem_models.MetricConfigSnapshot.objects.count(), 0)
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        response1 = self.view(request)
+        self.assertEqual(poem_models.MetricConfigSnapshot.objects.count(), 1)
+        snapshot = poem_models.MetricConfigSnapshot.objects.first()
+        self.assertEqual(snapshot.data.encode(), response1.content)
+        with patch('Poem.api.views.build_metricconfigs') as mock_build:
+            request = self.factory.get(
+                self.url, **{'HTTP_X_API_KEY': self.token}
+            )
+            response2 = self.view(request)
+            self.assertFalse(mock_build.called)
+        self.assertEqual(response1.content, response2.content)
+
+    def test_list_metrics_snapshot_is_rebuilt_after_metric_change(self):
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        self.view(request)
+        self.assertEqual(poem_models.MetricConfigSnapshot.objects.count(), 1)
+        metric = poem_models.Metric.objects.get(name='test.EMPTY-metric')
+        metric.parent = json.dumps(['org.nagios.CDMI-TCP'])
+        metric.save()
+        self.assertEqual(
+            poem_models.MetricConfigSnapshot.objects.get().data, ''
+        )
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        response = self.view(request)
+        data = json.loads(response.content)
+        self.assertEqual(
+            data[-1]['test.EMPTY-metric']['parent'], 'org.nagios.CDMI-TCP'
+        )
+
+    def test_list_metrics_snapshot_changed_while_built_is_not_stored(self):
+        metric = poem_models.Metric.objects.get(name='test.EMPTY-metric')
+        build_metricconfigs = views.build_metricconfigs
+
+        def build():
+            data = build_metricconfigs()
+            metric.parent = json.dumps(['org.nagios.CDMI-TCP'])
+            metric.save()
+            return data
+
+        with patch('Poem.api.views.build_metricconfigs', side_effect=build):
+            request = self.factory.get(
+                self.url, **{'HTTP_X_API_KEY': self.token}
+            )
+            response = self.view(request)
+        data = json.loads(response.content)
+        self.assertEqual(data[-1]['test.EMPTY-metric']['parent'], '')
+        self.assertEqual(
+            poem_models.MetricConfigSnapshot.objects.get().data, ''
+        )
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        response = self.view(request)
+        data = json.loads(response.content)
+        self.assertEqual(
+            data[-1]['test.EMPTY-metric']['parent'], 'org.nagios.CDMI-TCP'
+        )
+
+    def test_list_metrics_snapshot_is_rebuilt_after_tags_change(self):
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        self.view(request)
+        metric = poem_models.Metric.objects.get(name='test.EMPTY-metric')
+        metric.tags.add(admin_models.MetricTags.objects.get(name='internal'))
+        self.assertEqual(
+            poem_models.MetricConfigSnapshot.objects.get().data, ''
+        )
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        response = self.view(request)
+        data = json.loads(response.content)
+        self.assertEqual(data[-1]['test.EMPTY-metric']['tags'], ['internal'])
+
+    def test_list_metrics_snapshot_is_rebuilt_after_probe_change(self):
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        self.view(request)
+        probekey = admin_models.ProbeHistory.objects.get(
+            name='CertLifetime-probe'
+        )
+        probekey.docurl = 'https://github.com/ARGOeu/nagios-plugins-cert'
+        probekey.save()
+        self.assertEqual(
+            poem_models.MetricConfigSnapshot.objects.get().data, ''
+        )
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        response = self.view(request)
+        data = json.loads(response.content)
+        self.assertEqual(
+            data[1]['hr.srce.CertLifetime-Local']['docurl'],
+            'https://github.com/ARGOeu/nagios-plugins-cert'
+        )
+
+    def test_list_metrics_etag(self):
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        response = self.view(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        with patch('Poem.api.views.get_metricconfigs') as mock_get:
+            request = self.factory.get(
+                self.url,
+                **{'HTTP_X_API_KEY': self.token, 'HTTP_IF_NONE_MATCH': etag}
+            )
+            response = self.view(request)
+            self.assertFalse(mock_get.called)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_list_metrics_etag_changes_after_metric_change(self):
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        response = self.view(request)
+        etag = response['ETag']
+        metric = poem_models.Metric.objects.get(name='test.EMPTY-metric')
+        metric.description = 'New description.'
+        metric.save()
+        request = self.factory.get(
+            self.url,
+            **{'HTTP_X_API_KEY': self.token, 'HTTP_IF_NONE_MATCH': etag}
+        )
+        response = self.view(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertTrue(response.content)
+
+    def test_list_metrics_etag_depends_on_tag(self):
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        response1 = self.view(request)
+        request = self.factory.get(
+            self.url + '/internal', **{'HTTP_X_API_KEY': self.token}
+        )
+        response2 = self.view(request, 'internal')
+        self.assertNotEqual(response1['ETag'], response2['ETag'])
+
+    def test_list_metrics_if_modified_since(self):
+        metric = poem_models.Metric.objects.get(name='test.EMPTY-metric')
+        metric.save()
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        response = self.view(request)
+        last_modified = response['Last-Modified']
+        request = self.factory.get(
+            self.url,
+            **{'HTTP_X_API_KEY': self.token,
+               'HTTP_IF_MODIFIED_SINCE': last_modified}
+        )
+        response = self.view(request)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_metrics_conditional_if_wrong_token(self):
+        request = self.factory.get(self.url, **{'HTTP_X_API_KEY': self.token})
+        etag = self.view(request)['ETag']
+        request = self.factory.get(
+            self.url,
+            **{'HTTP_X_API_KEY': 'wrong_token', 'HTTP_IF_NONE_MATCH': etag}
+        )
+        response = self.view(request)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_get_internal_metrics(self):
         request = self.factory.get(
             self.url + '/internal', **{'HTTP_X_API_KEY': self.token}
@@ -842,6 +1003,8 @@ class ListReposAPIViewTests(TenantTestCase):
         self.url = '/api/v2/repos'
 
         mock_db_for_repos_tests()
+        # post_save signals are muted while mocking
+        poem_models.update_metric_repos()
 
     def test_list_repos_if_wrong_token(self):
         request = self.factory.get(
@@ -852,7 +1015,7 @@ class ListReposAPIViewTests(TenantTestCase):
         response = self.view(request, 'centos7')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
-    @patch('Poem.api.views.get_metrics_from_profile')
+    @patch('Poem.api.views.get_metrics_from_profiles')
     def test_list_repos(self, mock_get_metrics):
         mock_get_metrics.side_effect = mock_function
         request = self.factory.get(
@@ -865,8 +1028,7 @@ class ListReposAPIViewTests(TenantTestCase):
         test_data['data']['repo-1']['packages'] = sorted(
             test_data['data']['repo-1']['packages'], key=lambda k: k['name']
         )
-        self.assertEqual(mock_get_metrics.call_count, 2)
-        mock_get_metrics.assert_has_calls([call('ARGO-MON'), call('MON-TEST')])
+        mock_get_metrics.assert_called_once_with(['ARGO-MON', 'MON-TEST'])
         self.assertEqual(
             test_data,
             {
@@ -926,7 +1088,7 @@ class ListReposAPIViewTests(TenantTestCase):
             {'detail': 'You must define profile!'}
         )
 
-    @patch('Poem.api.views.get_metrics_from_profile')
+    @patch('Poem.api.views.get_metrics_from_profiles')
     def test_list_repos_if_passive_metric_present(self, mock_get_metrics):
         mock_get_metrics.side_effect = mock_function
         request = self.factory.get(
@@ -935,10 +1097,7 @@ class ListReposAPIViewTests(TenantTestCase):
                'HTTP_PROFILES': '[ARGO-MON, MON-PASSIVE]'}
         )
         response = self.view(request, 'centos6')
-        self.assertEqual(mock_get_metrics.call_count, 2)
-        mock_get_metrics.assert_has_calls(
-            [call('ARGO-MON'), call('MON-PASSIVE')]
-        )
+        mock_get_metrics.assert_called_once_with(['ARGO-MON', 'MON-PASSIVE'])
         self.assertEqual(
             response.data,
             {
@@ -969,7 +1128,7 @@ class ListReposAPIViewTests(TenantTestCase):
             }
         )
 
-    @patch('Poem.api.views.get_metrics_from_profile')
+    @patch('Poem.api.views.get_metrics_from_profiles')
     def test_empty_repo_list(self, mock_get_metrics):
         mock_get_metrics.side_effect = mock_function
         request = self.factory.get(
@@ -978,8 +1137,7 @@ class ListReposAPIViewTests(TenantTestCase):
                'HTTP_PROFILES': '[EMPTY]'}
         )
         response = self.view(request, 'centos6')
-        mock_get_metrics.assert_called_once()
-        mock_get_metrics.assert_called_with('EMPTY')
+        mock_get_metrics.assert_called_once_with(['EMPTY'])
         self.assertEqual(
             response.data,
             {
@@ -998,7 +1156,7 @@ class ListReposAPIViewTests(TenantTestCase):
             }
         )
 
-    @patch('Poem.api.views.get_metrics_from_profile')
+    @patch('Poem.api.views.get_metrics_from_profiles')
     def test_list_repos_if_nonexisting_tag(self, mock_get_metrics):
         mock_get_metrics.side_effect = mock_function
         request = self.factory.get(
@@ -1007,15 +1165,14 @@ class ListReposAPIViewTests(TenantTestCase):
                'HTTP_PROFILES': '[ARGO-MON, MON-TEST]'}
         )
         response = self.view(request, 'nonexisting')
-        self.assertEqual(mock_get_metrics.call_count, 2)
-        mock_get_metrics.assert_has_calls([call('ARGO-MON'), call('MON-TEST')])
+        self.assertFalse(mock_get_metrics.called)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(
             response.data,
             {'detail': 'YUM repo tag not found.'}
         )
 
-    @patch('Poem.api.views.get_metrics_from_profile')
+    @patch('Poem.api.views.get_metrics_from_profiles')
     def test_list_repos_if_function_return_metric_does_not_exist(
             self, mock_get_metrics
     ):
@@ -1026,10 +1183,9 @@ class ListReposAPIViewTests(TenantTestCase):
                'HTTP_PROFILES': '[ARGO-MON, MON-TEST, TEST-NONEXISTING]'}
         )
         response = self.view(request, 'centos6')
-        self.assertEqual(mock_get_metrics.call_count, 3)
-        mock_get_metrics.assert_has_calls([
-            call('ARGO-MON'), call('MON-TEST'), call('TEST-NONEXISTING')
-        ])
+        mock_get_metrics.assert_called_once_with(
+            ['ARGO-MON', 'MON-TEST', 'TEST-NONEXISTING']
+        )
         self.assertEqual(
             response.data,
             {
@@ -1060,7 +1216,7 @@ class ListReposAPIViewTests(TenantTestCase):
             }
         )
 
-    @patch('Poem.api.views.get_metrics_from_profile')
+    @patch('Poem.api.views.get_metrics_from_profiles')
     def test_list_repos_if_version_is_the_right_os(self, mock_get_metrics):
         mock_get_metrics.side_effect = mock_function
         request = self.factory.get(
@@ -1069,8 +1225,7 @@ class ListReposAPIViewTests(TenantTestCase):
                'HTTP_PROFILES': '[TEST_PROMOO]'}
         )
         response = self.view(request, 'centos6')
-        mock_get_metrics.assert_called_once()
-        mock_get_metrics.assert_called_with('TEST_PROMOO')
+        mock_get_metrics.assert_called_once_with(['TEST_PROMOO'])
         self.assertEqual(
             response.data,
             {
@@ -1098,7 +1253,7 @@ class ListReposAPIViewTests(TenantTestCase):
             }
         )
 
-    @patch('Poem.api.views.get_metrics_from_profile')
+    @patch('Poem.api.views.get_metrics_from_profiles')
     def test_list_repos_if_version_is_wrong_os(self, mock_get_metrics):
         mock_get_metrics.side_effect = mock_function
         request = self.factory.get(
@@ -1107,8 +1262,7 @@ class ListReposAPIViewTests(TenantTestCase):
                'HTTP_PROFILES': '[TEST_PROMOO]'}
         )
         response = self.view(request, 'centos7')
-        mock_get_metrics.assert_called_once()
-        mock_get_metrics.assert_called_with('TEST_PROMOO')
+        mock_get_metrics.assert_called_once_with(['TEST_PROMOO'])
         self.assertEqual(
             response.data,
             {
@@ -1130,3 +1284,179 @@ class ListReposAPIViewTests(TenantTestCase):
                 'missing_packages': ['nagios-promoo (1.4.0)']
             }
         )
+
+    @patch('Poem.api.views.get_metrics_from_profiles')
+    def test_list_repos_for_any_ostag(self, mock_get_metrics):
+        mock_get_metrics.side_effect = mock_function
+        tag = admin_models.OSTag.objects.create(name='Rocky 8')
+        repo = admin_models.YumRepo.objects.create(
+            name='repo-rocky', tag=tag, content='content-rocky',
+            description='For Rocky 8'
+        )
+        admin_models.Package.objects.get(
+            name='nagios-plugins-argo', version='0.1.11'
+        ).repos.add(repo)
+        request = self.factory.get(
+            self.url + '/rocky8',
+            **{'HTTP_X_API_KEY': self.token,
+               'HTTP_PROFILES': '[TEST_PROMOO]'}
+        )
+        response = self.view(request, 'rocky8')
+        self.assertEqual(
+            response.data,
+            {
+                'data': {
+                    'repo-rocky': {
+                        'content': 'content-rocky',
+                        'packages': [
+                            {
+                                'name': 'nagios-plugins-argo',
+                                'version': '0.1.11'
+                            }
+                        ]
+                    }
+                },
+                'missing_packages': [
+                    'nagios-plugins-nagiosexchange (1.0.0)',
+                    'nagios-promoo (1.4.0)'
+                ]
+            }
+        )
+
+    @patch('Poem.api.views.get_metrics_from_profiles')
+    def test_list_repos_if_package_removed_from_repo(self, mock_get_metrics):
+        mock_get_metrics.side_effect = mock_function
+        package = admin_models.Package.objects.get(
+            name='nagios-plugins-argo', version='0.1.11'
+        )
+        package.repos.remove(
+            admin_models.YumRepo.objects.get(
+                name='repo-1', tag__name='CentOS 6'
+            )
+        )
+        request = self.factory.get(
+            self.url + '/centos6',
+            **{'HTTP_X_API_KEY': self.token,
+               'HTTP_PROFILES': '[EMPTY]'}
+        )
+        response = self.view(request, 'centos6')
+        self.assertEqual(
+            response.data,
+            {
+                'data': {},
+                'missing_packages': [
+                    'nagios-plugins-argo (0.1.11)',
+                    'nagios-plugins-nagiosexchange (1.0.0)'
+                ]
+            }
+        )
+
+    @patch('Poem.api.views.get_metrics_from_profiles')
+    def test_list_repos_if_metric_probekey_changed(self, mock_get_metrics):
+        mock_get_metrics.side_effect = mock_function
+        metric = poem_models.Metric.objects.get(
+            name='eu.egi.cloud.OCCI-Categories'
+        )
+        metric.probekey = admin_models.ProbeHistory.objects.get(
+            name='nagios-promoo.occi.categories', package__version='1.7.1'
+        )
+        metric.save()
+        request = self.factory.get(
+            self.url + '/centos7',
+            **{'HTTP_X_API_KEY': self.token,
+               'HTTP_PROFILES': '[TEST_PROMOO]'}
+        )
+        response = self.view(request, 'centos7')
+        self.assertEqual(
+            response.data['data']['promoo'],
+            {
+                'content': 'content11\ncontent12',
+                'packages': [
+                    {
+                        'name': 'nagios-promoo',
+                        'version': '1.7.1'
+                    }
+                ]
+            }
+        )
+        self.assertEqual(response.data['missing_packages'], [])
+
+
+class GetMetricsFromProfilesTests(TenantTestCase):
+    def setUp(self):
+        MyAPIKey.objects.create_key(name='WEB-API')
+        utils.clear_sync_cache()
+        webapi.clear_breakers()
+        self.profiles = {
+            'data': [
+                {
+                    'id': '00000001-0000-0000-0000-000000000000',
+                    'name': 'ARGO-MON',
+                    'services': [
+                        {
+                            'service': 'argo.api',
+                            'metrics': ['argo.API-Check', 'argo.AMS-Check']
+                        }
+                    ]
+                },
+                {
+                    'id': '00000002-0000-0000-0000-000000000000',
+                    'name': 'MON-TEST',
+                    'services': [
+                        {
+                            'service': 'argo.webui',
+                            'metrics': ['argo.AMS-Check', 'org.nagios.CDMI']
+                        }
+                    ]
+                },
+                {
+                    'id': '00000003-0000-0000-0000-000000000000',
+                    'name': 'OTHER',
+                    'services': [
+                        {
+                            'service': 'other',
+                            'metrics': ['org.nagios.OTHER']
+                        }
+                    ]
+                }
+            ]
+        }
+
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_get_metrics_from_profiles(self, mock_get):
+        mock_get.return_value = MockResponse(self.profiles, 200)
+        metrics = views.get_metrics_from_profiles(['ARGO-MON', 'MON-TEST'])
+        mock_get.assert_called_once()
+        self.assertEqual(
+            metrics, {'argo.API-Check', 'argo.AMS-Check', 'org.nagios.CDMI'}
+        )
+
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_get_metrics_from_profiles_if_nonexisting_profile(self, mock_get):
+        mock_get.return_value = MockResponse(self.profiles, 200)
+        with self.assertRaises(views.NotFound) as context:
+            views.get_metrics_from_profiles(['ARGO-MON', 'NONEXISTING'])
+        mock_get.assert_called_once()
+        self.assertEqual(
+            context.exception.detail, 'Metric profile NONEXISTING not found.'
+        )
+
+    @patch('Poem.helpers.webapi.requests.Session.get')
+    def test_get_metrics_from_profiles_synced(self, mock_get):
+        mock_get.return_value = MockResponse(self.profiles, 200)
+        views.get_metrics_from_profiles(['ARGO-MON'])
+        self.assertEqual(
+            set(poem_models.MetricProfileMetric.objects.values_list(
+                'profile__name', 'service', 'metric'
+            )),
+            {
+                ('ARGO-MON', 'argo.api', 'argo.API-Check'),
+                ('ARGO-MON', 'argo.api', 'argo.AMS-Check'),
+                ('MON-TEST', 'argo.webui', 'argo.AMS-Check'),
+                ('MON-TEST', 'argo.webui', 'org.nagios.CDMI'),
+                ('OTHER', 'other', 'org.nagios.OTHER')
+            }
+        )
+        metrics = views.get_metrics_from_profiles(['MON-TEST'])
+        mock_get.assert_called_once()
+        self.assertEqual(metrics, {'argo.AMS-Check', 'org.nagios.CDMI'})
@@ -1,6 +1,8 @@
 import json
 
 import requests
+from Poem.helpers.inline_codec import decode_inline_dict
+from deepdiff import DeepDiff
 from django.test.client import encode_multipart
 
 
@@ -34,6 +36,12 @@ class MockResponse:
         self.data = data
         self.status_code = status_code
 
+        if isinstance(data, dict):
+            self.content = json.dumps(data).encode()
+
+        else:
+            self.content = data.encode()
+
         if self.status_code == 200:
             self.reason = 'OK'
 
@@ -265,41 +273,6 @@ def mocked_web_api_metric_profiles_not_found(*args, **kwargs):
     return MockResponse('404 page not found', 404)
 
 
-def mocked_web_api_metric_profile(*args, **kwargs):
-    return MockResponse(
-        {
-            "status": {
-                "message": "Success",
-                "code": "200"
-            },
-            "data": [
-                {
-                    "id": "11111111-2222-3333-4444-555555555555",
-                    "date": "2020-04-20",
-                    "name": "PROFILE1",
-                    "description": "First profile",
-                    "services": [
-                        {
-                            "service": "service1",
-                            "metrics": [
-                                "metric1",
-                                "metric2"
-                            ]
-                        },
-                        {
-                            "service": "service2",
-                            "metrics": [
-                                "metric3",
-                                "metric4"
-                            ]
-                        }
-                    ]
-                }
-            ]
-        }, 200
-    )
-
-
 def mocked_web_api_metric_profile_put(*args, **kwargs):
     return MockResponse(
         {
@@ -316,3 +289,223 @@ def mocked_web_api_metric_profile_put(*args, **kwargs):
             }
         }, 200
     )
+
+
+def deepdiff_analyze_differences(old_data, new_data):
+    """
+    analyze_differences as it was implemented with DeepDiff, kept as
+    reference for the differ replacing it.
+    """
+    inlines = ['config', 'attribute', 'dependency', 'flags', 'files',
+               'parameter', 'fileparameter', 'dependancy']
+
+    foreignkeys = ['probekey', 'package', 'group']
+
+    changed = []
+    added = []
+    deleted = []
+    msg = []
+    if old_data:
+        res = DeepDiff(old_data, new_data, ignore_order=True)
+
+        # I'm numbering how many times the for loop has passed because foreign
+        # keys are serialized in lists
+        passed = 0
+        added_groups = list()
+        deleted_groups = list()
+        added_rules = list()
+        deleted_rules = list()
+        if 'iterable_item_removed' in res:
+            for key, value in res['iterable_item_removed'].items():
+                field = key.split('[')[1][0:-1].strip('\'')
+                if field in foreignkeys:
+                    passed += 1
+                    pass
+                elif field == 'groups':
+                    deleted_groups.append(value['name'])
+                elif field == 'rules':
+                    deleted_rules.append(value['metric'])
+                else:
+                    msg.append(
+                        {
+                            'deleted': {
+                                'fields': [field], 'object': value
+                            }
+                        }
+                    )
+
+        if 'iterable_item_added' in res:
+            for key, value in res['iterable_item_added'].items():
+                field = key.split('[')[1][0:-1].strip('\'')
+                if field in foreignkeys:
+                    passed += 1
+                    pass
+                elif field == 'groups':
+                    added_groups.append(value['name'])
+                elif field == 'rules':
+                    added_rules.append(value['metric'])
+                else:
+                    msg.append(
+                        {
+                            'added': {
+                                'fields': [field], 'object': value
+                            }
+                        }
+                    )
+
+        if added_groups or deleted_groups:
+            for item in added_groups:
+                if item in deleted_groups:
+                    deleted_groups.remove(item)
+                    msg.append(
+                        {
+                            'changed': {
+                                'fields': ['groups'], 'object': [item]
+                            }
+                        }
+                    )
+
+                else:
+                    msg.append(
+                        {
+                            'added': {
+                                'fields': ['groups'], 'object': [item]
+                            }
+                        }
+                    )
+
+            for item in deleted_groups:
+                msg.append(
+                    {
+                        'deleted': {
+                            'fields': ['groups'], 'object': [item]
+                        }
+                    }
+                )
+
+        if added_rules or deleted_rules:
+            for item in added_rules:
+                if item in deleted_rules:
+                    deleted_rules.remove(item)
+                    msg.append(
+                        {
+                            'changed': {
+                                'fields': ['rules'], 'object': [item]
+                            }
+                        }
+                    )
+
+                else:
+                    msg.append(
+                        {
+                            'added': {
+                                'fields': ['rules'], 'object': [item]
+                            }
+                        }
+                    )
+
+            for item in deleted_rules:
+                msg.append(
+                    {
+                        'deleted': {
+                            'fields': ['rules'], 'object': [item]
+                        }
+                    }
+                )
+
+        if passed > 0:
+            res = DeepDiff(old_data, new_data)
+
+        if 'dictionary_item_added' in res:
+            for item in res['dictionary_item_added']:
+                added.append(item.split('[')[1][0:-1].strip('\''))
+
+        if 'type_changes' in res:
+            for key, value in res['type_changes'].items():
+                field = key.split('[')[1][0:-1].strip('\'')
+
+                if value['new_value'] is None:
+                    deleted.append(field)
+
+                if value['old_value'] is None:
+                    added.append(field)
+
+                if not value['new_value'] is None and \
+                        not value['old_value'] is None:
+                    changed.append(field)
+
+        if 'values_changed' in res:
+            for key, value in res['values_changed'].items():
+                field = key.split('[')[1][1:-2]
+                try:
+                    if field in inlines:
+                        old = decode_inline_dict(value['old_value'])
+                        new = decode_inline_dict(value['new_value'])
+                        deleted_fields = []
+                        changed_fields = []
+                        added_fields = []
+                        res = DeepDiff(old, new, ignore_order=True)
+                        if 'values_changed' in res:
+                            for k, v in res['values_changed'].items():
+                                changed_fields.append(
+                                    k.split('[')[1][0:-1].strip('\'')
+                                )
+
+                        if 'dictionary_item_added' in res:
+                            for item in res['dictionary_item_added']:
+                                added_fields.append(
+                                    item.split('[')[1][0:-1].strip('\'')
+                                )
+
+                        if 'dictionary_item_removed' in res:
+                            for item in res['dictionary_item_removed']:
+                                deleted_fields.append(
+                                    item.split('[')[1][0:-1].strip('\'')
+                                )
+
+                        if deleted_fields:
+                            msg.append(
+                                {'deleted': {
+                                    'fields': [field],
+                                    'object': sorted(deleted_fields)
+                                }}
+                            )
+
+                        if changed_fields:
+                            msg.append(
+                                {'changed': {
+                                    'fields': [field],
+                                    'object': sorted(changed_fields)
+                                }}
+                            )
+
+                        if added_fields:
+                            msg.append(
+                                {'added': {'fields': [field],
+                                           'object': sorted(added_fields)}}
+                            )
+
+                    else:
+                        if not value['new_value']:
+                            deleted.append(field)
+
+                        elif not value['old_value']:
+                            added.append(field)
+
+                        else:
+                            if field != 'tags':
+                                changed.append(field)
+
+                except KeyError:
+                    pass
+
+        if added:
+            msg.append({'added': {'fields': sorted(list(set(added)))}})
+        if changed:
+            msg.append({'changed': {'fields': sorted(list(set(changed)))}})
+        if deleted:
+            msg.append({'deleted': {'fields': sorted(list(set(deleted)))}})
+
+        return json.dumps(msg)
+    else:
+        return 'Initial version.'
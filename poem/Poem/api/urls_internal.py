@@ -9,6 +9,8 @@ urlpatterns = [
     path('public_aggregations/', views_internal.ListPublicAggregations.as_view(), name='aggregations'),
     path('aggregations/<str:aggregation_name>', views_internal.ListAggregations.as_view(), name='aggregations'),
     path('public_aggregations/<str:aggregation_name>', views_internal.ListPublicAggregations.as_view(), name='aggregations'),
+    path('aggregationsformetricprofile/<str:name>', views_internal.ListAggregationsForMetricProfile.as_view(), name='aggregationsformetricprofile'),
+    path('public_aggregationsformetricprofile/<str:name>', views_internal.ListPublicAggregationsForMetricProfile.as_view(), name='aggregationsformetricprofile'),
     path('aggregationsgroup/', views_internal.ListAggregationsInGroup.as_view(), name='aggregationprofiles'),
     path('aggregationsgroup/<str:group>', views_internal.ListAggregationsInGroup.as_view(), name='aggregationprofiles'),
     path('apikeys/', views_internal.ListAPIKeys.as_view(), name='tokens'),
@@ -30,6 +32,8 @@ urlpatterns = [
     path('public_metricprofiles/', views_internal.ListPublicMetricProfiles.as_view(), name='metricprofiles'),
     path('metricprofiles/<str:profile_name>', views_internal.ListMetricProfiles.as_view(), name='metricprofiles'),
     path('public_metricprofiles/<str:profile_name>', views_internal.ListPublicMetricProfiles.as_view(), name='metricprofiles'),
+    path('metricprofilesformetric/<str:name>', views_internal.ListMetricProfilesForMetric.as_view(), name='metricprofilesformetric'),
+    path('public_metricprofilesformetric/<str:name>', views_internal.ListPublicMetricProfilesForMetric.as_view(), name='metricprofilesformetric'),
     path('metricprofilesgroup/', views_internal.ListMetricProfilesInGroup.as_view(), name='metricprofilesgroup'),
     path('metricprofilesgroup/<str:group>', views_internal.ListMetricProfilesInGroup.as_view(), name='metricprofilesgroup'),
     path('metricsall/', views_internal.ListAllMetrics.as_view(), name='metricsall'),
@@ -64,10 +68,13 @@ urlpatterns = [
     path('public_servicetypesdesc/', views_internal.ListPublicServiceTypesDescriptions.as_view(), name='servicetypesdesc'),
     path('sessionactive/<str:istenant>', views_internal.IsSessionActive.as_view(), name='sessionactive'),
     path('tenantversion/<str:obj>/<str:name>', views_internal.ListTenantVersions.as_view(), name='tenantversions'),
+    path('tenantversion/<str:obj>/<str:name>/current', views_internal.ListTenantVersions.as_view(), {'current': True}, name='tenantversions'),
     path('thresholdsprofiles/', views_internal.ListThresholdsProfiles.as_view(), name='thresholdsprofiles'),
     path('public_thresholdsprofiles/', views_internal.ListPublicThresholdsProfiles.as_view(), name='thresholdsprofiles'),
     path('thresholdsprofiles/<str:name>', views_internal.ListThresholdsProfiles.as_view(), name='thresholdsprofiles'),
     path('public_thresholdsprofiles/<str:name>', views_internal.ListPublicThresholdsProfiles.as_view(), name='thresholdsprofiles'),
+    path('thresholdsprofilesformetric/<str:name>', views_internal.ListThresholdsProfilesForMetric.as_view(), name='thresholdsprofilesformetric'),
+    path('public_thresholdsprofilesformetric/<str:name>', views_internal.ListPublicThresholdsProfilesForMetric.as_view(), name='thresholdsprofilesformetric'),
     path('thresholdsprofilesgroup/', views_internal.ListThresholdsProfilesInGroup.as_view(), name='thresholdsprofilesgroup'),
     path('thresholdsprofilesgroup/<str:group>', views_internal.ListThresholdsProfilesInGroup.as_view(), name='thresholdsprofilesgroup'),
     path('usergroups/', views_internal.ListGroupsForGivenUser.as_view(), name='usergroups'),
@@ -78,6 +85,7 @@ urlpatterns = [
     path('users/', views_internal.ListUsers.as_view(), name='users'),
     path('users/<str:username>', views_internal.ListUsers.as_view(), name='users'),
     path('version/<str:obj>/', views_internal.ListVersions.as_view(), name='version'),
+    path('webapistats/', views_internal.GetWebAPIStats.as_view(), name='webapistats'),
     path('public_version/<str:obj>/', views_internal.ListPublicVersions.as_view(), name='version'),
     path('version/<str:obj>/<str:name>', views_internal.ListVersions.as_view(), name='version'),
     path('public_version/<str:obj>/<str:name>', views_internal.ListPublicVersions.as_view(), name='version'),
@@ -1,11 +1,16 @@
-import requests
+import json
+
+from Poem.api.conditional import ConditionalGetMixin
 from Poem.api.internal_views.utils import one_value_inline, \
-    two_value_inline_dict
-from Poem.api.models import MyAPIKey
+    sync_webapi_if_stale
 from Poem.api.permissions import MyHasAPIKey
+from Poem.helpers.inline_codec import decode_inline_dict
 from Poem.poem import models
 from Poem.poem_super_admin import models as admin_models
 from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.exceptions import APIException
 from rest_framework.response import Response
@@ -22,21 +27,23 @@ class NotFound(APIException):
 def build_metricconfigs():
     ret = []
 
-    metricsobjs = models.Metric.objects.all().order_by('name')
+    metricsobjs = models.Metric.objects.select_related(
+        'probekey'
+    ).prefetch_related('tags').order_by('name')
 
     for m in metricsobjs:
         mdict = dict()
         mdict.update({m.name: dict()})
 
-        config = two_value_inline_dict(m.config)
+        config = decode_inline_dict(m.config)
         parent = one_value_inline(m.parent)
         probeexecutable = one_value_inline(m.probeexecutable)
-        attribute = two_value_inline_dict(m.attribute)
-        dependancy = two_value_inline_dict(m.dependancy)
-        flags = two_value_inline_dict(m.flags)
-        files = two_value_inline_dict(m.files)
-        parameter = two_value_inline_dict(m.parameter)
-        fileparameter = two_value_inline_dict(m.fileparameter)
+        attribute = decode_inline_dict(m.attribute)
+        dependancy = decode_inline_dict(m.dependancy)
+        flags = decode_inline_dict(m.flags)
+        files = decode_inline_dict(m.files)
+        parameter = decode_inline_dict(m.parameter)
+        fileparameter = decode_inline_dict(m.fileparameter)
 
         mdict[m.name].update(
             {'tags': sorted([tag.name for tag in m.tags.all()])}
@@ -100,35 +107,43 @@ def build_metricconfigs():
     return ret
 
 
-def get_metrics_from_profile(profile):
-    token = MyAPIKey.objects.get(name='WEB-API')
+def get_metricconfigs():
+    snapshot, _ = models.MetricConfigSnapshot.objects.get_or_create(id=1)
 
-    headers = {'Accept': 'application/json', 'x-api-key': token.token}
-    response = requests.get(
-        settings.WEBAPI_METRIC, headers=headers, timeout=180
-    )
-    response.raise_for_status()
-    data = response.json()['data']
+    if not snapshot.data:
+        # rendered the same way as DRF JSONRenderer renders the list
+        snapshot.data = json.dumps(
+            build_metricconfigs(), ensure_ascii=False, separators=(',', ':')
+        )
+        # not stored if metrics were changed in the meantime
+        models.MetricConfigSnapshot.objects.filter(
+            id=1, generation=snapshot.generation
+        ).update(data=snapshot.data, date_created=timezone.now())
 
-    metrics = set()
-    if data:
-        if profile not in [p['name'] for p in data]:
-            raise NotFound(
-                status=404,
-                detail='Metric profile {} not found.'.format(profile))
+    return snapshot.data
 
-        else:
-            for p in data:
-                if p['name'] == profile:
-                    for s in p['services']:
-                        for m in s['metrics']:
-                            metrics.add(m)
 
-    return metrics
+def get_metrics_from_profiles(profiles):
+    sync_webapi_if_stale(settings.WEBAPI_METRIC, models.MetricProfiles)
 
+    if models.MetricProfiles.objects.exists():
+        names = set(models.MetricProfiles.objects.filter(
+            name__in=profiles
+        ).values_list('name', flat=True))
+        for profile in profiles:
+            if profile not in names:
+                raise NotFound(
+                    status=404,
+                    detail='Metric profile {} not found.'.format(profile))
 
-class ListMetrics(APIView):
+    return set(models.MetricProfileMetric.objects.filter(
+        profile__name__in=profiles
+    ).values_list('metric', flat=True))
+
+
+class ListMetrics(ConditionalGetMixin, APIView):
     permission_classes = (MyHasAPIKey,)
+    conditional_resources = ('metric', 'history', 'metrictemplate')
 
     def get(self, request, tag=None):
         if tag:
@@ -145,7 +160,21 @@ class ListMetrics(APIView):
                 )
 
         else:
-            return Response(build_metricconfigs())
+            return HttpResponse(
+                get_metricconfigs(), content_type='application/json'
+            )
+
+
+def get_ostag(tag):
+    """
+    Returns OSTag matching tag given in URL, which is OS tag name in
+    lowercase without spaces (e.g. centos7 for CentOS 7).
+    """
+    for ostag in admin_models.OSTag.objects.all():
+        if ostag.name.lower().replace(' ', '') == tag.lower():
+            return ostag
+
+    raise NotFound(status=404, detail='YUM repo tag not found.')
 
 
 class ListRepos(APIView):
@@ -165,79 +194,50 @@ class ListRepos(APIView):
             )
 
         else:
+            ostag = get_ostag(tag)
+
             profiles = dict(request.META)['HTTP_PROFILES'][1:-1].split(', ')
-            metrics = set()
-            for profile in profiles:
-                metrics = metrics.union(get_metrics_from_profile(profile))
+            metrics = get_metrics_from_profiles(profiles)
 
-            internal_metrics = set([
-                metric.name for metric in models.Metric.objects.filter(
-                    tags__name='internal'
-                )
-            ])
-            metrics = metrics.union(internal_metrics)
-
-            if tag == 'centos7':
-                ostag = admin_models.OSTag.objects.get(name='CentOS 7')
-            elif tag == 'centos6':
-                ostag = admin_models.OSTag.objects.get(name='CentOS 6')
-            else:
-                raise NotFound(status=404, detail='YUM repo tag not found.')
-
-            packages = set()
-            for metric in metrics:
-                try:
-                    m = models.Metric.objects.get(name=metric)
-                    if m.probekey:
-                        packages.add(m.probekey.package)
-
-                except models.Metric.DoesNotExist:
-                    pass
+            rows = models.MetricRepo.objects.filter(
+                Q(name__in=metrics) | Q(metric__tags__name='internal')
+            ).select_related('yumrepo').order_by('repo')
+
+            packages = dict()
+            for row in rows:
+                key = (row.package, row.version)
+                if row.tag == ostag.name:
+                    if not packages.get(key):
+                        packages[key] = row.yumrepo
+
+                else:
+                    packages.setdefault(key, None)
 
             data = dict()
-            packagedict = dict()
             missing_packages = []
-            for package in packages:
-                try:
-                    repo = package.repos.get(tag=ostag)
-
-                except admin_models.YumRepo.DoesNotExist:
-                    missing_packages.append(package.__str__())
-                    continue
+            for (name, version), repo in packages.items():
+                if repo:
+                    if repo.name not in data:
+                        data.update({
+                            repo.name: {
+                                'content': repo.content,
+                                'packages': []
+                            }
+                        })
 
-                else:
-                    packagedict.update({package: repo})
-
-            for key, value in packagedict.items():
-                if value.name not in data:
-                    if key.use_present_version:
-                        version = 'present'
-                    else:
-                        version = key.version
-                    data.update(
+                    data[repo.name]['packages'].append(
                         {
-                            value.name: {
-                                'content': value.content,
-                                'packages': [
-                                    {
-                                        'name': key.name,
-                                        'version': version
-                                    }
-                                ]
-                            }
+                            'name': name,
+                            'version': version
                         }
                     )
 
                 else:
-                    data[value.name]['packages'].append(
-                        {
-                            'name': key.name,
-                            'version': key.version
-                        }
-                    )
+                    missing_packages.append('{} ({})'.format(name, version))
 
-                data[value.name]['packages'] = sorted(
-                    data[value.name]['packages'], key=lambda i: i['name']
+            for value in data.values():
+                value['packages'] = sorted(
+                    value['packages'], key=lambda i: i['name']
                 )
 
         return Response({
@@ -52,7 +52,8 @@ export class Backend {
   async fetchData(url) {
     let error_msg = '';
     try {
-      let response = await fetch(url);
+      // always revalidate cached response with ETag/Last-Modified
+      let response = await fetch(url, {cache: 'no-cache'});
       if (response.ok)
         return response.json();
 
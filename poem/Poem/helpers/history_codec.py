@@ -0,0 +1,132 @@
+import hashlib
+import json
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+CACHE_SIZE = 16
+
+
+def digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _loads(text):
+    # keyframes are shared by many deltas, so they are parsed once
+    return json.loads(text)
+
+
+def _list_ops(old, new):
+    """
+    Returns list of [i1, i2, items] operations, each replacing old[i1:i2]
+    with items, which turn old list into the new one.
+    """
+    matcher = SequenceMatcher(
+        None, [json.dumps(item) for item in old],
+        [json.dumps(item) for item in new], autojunk=False
+    )
+
+    return [
+        [i1, i2, new[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal'
+    ]
+
+
+def make_delta(base, new):
+    """
+    Returns delta turning serialized data base into new one, both of them
+    loaded from JSON. Only fields of single serialized object are
+    delta-encoded; None is returned for any other difference.
+    """
+    if not (isinstance(base, list) and isinstance(new, list) and
+            len(base) == len(new) == 1):
+        return None
+
+    old_obj, new_obj = base[0], new[0]
+    if not (isinstance(old_obj, dict) and isinstance(new_obj, dict)) or \
+            list(old_obj) != list(new_obj) or \
+            not isinstance(old_obj.get('fields'), dict) or \
+            not isinstance(new_obj.get('fields'), dict) or \
+            any(old_obj[key] != new_obj[key]
+                for key in old_obj if key != 'fields'):
+        return None
+
+    old, fields = old_obj['fields'], new_obj['fields']
+    delta = dict()
+    for key, value in fields.items():
+        if key in old and old[key] == value:
+            continue
+
+        if key in old and isinstance(old[key], list) and \
+                isinstance(value, list):
+            ops = _list_ops(old[key], value)
+            if len(json.dumps(ops)) < len(json.dumps(value)):
+                delta.setdefault('patch', dict())[key] = ops
+                continue
+
+        delta.setdefault('set', dict())[key] = value
+
+    removed = [key for key in old if key not in fields]
+    if removed:
+        delta['removed'] = removed
+
+    if list(apply_delta(base, delta)[0]['fields']) != list(fields):
+        delta['order'] = list(fields)
+
+    return delta
+
+
+def apply_delta(base, delta):
+    """
+    Returns serialized data rebuilt from base and delta made by make_delta.
+    Base is not changed.
+    """
+    obj = dict(base[0])
+    fields = dict(obj['fields'])
+
+    for key in delta.get('removed', []):
+        del fields[key]
+
+    for key, value in delta.get('set', dict()).items():
+        fields[key] = value
+
+    for key, ops in delta.get('patch', dict()).items():
+        items = list(fields[key])
+        for i1, i2, new in reversed(ops):
+            items[i1:i2] = new
+
+        fields[key] = items
+
+    if 'order' in delta:
+        fields = dict((key, fields[key]) for key in delta['order'])
+
+    obj['fields'] = fields
+
+    return [obj]
+
+
+def encode_delta(base_text, text):
+    """
+    Returns delta between serialized data texts as JSON string, or None if
+    text cannot be rebuilt exactly from delta, or delta is not much smaller
+    than the text itself.
+    """
+    try:
+        base = _loads(base_text)
+        delta = make_delta(base, json.loads(text))
+
+    except ValueError:
+        return None
+
+    if delta is None or json.dumps(apply_delta(base, delta)) != text:
+        return None
+
+    delta_text = json.dumps(delta, separators=(',', ':'))
+    if 2 * len(delta_text) > len(text):
+        return None
+
+    return delta_text
+
+
+def decode_delta(base_text, delta_text):
+    return json.dumps(apply_delta(_loads(base_text), json.loads(delta_text)))
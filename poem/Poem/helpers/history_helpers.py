@@ -1,9 +1,10 @@
 import json
+from collections import Counter
 
+from Poem.helpers.inline_codec import decode_inline_dict
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
 from Poem.users.models import CustUser
-from deepdiff import DeepDiff
 from django.contrib.contenttypes.models import ContentType
 from django.core import serializers
 
@@ -21,18 +22,6 @@ def serialized_data_to_dict(data):
     return json.loads(data)[0]['fields']
 
 
-def inline_models_to_dicts(data):
-    new_data = {}
-
-    if data:
-        data = json.loads(data)
-
-        for item in data:
-            new_data.update({item.split(' ')[0]: item.split(' ')[1]})
-
-    return new_data
-
-
 def inline_one_to_dict(data):
     if data:
         return json.loads(data)[0]
@@ -112,281 +101,325 @@ def create_history(instance, user, comment=None):
     create_history_entry(instance, user, comment)
 
 
+INLINES = ('config', 'attribute', 'dependency', 'flags', 'files',
+           'parameter', 'fileparameter', 'dependancy')
+FOREIGNKEYS = ('probekey', 'package', 'group')
+
+
+def _identity(value):
+    """
+    Returns hashable value, equal for values considered the same when order
+    of lists is ignored: lists are compared as sets of their items, numbers
+    by value, and other values by type and value.
+    """
+    if isinstance(value, str):
+        return value
+
+    elif isinstance(value, bool):
+        return 'bool', value
+
+    elif isinstance(value, (int, float)):
+        return 'number', value
+
+    elif isinstance(value, dict):
+        return 'dict', frozenset(
+            (key, _identity(item)) for key, item in value.items()
+        )
+
+    elif isinstance(value, list):
+        # most are lists of strings, such as [service, metric] pairs
+        return 'list', frozenset(
+            item if isinstance(item, str) else _identity(item)
+            for item in value
+        )
+
+    else:
+        return type(value).__name__, value
+
+
+def _differences(old, new, ordered):
+    """
+    Yields (kind, old, new) tuples of differences between serialized values:
+    dictionary_item_added, dictionary_item_removed, type_changes,
+    values_changed, iterable_item_added and iterable_item_removed, with
+    values at the level the difference is found. Unless ordered is set,
+    lists are compared as sets, and only items of the old and the new list
+    which are not in the other one are reported.
+    """
+    if old is new:
+        return
+
+    if type(old) is not type(new):
+        yield 'type_changes', old, new
+
+    elif isinstance(old, dict):
+        for key in new:
+            if key not in old:
+                yield 'dictionary_item_added', None, new[key]
+
+        for key in old:
+            if key not in new:
+                yield 'dictionary_item_removed', old[key], None
+
+            else:
+                yield from _differences(old[key], new[key], ordered)
+
+    elif isinstance(old, list):
+        if ordered:
+            for i, item in enumerate(old[:len(new)]):
+                yield from _differences(item, new[i], ordered)
+
+            for item in old[len(new):]:
+                yield 'iterable_item_removed', item, None
+
+            for item in new[len(old):]:
+                yield 'iterable_item_added', None, item
+
+        else:
+            # the first of the same items is reported
+            old_items = dict()
+            for item in old:
+                old_items.setdefault(_identity(item), item)
+
+            new_items = dict()
+            for item in new:
+                new_items.setdefault(_identity(item), item)
+
+            for key, item in old_items.items():
+                if key not in new_items:
+                    yield 'iterable_item_removed', item, None
+
+            for key, item in new_items.items():
+                if key not in old_items:
+                    yield 'iterable_item_added', None, item
+
+    elif old != new:
+        yield 'values_changed', old, new
+
+
+def _field_differences(old_data, new_data, ordered=False):
+    """
+    Returns dict of difference kind to list of (field, old, new) tuples,
+    field being the serialized field the difference is found in.
+    """
+    result = dict()
+    for field in new_data:
+        if field not in old_data:
+            result.setdefault('dictionary_item_added', []).append(
+                (field, None, new_data[field])
+            )
+
+        elif isinstance(new_data[field], str) and \
+                new_data[field] == old_data[field]:
+            continue
+
+        else:
+            for kind, old, new in _differences(
+                    old_data[field], new_data[field], ordered
+            ):
+                result.setdefault(kind, []).append((field, old, new))
+
+    return result
+
+
+def _inline_key(key):
+    # inline keys are reported the way they were read from DeepDiff paths
+    return "root['{}']".format(key).split('[')[1][0:-1].strip('\'')
+
+
+def _inline_differences(field, old_value, new_value):
+    old = decode_inline_dict(old_value)
+    new = decode_inline_dict(new_value)
+
+    msg = []
+    deleted = [_inline_key(key) for key in old if key not in new]
+    changed = [
+        _inline_key(key) for key in old if key in new and old[key] != new[key]
+    ]
+    added = [_inline_key(key) for key in new if key not in old]
+
+    if deleted:
+        msg.append({'deleted': {'fields': [field], 'object': sorted(deleted)}})
+
+    if changed:
+        msg.append({'changed': {'fields': [field], 'object': sorted(changed)}})
+
+    if added:
+        msg.append({'added': {'fields': [field], 'object': sorted(added)}})
+
+    return msg
+
+
+def _name_key(name):
+    return name if isinstance(name, str) else json.dumps(name, sort_keys=True)
+
+
+def _named_items(field, added, deleted):
+    """
+    Returns messages for names of added and deleted groups or rules; names
+    both added and deleted are reported as changed, as many times as they
+    are found in both.
+    """
+    msg = []
+    left = Counter(_name_key(item) for item in deleted)
+    for item in added:
+        key = _name_key(item)
+        if left[key] > 0:
+            left[key] -= 1
+            msg.append({'changed': {'fields': [field], 'object': [item]}})
+
+        else:
+            msg.append({'added': {'fields': [field], 'object': [item]}})
+
+    # the first of the repeated deleted names are the changed ones
+    changed = Counter(_name_key(item) for item in deleted)
+    changed.subtract(left)
+    for item in deleted:
+        key = _name_key(item)
+        if changed[key] > 0:
+            changed[key] -= 1
+
+        else:
+            msg.append({'deleted': {'fields': [field], 'object': [item]}})
+
+    return msg
+
+
 def analyze_differences(old_data, new_data):
-    inlines = ['config', 'attribute', 'dependency', 'flags', 'files',
-               'parameter', 'fileparameter', 'dependancy']
+    """
+    Returns JSON encoded list of changes between the old and the new
+    serialized object, used as comment of its history entry.
+    """
+    if not old_data:
+        return 'Initial version.'
 
-    foreignkeys = ['probekey', 'package', 'group']
+    res = _field_differences(old_data, new_data)
 
-    changed = []
+    msg = []
     added = []
+    changed = []
     deleted = []
-    msg = []
-    if old_data:
-        res = DeepDiff(old_data, new_data, ignore_order=True)
-
-        # I'm numbering how many times the for loop has passed because foreign
-        # keys are serialized in lists
-        passed = 0
-        added_groups = list()
-        deleted_groups = list()
-        added_rules = list()
-        deleted_rules = list()
-        if 'iterable_item_removed' in res:
-            for key, value in res['iterable_item_removed'].items():
-                field = key.split('[')[1][0:-1].strip('\'')
-                if field in foreignkeys:
-                    passed += 1
-                    pass
-                elif field == 'groups':
-                    deleted_groups.append(value['name'])
-                elif field == 'rules':
-                    deleted_rules.append(value['metric'])
-                else:
-                    msg.append(
-                        {
-                            'deleted': {
-                                'fields': [field], 'object': value
-                            }
-                        }
-                    )
-
-        if 'iterable_item_added' in res:
-            for key, value in res['iterable_item_added'].items():
-                field = key.split('[')[1][0:-1].strip('\'')
-                if field in foreignkeys:
-                    passed += 1
-                    pass
-                elif field == 'groups':
-                    added_groups.append(value['name'])
-                elif field == 'rules':
-                    added_rules.append(value['metric'])
-                else:
-                    msg.append(
-                        {
-                            'added': {
-                                'fields': [field], 'object': value
-                            }
-                        }
-                    )
-
-        if added_groups or deleted_groups:
-            for item in added_groups:
-                if item in deleted_groups:
-                    deleted_groups.remove(item)
-                    msg.append(
-                        {
-                            'changed': {
-                                'fields': ['groups'], 'object': [item]
-                            }
-                        }
-                    )
-
-                else:
-                    msg.append(
-                        {
-                            'added': {
-                                'fields': ['groups'], 'object': [item]
-                            }
-                        }
-                    )
-
-            for item in deleted_groups:
-                msg.append(
-                    {
-                        'deleted': {
-                            'fields': ['groups'], 'object': [item]
-                        }
-                    }
-                )
-
-        if added_rules or deleted_rules:
-            for item in added_rules:
-                if item in deleted_rules:
-                    deleted_rules.remove(item)
-                    msg.append(
-                        {
-                            'changed': {
-                                'fields': ['rules'], 'object': [item]
-                            }
-                        }
-                    )
-
-                else:
-                    msg.append(
-                        {
-                            'added': {
-                                'fields': ['rules'], 'object': [item]
-                            }
-                        }
-                    )
-
-            for item in deleted_rules:
-                msg.append(
-                    {
-                        'deleted': {
-                            'fields': ['rules'], 'object': [item]
-                        }
-                    }
-                )
-
-        if passed > 0:
-            res = DeepDiff(old_data, new_data)
-
-        if 'dictionary_item_added' in res:
-            for item in res['dictionary_item_added']:
-                added.append(item.split('[')[1][0:-1].strip('\''))
-
-        if 'type_changes' in res:
-            for key, value in res['type_changes'].items():
-                field = key.split('[')[1][0:-1].strip('\'')
-
-                if value['new_value'] is None:
-                    deleted.append(field)
-
-                if value['old_value'] is None:
-                    added.append(field)
-
-                if not value['new_value'] is None and \
-                        not value['old_value'] is None:
-                    changed.append(field)
-
-        if 'values_changed' in res:
-            for key, value in res['values_changed'].items():
-                field = key.split('[')[1][1:-2]
-                try:
-                    if field in inlines:
-                        old = inline_models_to_dicts(value['old_value'])
-                        new = inline_models_to_dicts(value['new_value'])
-                        deleted_fields = []
-                        changed_fields = []
-                        added_fields = []
-                        res = DeepDiff(old, new, ignore_order=True)
-                        if 'values_changed' in res:
-                            for k, v in res['values_changed'].items():
-                                changed_fields.append(
-                                    k.split('[')[1][0:-1].strip('\'')
-                                )
-
-                        if 'dictionary_item_added' in res:
-                            for item in res['dictionary_item_added']:
-                                added_fields.append(
-                                    item.split('[')[1][0:-1].strip('\'')
-                                )
-
-                        if 'dictionary_item_removed' in res:
-                            for item in res['dictionary_item_removed']:
-                                deleted_fields.append(
-                                    item.split('[')[1][0:-1].strip('\'')
-                                )
-
-                        if deleted_fields:
-                            msg.append(
-                                {'deleted': {
-                                    'fields': [field],
-                                    'object': sorted(deleted_fields)
-                                }}
-                            )
-
-                        if changed_fields:
-                            msg.append(
-                                {'changed': {
-                                    'fields': [field],
-                                    'object': sorted(changed_fields)
-                                }}
-                            )
-
-                        if added_fields:
-                            msg.append(
-                                {'added': {'fields': [field],
-                                           'object': sorted(added_fields)}}
-                            )
-
-                    else:
-                        if not value['new_value']:
-                            deleted.append(field)
-
-                        elif not value['old_value']:
-                            added.append(field)
-
-                        else:
-                            if field != 'tags':
-                                changed.append(field)
-
-                except KeyError:
-                    pass
-
-        if added:
-            msg.append({'added': {'fields': sorted(list(set(added)))}})
-        if changed:
-            msg.append({'changed': {'fields': sorted(list(set(changed)))}})
-        if deleted:
-            msg.append({'deleted': {'fields': sorted(list(set(deleted)))}})
-
-        return json.dumps(msg)
+    # foreign keys are serialized as lists of their natural keys
+    passed = 0
+    # groups and rules are reported by name of group and metric of rule
+    names = {
+        'groups': ('name', {'added': [], 'deleted': []}),
+        'rules': ('metric', {'added': [], 'deleted': []})
+    }
+    for kind, action in [
+        ('iterable_item_removed', 'deleted'), ('iterable_item_added', 'added')
+    ]:
+        for field, old, new in res.get(kind, []):
+            value = new if action == 'added' else old
+            if field in FOREIGNKEYS:
+                passed += 1
+
+            elif field in names:
+                key, items = names[field]
+                items[action].append(value[key])
+
+            else:
+                msg.append({action: {'fields': [field], 'object': value}})
+
+    for field in ['groups', 'rules']:
+        items = names[field][1]
+        msg.extend(_named_items(field, items['added'], items['deleted']))
+
+    if passed > 0:
+        res = _field_differences(old_data, new_data, ordered=True)
+
+    for field, old, new in res.get('dictionary_item_added', []):
+        added.append(field)
+
+    for field, old, new in res.get('type_changes', []):
+        if new is None:
+            deleted.append(field)
+
+        if old is None:
+            added.append(field)
+
+        if new is not None and old is not None:
+            changed.append(field)
+
+    for field, old, new in res.get('values_changed', []):
+        try:
+            if field in INLINES:
+                msg.extend(_inline_differences(field, old, new))
+
+            elif not new:
+                deleted.append(field)
+
+            elif not old:
+                added.append(field)
+
+            elif field != 'tags':
+                changed.append(field)
+
+        except KeyError:
+            pass
+
+    if added:
+        msg.append({'added': {'fields': sorted(set(added))}})
+    if changed:
+        msg.append({'changed': {'fields': sorted(set(changed))}})
+    if deleted:
+        msg.append({'deleted': {'fields': sorted(set(deleted))}})
+
+    return json.dumps(msg)
+
+
+def _history_head(instance):
+    if isinstance(instance, admin_models.Probe):
+        return admin_models.get_history_head(
+            admin_models.ProbeHistoryHead, admin_models.ProbeHistory, instance
+        )
+
     else:
-        return 'Initial version.'
+        return admin_models.get_history_head(
+            admin_models.MetricTemplateHistoryHead,
+            admin_models.MetricTemplateHistory, instance
+        )
 
 
-def create_comment(instance, ct=None, new_serialized_data=None):
-    if isinstance(instance, (admin_models.Probe, admin_models.MetricTemplate)):
-        if isinstance(instance, admin_models.Probe):
-            history_model = admin_models.ProbeHistory
-        else:
-            history_model = admin_models.MetricTemplateHistory
+def _version_to_dict(history):
+    if history is None:
+        return ''
+
+    data = to_dict(history)
+    del data['object_id'], data['version_comment'], \
+        data['version_user'], data['date_created']
+
+    return data
 
-        history = history_model.objects.filter(object_id=instance) \
-            .order_by('-date_created')
 
+def create_comment(instance, ct=None, new_serialized_data=None):
+    if isinstance(instance, (admin_models.Probe, admin_models.MetricTemplate)):
         new_data = to_dict(instance)
         if isinstance(instance, admin_models.Probe):
             del new_data['user'], new_data['datetime']
 
+        old_data = _version_to_dict(_history_head(instance)[0])
+
     else:
-        history = poem_models.TenantHistory.objects.filter(
-            object_id=instance.id,
-            content_type=ct
-        ).order_by('-date_created')
         new_data = serialized_data_to_dict(new_serialized_data)
 
-    if len(history) > 0:
-        if isinstance(
-                instance,
-                (poem_models.Metric, poem_models.MetricProfiles,
-                 poem_models.Aggregation, poem_models.ThresholdsProfiles)
-        ):
-            old_data = serialized_data_to_dict(history[0].serialized_data)
+        serialized_data = poem_models.get_latest_serialized_data(
+            instance.id, ct
+        )
+        if serialized_data:
+            old_data = serialized_data_to_dict(serialized_data)
         else:
-            old_data = to_dict(history[0])
-            del old_data['object_id'], old_data['version_comment'], \
-                old_data['version_user'], old_data['date_created']
-    else:
-        old_data = ''
+            old_data = ''
 
     return analyze_differences(old_data, new_data)
 
 
 def update_comment(instance):
-    if isinstance(instance, admin_models.Probe):
-        history_model = admin_models.ProbeHistory
-
-    else:
-        history_model = admin_models.MetricTemplateHistory
-
-    history = history_model.objects.filter(object_id=instance)\
-        .order_by('-date_created')
-
     new_data = to_dict(instance)
     if isinstance(instance, admin_models.Probe):
         del new_data['user'], new_data['datetime']
 
-    if len(history) > 1:
-        old_data = to_dict(history[1])
-        del old_data['object_id'], old_data['version_comment'], \
-            old_data['version_user'], old_data['date_created']
-
-    else:
-        old_data = ''
+    old_data = _version_to_dict(_history_head(instance)[1])
 
     return analyze_differences(old_data, new_data)
 
@@ -419,15 +452,26 @@ def create_profile_history(instance, data, user, description=None):
             'metricinstances': mis
         })
 
+        poem_models.set_profile_metrics({instance: mis})
+
         serialized_data[0]['fields'].update({
             'description': description
         })
 
-    elif isinstance(
-            instance, (poem_models.Aggregation, poem_models.ThresholdsProfiles)
-    ):
+    elif isinstance(instance, poem_models.Aggregation):
         serialized_data[0]['fields'].update(**data)
 
+        poem_models.set_aggregation_contents(
+            {instance: poem_models.aggregation_from_webapi(data)}
+        )
+
+    elif isinstance(instance, poem_models.ThresholdsProfiles):
+        serialized_data[0]['fields'].update(**data)
+
+        poem_models.set_thresholds_rules(
+            {instance: poem_models.thresholds_rules_from_webapi(data)}
+        )
+
     comment = create_comment(instance, ct, json.dumps(serialized_data))
 
     poem_models.TenantHistory.objects.create(
@@ -0,0 +1,240 @@
+import datetime
+import re
+
+from django.db import NotSupportedError, connection, transaction
+
+PARTITION_KEY = 'date_created'
+# default partition, primary key and indexes on partitioned table
+MIN_PG_VERSION = 110000
+
+
+def _month(date, months=0):
+    month = date.year * 12 + date.month - 1 + months
+    return datetime.date(month // 12, month % 12 + 1, 1)
+
+
+def _qualified(table):
+    return '{}.{}'.format(
+        connection.ops.quote_name(connection.schema_name),
+        connection.ops.quote_name(table)
+    )
+
+
+def check_pg_version():
+    """
+    Raises NotSupportedError if PostgreSQL server is too old for history
+    partitions.
+    """
+    if connection.pg_version < MIN_PG_VERSION:
+        raise NotSupportedError(
+            'Partitioning of history tables needs PostgreSQL {} or newer, '
+            'server version is {}.'.format(
+                MIN_PG_VERSION // 10000, connection.pg_version // 10000
+            )
+        )
+
+
+def partition_name(table, month):
+    return '{}_p{:%Y%m}'.format(table, month)
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind FROM pg_class c "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = %s AND c.relname = %s",
+            [connection.schema_name, table]
+        )
+        row = cursor.fetchone()
+
+    return bool(row) and row[0] == 'p'
+
+
+def get_partitions(table):
+    """
+    Returns list of (partition name, first day of its month) of monthly
+    partitions attached to table, ordered by month.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [_qualified(table)]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    pattern = re.compile(r'^{}_p(\d{{4}})(\d{{2}})$'.format(re.escape(table)))
+    partitions = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions.append((
+                name,
+                datetime.date(int(match.group(1)), int(match.group(2)), 1)
+            ))
+
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def create_partitions(table, months=3):
+    """
+    Creates monthly partitions of partitioned table, for the current month
+    and the given number of months ahead, and default partition for rows
+    outside of them. Creating partition fails if default
+    partition already holds rows of its month. Returns names of created
+    partitions.
+    """
+    check_pg_version()
+    existing = set(name for name, month in get_partitions(table))
+    created = []
+
+    with connection.cursor() as cursor:
+        month = _month(datetime.date.today())
+        while month <= _month(datetime.date.today(), months):
+            name = partition_name(table, month)
+            if name not in existing:
+                cursor.execute(
+                    "CREATE TABLE {} PARTITION OF {} "
+                    "FOR VALUES FROM (%s) TO (%s)".format(
+                        _qualified(name), _qualified(table)
+                    ), [month, _month(month, 1)]
+                )
+                created.append(name)
+
+            month = _month(month, 1)
+
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT".format(
+                _qualified(table + '_default'), _qualified(table)
+            )
+        )
+
+    return created
+
+
+def partition_table(table, months=3):
+    """
+    Turns table into table partitioned by range of date_created, with one
+    partition per month, moving existing rows into partitions. Partitions
+    are created up to the given number of months ahead. Primary key
+    becomes (id, date_created); other indexes and foreign keys of the
+    table are created again on the partitioned table. Nothing is done if
+    table is already partitioned. Returns True if table was partitioned.
+
+    Table is locked while its rows are copied, and no foreign key may
+    reference it. PostgreSQL 11 or newer is needed.
+    """
+    if is_partitioned(table):
+        return False
+
+    check_pg_version()
+
+    old = table + '_unpartitioned'
+    with transaction.atomic(), connection.cursor() as cursor:
+        # pending checks of deferred constraints would prevent ALTER TABLE
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(
+            'LOCK TABLE {} IN ACCESS EXCLUSIVE MODE'.format(_qualified(table))
+        )
+
+        cursor.execute(
+            "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+            "WHERE i.indrelid = %s::regclass AND NOT i.indisprimary",
+            [_qualified(table)]
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [_qualified(table)]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, 'id')", [_qualified(table)]
+        )
+        sequence = cursor.fetchone()[0]
+        cursor.execute(
+            'SELECT min({}) FROM {}'.format(PARTITION_KEY, _qualified(table))
+        )
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute('ALTER TABLE {} RENAME TO {}'.format(
+            _qualified(table), connection.ops.quote_name(old)
+        ))
+        cursor.execute(
+            'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS) '
+            'PARTITION BY RANGE ({})'.format(
+                _qualified(table), _qualified(old), PARTITION_KEY
+            )
+        )
+
+        month = _month(oldest) if oldest else _month(datetime.date.today())
+        while month < _month(datetime.date.today()):
+            cursor.execute(
+                "CREATE TABLE {} PARTITION OF {} "
+                "FOR VALUES FROM (%s) TO (%s)".format(
+                    _qualified(partition_name(table, month)),
+                    _qualified(table)
+                ), [month, _month(month, 1)]
+            )
+            month = _month(month, 1)
+
+        create_partitions(table, months)
+
+        cursor.execute('INSERT INTO {} SELECT * FROM {}'.format(
+            _qualified(table), _qualified(old)
+        ))
+        if sequence:
+            cursor.execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(
+                sequence, _qualified(table)
+            ))
+        cursor.execute('DROP TABLE {}'.format(_qualified(old)))
+
+        cursor.execute('ALTER TABLE {} ADD PRIMARY KEY (id, {})'.format(
+            _qualified(table), PARTITION_KEY
+        ))
+        # definitions were read before rename, so they name the new table
+        for index in indexes:
+            cursor.execute(index)
+
+        for name, definition in foreign_keys:
+            cursor.execute('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(
+                _qualified(table), connection.ops.quote_name(name),
+                definition
+            ))
+
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+    return True
+
+
+def detach_partitions(table, before, in_use=None):
+    """
+    Detaches monthly partitions holding only rows created before the given
+    date. Detached partitions are kept as standalone tables, which can be
+    archived and dropped. Partitions having any row matching in_use SQL
+    condition are skipped. Returns names of detached partitions.
+    """
+    detached = []
+    with connection.cursor() as cursor:
+        for name, month in get_partitions(table):
+            if _month(month, 1) > before:
+                break
+
+            if in_use:
+                cursor.execute(
+                    'SELECT EXISTS (SELECT 1 FROM {} WHERE {})'.format(
+                        _qualified(name), in_use
+                    )
+                )
+                if cursor.fetchone()[0]:
+                    continue
+
+            cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(
+                _qualified(table), _qualified(name)
+            ))
+            detached.append(name)
+
+    return detached
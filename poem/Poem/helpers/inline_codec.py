@@ -0,0 +1,105 @@
+import json
+from functools import lru_cache
+
+CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse(raw):
+    items = []
+    for item in json.loads(raw):
+        key, sep, value = item.partition(' ')
+        items.append((key, value if sep else None))
+
+    return tuple(items)
+
+
+def inline_items(value):
+    """
+    Returns tuple of (key, value) tuples from inline field value. Value is
+    None for items without space. Field value may be JSON encoded list of
+    "key value" strings, list of {'key': ..., 'value': ...} dicts, or value
+    read from InlineField, which already carries parsed pairs.
+    """
+    pairs = getattr(value, 'pairs', None)
+    if pairs is not None:
+        return tuple((pair['key'], pair['value']) for pair in pairs)
+
+    if not value:
+        return ()
+
+    if isinstance(value, str):
+        return _parse(value)
+
+    items = []
+    for item in value:
+        if isinstance(item, dict):
+            items.append((item['key'], item['value']))
+
+        else:
+            key, sep, val = item.partition(' ')
+            items.append((key, val if sep else None))
+
+    return tuple(items)
+
+
+def decode_inline(value):
+    """
+    Returns list of {'key': ..., 'value': ...} dicts, as used in API.
+    """
+    return [{'key': k, 'value': v or ''} for k, v in inline_items(value)]
+
+
+def decode_inline_dict(value):
+    """
+    Returns {key: value} dict. If key is repeated, the last value is kept.
+    """
+    return dict((k, v or '') for k, v in inline_items(value))
+
+
+def decode_inline_pairs(value):
+    """
+    Returns list of {'key': ..., 'value': ...} dicts, keeping None for items
+    without space, as stored in jsonb column of InlineField.
+    """
+    return [{'key': k, 'value': v} for k, v in inline_items(value)]
+
+
+def encode_inline(data):
+    """
+    Encodes list of {'key': ..., 'value': ...} dicts, as received from API,
+    into JSON encoded list of "key value" strings. Items with empty key are
+    left out. Inverse of decode_inline().
+    """
+    result = []
+    for item in data:
+        if item['key']:
+            result.append('{} {}'.format(item['key'], item['value']))
+
+    if result:
+        return json.dumps(result)
+
+    else:
+        return ''
+
+
+def encode_inline_dict(data):
+    """
+    Inverse of decode_inline_dict().
+    """
+    return encode_inline([{'key': k, 'value': v} for k, v in data.items()])
+
+
+def encode_inline_pairs(pairs):
+    """
+    Inverse of decode_inline_pairs(): items with None value are encoded
+    without space, so the original string is restored.
+    """
+    if pairs:
+        return json.dumps([
+            pair['key'] if pair['value'] is None else
+            '{} {}'.format(pair['key'], pair['value']) for pair in pairs
+        ])
+
+    else:
+        return ''
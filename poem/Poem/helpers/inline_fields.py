@@ -0,0 +1,46 @@
+from Poem.helpers.inline_codec import decode_inline_pairs, \
+    encode_inline_pairs
+from django.contrib.postgres.fields import JSONField
+
+
+class InlineValue(str):
+    """
+    Inline field value as seen by the rest of the code: the legacy JSON
+    encoded string, with parsed pairs kept alongside it.
+    """
+    def __new__(cls, pairs):
+        obj = super().__new__(cls, encode_inline_pairs(pairs))
+        obj.pairs = pairs
+        return obj
+
+    def __getnewargs__(self):
+        return (self.pairs,)
+
+
+class InlineField(JSONField):
+    """
+    Inline field (config, attribute, flags...) stored in jsonb column as
+    ordered list of key/value objects. It accepts and returns values in the
+    legacy string format, so existing API shapes are kept.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default', str)
+        super().__init__(*args, **kwargs)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return value
+
+        return super().get_prep_value(decode_inline_pairs(value))
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+
+        return InlineValue(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, InlineValue):
+            return value
+
+        return InlineValue(decode_inline_pairs(value))
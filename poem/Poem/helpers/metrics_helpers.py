@@ -1,16 +1,21 @@
-import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from Poem.api.internal_views.utils import sync_webapi
 from Poem.api.models import MyAPIKey
+from Poem.helpers import webapi
 from Poem.helpers.history_helpers import create_history
+from Poem.helpers.inline_codec import decode_inline_pairs, \
+    encode_inline_pairs
+from Poem.helpers.tenant_helpers import run_in_tenants, raise_tenant_errors
 from Poem.poem import models as poem_models
 from Poem.poem_super_admin import models as admin_models
-from Poem.tenants.models import Tenant
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core import serializers
-from django.db import IntegrityError
-from tenant_schemas.utils import schema_context, get_public_schema_name
+from django.db import IntegrityError, connection
+from tenant_schemas.utils import schema_context
 
 
 def import_metrics(metrictemplates, tenant, user):
@@ -126,36 +131,14 @@ def import_metrics(metrictemplates, tenant, user):
 
 
 def get_metrics_in_profiles(schema):
+    """
+    Returns dict of metric names to names of tenant's metric profiles they
+    are in. Profiles are read from DB, synced with WEB-API first, since
+    metrics are deleted based on them.
+    """
     with schema_context(schema):
         try:
-            token = MyAPIKey.objects.get(name='WEB-API')
-            headers = {
-                'Accept': 'application/json', 'x-api-key': token.token
-            }
-
-            response = requests.get(
-                settings.WEBAPI_METRIC, headers=headers, timeout=180
-            )
-            response.raise_for_status()
-
-            data = response.json()['data']
-            metrics_dict = dict()
-            for item in data:
-                for service in item['services']:
-                    if 'metrics' in service:
-                        for metric in service['metrics']:
-                            if metric not in metrics_dict:
-                                metrics_dict.update({
-                                    metric: [item['name']]
-                                })
-
-                            else:
-                                metrics_dict.update({
-                                    metric:
-                                        metrics_dict[metric] + [item['name']]
-                                })
-
-            return metrics_dict
+            sync_webapi(settings.WEBAPI_METRIC, poem_models.MetricProfiles)
 
         except requests.exceptions.HTTPError:
             raise
@@ -163,213 +146,268 @@ def get_metrics_in_profiles(schema):
         except MyAPIKey.DoesNotExist:
             raise Exception('Error fetching WEB API data: API key not found.')
 
+        rows = poem_models.MetricProfileMetric.objects.order_by(
+            'profile__name'
+        ).values_list('metric', 'profile__name').distinct()
 
-def update_metrics(metrictemplate, name, probekey, user=''):
-    schemas = list(Tenant.objects.all().values_list('schema_name', flat=True))
-    schemas.remove(get_public_schema_name())
+        metrics_dict = dict()
+        for metric, profile in rows:
+            metrics_dict.setdefault(metric, []).append(profile)
 
-    msgs = []
-    for schema in schemas:
-        with schema_context(schema):
-            try:
-                met = poem_models.Metric.objects.get(
-                    name=name, probekey=probekey
-                )
-                met.name = metrictemplate.name
-                met.probekey = metrictemplate.probekey
-                met.probeexecutable = metrictemplate.probeexecutable
-                met.description = metrictemplate.description
-                met.parent = metrictemplate.parent
-                met.attribute = metrictemplate.attribute
-                met.dependancy = metrictemplate.dependency
-                met.flags = metrictemplate.flags
-                met.files = metrictemplate.files
-                met.parameter = metrictemplate.parameter
-                met.fileparameter = metrictemplate.fileparameter
-
-                if metrictemplate.config:
-                    for item in json.loads(metrictemplate.config):
-                        if item.split(' ')[0] == 'path':
-                            objpath = item
-
-                    metconfig = []
-                    for item in json.loads(met.config):
-                        if item.split(' ')[0] == 'path':
-                            metconfig.append(objpath)
-                        else:
-                            metconfig.append(item)
-
-                    met.config = json.dumps(metconfig)
-
-                met.save()
+        return metrics_dict
 
-                new_tags = set([tag.name for tag in metrictemplate.tags.all()])
-                old_tags = set([tag.name for tag in met.tags.all()])
-                if new_tags.difference(old_tags):
-                    for tag_name in new_tags.difference(old_tags):
-                        met.tags.add(
-                            admin_models.MetricTags.objects.get(name=tag_name)
-                        )
 
-                if old_tags.difference(new_tags):
-                    for tag_name in old_tags.difference(new_tags):
-                        met.tags.remove(
-                            admin_models.MetricTags.objects.get(name=tag_name)
-                        )
+def _update_metric(metrictemplate, name, probekey, user):
+    try:
+        met = poem_models.Metric.objects.get(name=name, probekey=probekey)
+
+    except poem_models.Metric.DoesNotExist:
+        return False
+
+    met.name = metrictemplate.name
+    met.probekey = metrictemplate.probekey
+    met.probeexecutable = metrictemplate.probeexecutable
+    met.description = metrictemplate.description
+    met.parent = metrictemplate.parent
+    met.attribute = metrictemplate.attribute
+    met.dependancy = metrictemplate.dependency
+    met.flags = metrictemplate.flags
+    met.files = metrictemplate.files
+    met.parameter = metrictemplate.parameter
+    met.fileparameter = metrictemplate.fileparameter
+
+    if metrictemplate.config:
+        for item in decode_inline_pairs(metrictemplate.config):
+            if item['key'] == 'path':
+                objpath = item
+
+        metconfig = []
+        for item in decode_inline_pairs(met.config):
+            if item['key'] == 'path':
+                metconfig.append(objpath)
+            else:
+                metconfig.append(item)
 
-                if met.probekey != probekey:
-                    create_history(met, user)
+        met.config = encode_inline_pairs(metconfig)
 
-                else:
-                    history = poem_models.TenantHistory.objects.filter(
-                        object_id=met.id,
-                        content_type=ContentType.objects.get_for_model(
-                            poem_models.Metric
-                        )
-                    )[0]
-                    history.serialized_data = serializers.serialize(
-                        'json', [met],
-                        use_natural_foreign_keys=True,
-                        use_natural_primary_keys=True
-                    )
-                    history.object_repr = met.__str__()
-                    history.save()
+    met.save()
 
-                if name != met.name:
-                    msgs = update_metrics_in_profiles(name, met.name)
+    new_tags = set([tag.name for tag in metrictemplate.tags.all()])
+    old_tags = set([tag.name for tag in met.tags.all()])
+    if new_tags.difference(old_tags):
+        for tag_name in new_tags.difference(old_tags):
+            met.tags.add(admin_models.MetricTags.objects.get(name=tag_name))
 
+    if old_tags.difference(new_tags):
+        for tag_name in old_tags.difference(new_tags):
+            met.tags.remove(
+                admin_models.MetricTags.objects.get(name=tag_name)
+            )
 
-            except poem_models.Metric.DoesNotExist:
-                continue
+    if met.probekey != probekey:
+        create_history(met, user)
+
+    else:
+        history = poem_models.TenantHistory.objects.filter(
+            object_id=met.id,
+            content_type=ContentType.objects.get_for_model(poem_models.Metric)
+        )[0]
+        history.serialized_data = serializers.serialize(
+            'json', [met],
+            use_natural_foreign_keys=True,
+            use_natural_primary_keys=True
+        )
+        history.object_repr = met.__str__()
+        history.save()
+
+    return True
+
+
+def update_metrics(metrictemplate, name, probekey, user=''):
+    results = run_in_tenants(
+        _update_metric, metrictemplate, name, probekey, user
+    )
+    raise_tenant_errors(results)
+
+    msgs = []
+    if name != metrictemplate.name and any(r.result for r in results):
+        msgs = update_metrics_in_profiles(name, metrictemplate.name)
 
     return msgs
 
 
-def update_metrics_in_profiles(old_name, new_name):
-    error_msgs = []
-    if old_name == new_name:
-        pass
+def _update_metric_in_profiles(old_name, new_name):
+    schema = connection.schema_name
+    writeback = MetricProfilesWriteBack()
+    writeback.rename(old_name, new_name)
+    try:
+        failures = writeback.flush()
 
-    else:
-        schemas = list(Tenant.objects.all().values_list(
-            'schema_name', flat=True
-        ))
-        schemas.remove(get_public_schema_name())
+    except requests.exceptions.HTTPError as e:
+        failures = [(None, [], e)]
 
-        for schema in schemas:
-            with schema_context(schema):
-                try:
-                    token = MyAPIKey.objects.get(name='WEB-API')
-                    headers = {
-                        'Accept': 'application/json', 'x-api-key': token.token
-                    }
-
-                    response = requests.get(
-                        settings.WEBAPI_METRIC, headers=headers, timeout=180
-                    )
-                    response.raise_for_status()
-
-                    data = response.json()['data']
-
-                    for profile in data:
-                        flag = 0
-                        new_services = []
-                        for service in profile['services']:
-                            new_metrics = []
-                            if 'metrics' in service:
-                                for metric in service['metrics']:
-                                    if metric == old_name:
-                                        flag += 1
-                                        new_metrics.append(new_name)
-                                    else:
-                                        new_metrics.append(metric)
-                            new_services.append({
-                                'service': service['service'],
-                                'metrics': new_metrics
-                            })
-
-                        if flag > 0:
-                            new_data = {
-                                'id': profile['id'],
-                                'name': profile['name'],
-                                'description': profile['description'],
-                                'services': new_services
-                            }
-                            response = requests.put(
-                                settings.WEBAPI_METRIC + '/' + profile['id'],
-                                headers=headers,
-                                data=json.dumps(new_data)
-                            )
-                            response.raise_for_status()
+    except MyAPIKey.DoesNotExist:
+        return [
+            '{}: No "WEB-API" key in the DB!'
+            '\nPlease update metric profiles manually.'.format(
+                schema.upper()
+            )
+        ]
 
-                except requests.exceptions.HTTPError as e:
-                    error_msgs.append(
-                        '{}: Error trying to update metric in metric profiles: '
-                        '{}.\nPlease update metric profiles manually.'.format(
-                            schema.upper(), e
-                        )
-                    )
-                    continue
+    return [
+        '{}: Error trying to update metric in metric profiles: '
+        '{}.\nPlease update metric profiles manually.'.format(
+            schema.upper(), e
+        ) for profile, metrics, e in failures
+    ]
 
-                except MyAPIKey.DoesNotExist:
-                    error_msgs.append(
-                        '{}: No "WEB-API" key in the DB!'
-                        '\nPlease update metric profiles manually.'.format(
-                            schema.upper()
-                        )
-                    )
-                    continue
+
+def update_metrics_in_profiles(old_name, new_name):
+    error_msgs = []
+    if old_name != new_name:
+        results = run_in_tenants(
+            _update_metric_in_profiles, old_name, new_name
+        )
+        raise_tenant_errors(results)
+
+        for result in results:
+            error_msgs.extend(result.result)
 
     return error_msgs
 
 
-def delete_metrics_from_profile(profile, metrics):
-    try:
-        profile_id = poem_models.MetricProfiles.objects.get(name=profile).apiid
-        token = MyAPIKey.objects.get(name='WEB-API')
-        headers = {
-            'Accept': 'application/json', 'x-api-key': token.token
-        }
-        if settings.WEBAPI_METRIC.endswith('/'):
-            url = settings.WEBAPI_METRIC + profile_id
+class MetricProfilesWriteBack:
+    """
+    Collects renames and removals of metrics done in tenant's metric profiles
+    during one operation, so that profiles are fetched from WEB-API once and
+    each changed profile is sent back once, with all the changes applied.
+    """
+    def __init__(self):
+        self.profiles = None
+        self.renamed = dict()
+        self.removed = []
 
-        else:
-            url = settings.WEBAPI_METRIC + '/' + profile_id
+    def fetch(self):
+        """
+        Returns tenant's metric profiles, fetched from WEB-API on first call.
+        """
+        if self.profiles is None:
+            self.profiles = webapi.get_data(settings.WEBAPI_METRIC)
 
-        response = requests.get(url, headers=headers, timeout=180)
-        response.raise_for_status()
+        return self.profiles
 
-        data = response.json()['data'][0]
+    def rename(self, old_name, new_name):
+        if old_name != new_name:
+            self.renamed[old_name] = new_name
 
+    def remove(self, *metrics):
         for metric in metrics:
-            for item in data['services']:
-                if 'metrics' in item:
-                    if metric in item['metrics']:
-                        item['metrics'].remove(metric)
-                        if not item['metrics']:
-                            data['services'].remove(item)
-
-        send_data = {
-            'id': data['id'],
-            'name': data['name'],
-            'description': data['description'],
-            'services': data['services']
+            if metric not in self.removed:
+                self.removed.append(metric)
+
+    def _apply(self, profile):
+        changed = False
+        removed = set()
+        services = []
+        for service in profile['services']:
+            if 'metrics' not in service:
+                services.append(service)
+                continue
+
+            metrics = []
+            for metric in service['metrics']:
+                if metric in self.removed:
+                    removed.add(metric)
+                    continue
+
+                metrics.append(self.renamed.get(metric, metric))
+
+            if metrics != service['metrics']:
+                changed = True
+                # service is left out only if all its metrics are removed
+                if not metrics and removed:
+                    continue
+
+            services.append(dict(service, metrics=metrics))
+
+        if not changed:
+            return None, []
+
+        data = {
+            'id': profile['id'],
+            'name': profile['name'],
+            'description': profile['description'],
+            'services': services
         }
 
-        response = requests.put(
-            url, headers=headers, data=json.dumps(send_data)
-        )
-        response.raise_for_status()
+        return data, [metric for metric in self.removed if metric in removed]
 
-    except MyAPIKey.DoesNotExist:
-        raise Exception(
-            'Error deleting metric from profile: API key not found.'
-        )
+    @staticmethod
+    def _put(schema, data, close, end=None):
+        try:
+            with schema_context(schema):
+                if end is None:
+                    webapi.put_data(settings.WEBAPI_METRIC, data['id'], data)
+
+                else:
+                    with webapi.deadline(end - time.monotonic()):
+                        webapi.put_data(
+                            settings.WEBAPI_METRIC, data['id'], data
+                        )
+
+        except Exception as e:
+            return e
+
+        finally:
+            if close:
+                connection.close()
+
+    def flush(self):
+        """
+        Sends changed profiles back to WEB-API, at most WEBAPI_POOL_SIZE of
+        them at the same time (one by one if called inside transaction, as
+        in run_in_tenants()). Returns list of (profile name, removed metrics,
+        exception) tuples for profiles which have not been updated. Errors of
+        fetching profiles are raised. Metrics of updated profiles are saved
+        in MetricProfileMetric table.
+        """
+        changes = []
+        for profile in self.fetch():
+            data, removed = self._apply(profile)
+            if data:
+                changes.append((data, removed))
+
+        self.renamed = dict()
+        self.removed = []
+
+        schema = connection.schema_name
+        workers = min(settings.WEBAPI_POOL_SIZE, len(changes))
+        if workers <= 1 or connection.in_atomic_block:
+            errors = [self._put(schema, data, False) for data, r in changes]
 
-    except poem_models.MetricProfiles.DoesNotExist:
-        raise Exception(
-            'Error deleting metric from profile: Profile not found.'
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # each worker thread opens its own connection if token is not
+                # cached, so it is closed after each call
+                end = webapi.get_deadline()
+                errors = list(executor.map(
+                    lambda change: self._put(schema, change[0], True, end),
+                    changes
+                ))
+
+        updated = dict(
+            (data['id'], poem_models.metrics_from_webapi(data))
+            for (data, removed), error in zip(changes, errors) if not error
         )
+        if updated:
+            poem_models.set_profile_metrics(dict(
+                (profile, updated[profile.apiid]) for profile in
+                poem_models.MetricProfiles.objects.filter(
+                    apiid__in=updated.keys()
+                )
+            ))
 
-    except requests.exceptions.HTTPError:
-        raise
+        return [
+            (data['name'], removed, error) for (data, removed), error in
+            zip(changes, errors) if error
+        ]
@@ -0,0 +1,104 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from Poem.helpers import webapi
+from Poem.tenants.models import Tenant
+from django.conf import settings
+from django.db import connection
+from tenant_schemas.utils import schema_context, get_public_schema_name
+
+TenantResult = namedtuple('TenantResult', ['schema', 'result', 'error'])
+
+
+def get_tenant_schemas():
+    return list(
+        Tenant.objects.exclude(
+            schema_name=get_public_schema_name()
+        ).order_by('schema_name').values_list('schema_name', flat=True)
+    )
+
+
+def _call_in_schema(schema, func, args, kwargs, end=None):
+    try:
+        with schema_context(schema):
+            if end is None:
+                return TenantResult(schema, func(*args, **kwargs), None)
+
+            # carry over the limit on WEB-API calls of the calling thread
+            with webapi.deadline(end - time.monotonic()):
+                return TenantResult(schema, func(*args, **kwargs), None)
+
+    except Exception as e:
+        return TenantResult(schema, None, e)
+
+
+def _worker(schemas, results, func, args, kwargs, end):
+    try:
+        while True:
+            try:
+                i, schema = schemas.get_nowait()
+
+            except queue.Empty:
+                break
+
+            results[i] = _call_in_schema(schema, func, args, kwargs, end)
+
+    finally:
+        # each worker thread has opened its own connection
+        connection.close()
+
+
+def run_in_tenants(func, *args, schemas=None, workers=None, **kwargs):
+    """
+    Calls func(*args, **kwargs) in each of the tenant schemas (all of them
+    if schemas are not given) and returns list of TenantResult, in the same
+    order as schemas. Exceptions raised by func are returned in error field
+    of the tenant's result instead of being raised.
+
+    Schemas are processed on at most workers threads, each with its own DB
+    connection switched to the schema being processed. If called inside
+    transaction, schemas are processed one by one in the calling thread,
+    since other connections would not see its uncommitted changes.
+    """
+    if schemas is None:
+        schemas = get_tenant_schemas()
+
+    if workers is None:
+        workers = settings.TENANT_WORKERS
+
+    workers = min(workers, len(schemas))
+
+    if workers <= 1 or connection.in_atomic_block:
+        return [
+            _call_in_schema(schema, func, args, kwargs) for schema in schemas
+        ]
+
+    todo = queue.Queue()
+    for item in enumerate(schemas):
+        todo.put(item)
+
+    results = [None] * len(schemas)
+    end = webapi.get_deadline()
+    threads = [
+        threading.Thread(
+            target=_worker, args=(todo, results, func, args, kwargs, end)
+        ) for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def raise_tenant_errors(results):
+    """
+    Raises error of the first tenant whose call has failed.
+    """
+    for result in results:
+        if result.error:
+            raise result.error
@@ -3,10 +3,13 @@ from django.utils.text import get_text_list
 from gettext import gettext
 import json
 
-from Poem.poem.models import *
-
 
 iterable_fields = ['metricinstances']
+# fields whose changes are not shown in comments of tenant history
+untracked_fields = [
+    'mtype', 'parent', 'probeexecutable', 'attribute', 'dependancy', 'flags',
+    'files', 'parameter', 'fileparameter'
+]
 
 
 def msg_with_object(msg, action):
@@ -165,3 +168,44 @@ def new_comment(comment):
 
     else:
         return comment
+
+
+def tenant_comment(comment, metric=False):
+    """Makes plaintext message from comment of tenant history entry, leaving
+    out changes of untracked fields (and names, for metrics)."""
+    try:
+        fields = untracked_fields + ['name'] if metric else untracked_fields
+
+        messages = []
+        for item in json.loads(comment):
+            if 'changed' in item:
+                action = 'changed'
+
+            elif 'added' in item:
+                action = 'added'
+
+            else:
+                action = 'deleted'
+
+            if 'object' not in item[action]:
+                new_fields = []
+                for field in item[action]['fields']:
+                    if field not in fields:
+                        new_fields.append(field)
+
+                if new_fields:
+                    messages.append({action: {'fields': new_fields}})
+
+            else:
+                if item[action]['fields'][0] not in fields:
+                    if item[action]['fields'][0] == 'config':
+                        if 'path' in item[action]['object']:
+                            item[action]['object'].remove('path')
+                    messages.append(item)
+
+        comment = json.dumps(messages)
+
+    except json.JSONDecodeError:
+        pass
+
+    return new_comment(comment)
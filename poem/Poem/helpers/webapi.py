@@ -0,0 +1,381 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+from Poem.api.models import MyAPIKey
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from urllib3.util.retry import Retry
+
+TOKEN_NAME = 'WEB-API'
+# how long token read from tenant's DB is used before it is read again
+TOKEN_TTL = 300
+RETRY_STATUSES = (502, 503, 504)
+# number of the most recent calls to endpoint circuit breaker looks at
+BREAKER_WINDOW = 20
+
+logger = logging.getLogger('POEM')
+
+_sessions = dict()
+_session_lock = threading.Lock()
+_tokens = dict()
+_stats = dict()
+_stats_lock = threading.Lock()
+_breakers = dict()
+_breakers_lock = threading.Lock()
+_last_good = dict()
+_local = threading.local()
+
+
+class WebAPIUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'WEB-API is currently unavailable.'
+    default_code = 'webapi_unavailable'
+
+
+class CircuitBreaker:
+    """
+    Keeps outcomes of the recent calls to WEB-API endpoint. Once at least
+    WEBAPI_BREAKER_MIN_CALLS calls are made, and share of the failed ones
+    reaches WEBAPI_BREAKER_THRESHOLD, breaker opens and calls are refused
+    for WEBAPI_BREAKER_COOLDOWN seconds. After that a single probe call is
+    let through (half-open breaker): breaker closes if it succeeds, and
+    opens again if it fails.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = deque(maxlen=BREAKER_WINDOW)
+        self._opened = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened is None:
+                return 'closed'
+
+            elif self._probing or time.monotonic() - self._opened < \
+                    settings.WEBAPI_BREAKER_COOLDOWN:
+                return 'open'
+
+            else:
+                return 'half-open'
+
+    def acquire(self):
+        """
+        Returns True if call is a probe of half-open breaker, False for
+        regular call. Raises WebAPIUnavailable if breaker is open.
+        """
+        with self._lock:
+            if self._opened is None:
+                return False
+
+            if self._probing or time.monotonic() - self._opened < \
+                    settings.WEBAPI_BREAKER_COOLDOWN:
+                raise WebAPIUnavailable()
+
+            self._probing = True
+            return True
+
+    def record(self, failed, probe=False):
+        with self._lock:
+            if probe:
+                self._probing = False
+                if failed:
+                    self._opened = time.monotonic()
+
+                else:
+                    self._opened = None
+                    self._results.clear()
+
+            elif self._opened is None:
+                self._results.append(failed)
+                if len(self._results) >= settings.WEBAPI_BREAKER_MIN_CALLS \
+                        and sum(self._results) >= \
+                        settings.WEBAPI_BREAKER_THRESHOLD * len(self._results):
+                    self._opened = time.monotonic()
+                    logger.warning(
+                        'WEB-API circuit breaker opened: {} of {} calls '
+                        'failed'.format(sum(self._results), len(self._results))
+                    )
+
+
+def get_session(retries=True):
+    """
+    Returns process wide session, keeping connections to WEB-API alive
+    between requests. Failed connections and gateway errors are retried
+    with exponential backoff, unless retries is False.
+    """
+    session = _sessions.get(retries)
+    if session is None:
+        with _session_lock:
+            session = _sessions.get(retries)
+            if session is None:
+                if retries:
+                    retry = Retry(
+                        total=settings.WEBAPI_RETRIES,
+                        backoff_factor=settings.WEBAPI_RETRY_BACKOFF,
+                        status_forcelist=RETRY_STATUSES,
+                        raise_on_status=False
+                    )
+
+                else:
+                    retry = Retry(0, read=False, raise_on_status=False)
+
+                adapter = HTTPAdapter(
+                    pool_maxsize=settings.WEBAPI_POOL_SIZE, max_retries=retry
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _sessions[retries] = session
+
+    return session
+
+
+def get_token(refresh=False):
+    """
+    Returns WEB-API token of the current tenant, read from DB at most once
+    per TOKEN_TTL. Raises MyAPIKey.DoesNotExist if there is no token.
+    """
+    schema = connection.schema_name
+
+    entry = _tokens.get(schema)
+    if not refresh and entry and entry[1] > time.monotonic():
+        return entry[0]
+
+    token = MyAPIKey.objects.get(name=TOKEN_NAME).token
+    _tokens[schema] = (token, time.monotonic() + TOKEN_TTL)
+
+    return token
+
+
+def clear_tokens():
+    _tokens.clear()
+
+
+def get_stats():
+    """
+    Returns counters of WEB-API calls made by this process, per method and
+    endpoint: number of calls and errors, bytes received and response times
+    in seconds, together with state of endpoint's circuit breaker.
+    """
+    with _stats_lock:
+        stats = dict()
+        for key, value in _stats.items():
+            stats[key] = dict(value)
+            stats[key]['time_avg'] = value['time_total'] / value['calls']
+
+    states = get_breaker_states()
+    for key in stats:
+        stats[key]['breaker'] = states.get(key.split(' ', 1)[1], 'closed')
+
+    return stats
+
+
+def clear_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_breaker(endpoint):
+    with _breakers_lock:
+        return _breakers.setdefault(endpoint, CircuitBreaker())
+
+
+def get_breaker_states():
+    with _breakers_lock:
+        breakers = dict(_breakers)
+
+    return dict((key, value.state) for key, value in breakers.items())
+
+
+def clear_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+    _last_good.clear()
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Limits total time of WEB-API calls made in the block, in the current
+    thread, to the given number of seconds. Calls made after the time is up
+    raise WebAPIUnavailable.
+    """
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = time.monotonic() + seconds
+    if previous is not None:
+        _local.deadline = min(_local.deadline, previous)
+
+    try:
+        yield
+
+    finally:
+        _local.deadline = previous
+
+
+def get_deadline():
+    """
+    Returns time.monotonic() value by which WEB-API calls of the current
+    thread have to be done, or None if they are not limited. Used to carry
+    the limit over to worker threads.
+    """
+    return getattr(_local, 'deadline', None)
+
+
+def _timeout():
+    end = get_deadline()
+    if end is None:
+        return settings.WEBAPI_TIMEOUT
+
+    left = end - time.monotonic()
+    if left <= 0:
+        raise WebAPIUnavailable(
+            'WEB-API is too slow: time for its requests has run out.'
+        )
+
+    return min(settings.WEBAPI_TIMEOUT, left)
+
+
+class WebAPIDeadlineMiddleware:
+    """
+    Limits time spent waiting for WEB-API while handling a single request
+    to WEBAPI_REQUEST_BUDGET seconds, so that slow WEB-API does not keep
+    workers busy. Failed calls are not retried within the budget.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deadline(settings.WEBAPI_REQUEST_BUDGET):
+            return self.get_response(request)
+
+
+def _record(method, endpoint, elapsed, size, error):
+    key = '{} {}'.format(method.upper(), endpoint)
+
+    with _stats_lock:
+        stats = _stats.setdefault(key, dict(
+            calls=0, errors=0, bytes=0, time_total=0., time_max=0.
+        ))
+        stats['calls'] += 1
+        stats['errors'] += int(error)
+        stats['bytes'] += size
+        stats['time_total'] += elapsed
+        stats['time_max'] = max(stats['time_max'], elapsed)
+
+
+def _url(endpoint, apiid):
+    if not apiid:
+        return endpoint
+
+    if endpoint.endswith('/'):
+        return endpoint + apiid
+
+    else:
+        return endpoint + '/' + apiid
+
+
+def _request(method, endpoint, apiid=None, **kwargs):
+    url = _url(endpoint, apiid)
+    token = get_token()
+    breaker = get_breaker(endpoint)
+
+    for attempt in range(2):
+        headers = {'Accept': 'application/json', 'x-api-key': token}
+
+        timeout = _timeout()
+        # each retry would wait for the whole timeout again, past deadline
+        session = get_session(retries=get_deadline() is None)
+        probe = breaker.acquire()
+        failed = True
+        start = time.monotonic()
+        try:
+            response = getattr(session, method)(
+                url, headers=headers, timeout=timeout, **kwargs
+            )
+            failed = response.status_code >= 500
+
+        except requests.exceptions.RequestException:
+            _record(method, endpoint, time.monotonic() - start, 0, True)
+            raise
+
+        finally:
+            # outcome is always recorded, so that probe is not left pending
+            breaker.record(failed, probe)
+
+        _record(
+            method, endpoint, time.monotonic() - start,
+            len(response.content), response.status_code >= 400
+        )
+
+        # token might have been changed by another process
+        if response.status_code in [401, 403] and attempt == 0:
+            new_token = get_token(refresh=True)
+            if new_token != token:
+                token = new_token
+                continue
+
+        return response
+
+
+def get_data(endpoint, apiid=None, stale_ok=False):
+    """
+    Fetches data from WEB-API endpoint, or of the single resource if apiid
+    is given. Raises requests.exceptions.HTTPError on error response, and
+    WebAPIUnavailable if endpoint's circuit breaker is open or time for
+    WEB-API requests has run out.
+
+    If stale_ok is set and WEB-API fails, data last fetched by the tenant
+    from the same URL is returned instead.
+    """
+    key = (connection.schema_name, _url(endpoint, apiid))
+    try:
+        response = _request('get', endpoint, apiid)
+        if response.status_code >= 500:
+            response.raise_for_status()
+
+    except (WebAPIUnavailable, requests.exceptions.RequestException) as e:
+        if stale_ok and key in _last_good:
+            logger.warning(
+                '{}: Using last fetched data of {}: {}'.format(
+                    key[0].upper(), key[1], repr(e)
+                )
+            )
+            return _last_good[key]
+
+        raise
+
+    # client errors are not WEB-API failures
+    response.raise_for_status()
+
+    data = response.json()['data']
+    if stale_ok:
+        _last_good[key] = data
+
+    return data
+
+
+def put_data(endpoint, apiid, data):
+    response = _request('put', endpoint, apiid, data=json.dumps(data))
+    response.raise_for_status()
+
+    return response
+
+
+@receiver(post_save, sender=MyAPIKey)
+@receiver(post_delete, sender=MyAPIKey)
+def apikey_changed(sender, instance, **kwargs):
+    if instance.name == TOKEN_NAME:
+        _tokens.pop(connection.schema_name, None)
@@ -0,0 +1,275 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+API_PREFIX = '/api/v2/'
+RESOURCES = {
+    'metric_profiles': 'Metric Profile',
+    'aggregation_profiles': 'Aggregation Profile',
+    'thresholds_profiles': 'Thresholds Profile',
+    'operations_profiles': 'Operations Profile',
+    'reports': 'Report'
+}
+
+
+class ProfileStore:
+    """
+    Profiles served by WEB-API stand-in, read from JSON fixture directory:
+    one <resource>.json file with list of profiles per resource (e.g.
+    metric_profiles.json). Missing files are served as empty lists. Changes
+    are kept in memory, and written back to the files only if persist is
+    set.
+    """
+    def __init__(self, fixtures, persist=False):
+        self.fixtures = fixtures
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._data = dict()
+
+        for resource in RESOURCES:
+            path = self._path(resource)
+            if os.path.exists(path):
+                with open(path) as f:
+                    self._data[resource] = json.load(f)
+
+            else:
+                self._data[resource] = []
+
+    def _path(self, resource):
+        return os.path.join(self.fixtures, '{}.json'.format(resource))
+
+    def _save(self, resource):
+        if self.persist:
+            with open(self._path(resource), 'w') as f:
+                json.dump(self._data[resource], f, indent=2)
+
+    def list(self, resource):
+        with self._lock:
+            return list(self._data[resource])
+
+    def get(self, resource, apiid):
+        with self._lock:
+            for item in self._data[resource]:
+                if item['id'] == apiid:
+                    return item
+
+    def put(self, resource, apiid, data):
+        with self._lock:
+            for i, item in enumerate(self._data[resource]):
+                if item['id'] == apiid:
+                    self._data[resource][i] = dict(
+                        data, id=apiid, date=time.strftime('%Y-%m-%d')
+                    )
+                    self._save(resource)
+                    return True
+
+        return False
+
+    def create(self, resource, data):
+        with self._lock:
+            apiid = str(uuid.uuid4())
+            self._data[resource].append(
+                dict(data, id=apiid, date=time.strftime('%Y-%m-%d'))
+            )
+            self._save(resource)
+
+        return apiid
+
+    def delete(self, resource, apiid):
+        with self._lock:
+            for i, item in enumerate(self._data[resource]):
+                if item['id'] == apiid:
+                    del self._data[resource][i]
+                    self._save(resource)
+                    return True
+
+        return False
+
+
+class WebAPIServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class WebAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, code, data):
+        if isinstance(data, str):
+            body = data.encode()
+            content_type = 'text/plain; charset=utf-8'
+
+        else:
+            body = json.dumps(data).encode()
+            content_type = 'application/json'
+
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_status(self, code, message=None, details=None, data=None):
+        status = {
+            'message': message or HTTPStatus(code).phrase,
+            'code': str(code)
+        }
+        if details:
+            status['details'] = details
+
+        response = {'status': status}
+        if data is not None:
+            response['data'] = data
+
+        self._send(code, response)
+
+    def _route(self):
+        """
+        Returns (resource, apiid) of the requested URL, or (None, None) if
+        resource is not served.
+        """
+        path = self.path.split('?')[0]
+        if not path.startswith(API_PREFIX):
+            return None, None
+
+        parts = path[len(API_PREFIX):].strip('/').split('/')
+        if parts[0] not in RESOURCES or len(parts) > 2:
+            return None, None
+
+        return parts[0], parts[1] if len(parts) == 2 else None
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length).decode() or '{}')
+
+    def _handle(self, method):
+        server = self.server
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if method in ('put', 'post'):
+            # body is read before any response, so connection can be reused
+            try:
+                data = self._read_body()
+
+            except ValueError:
+                self._send_status(HTTPStatus.BAD_REQUEST, details='Bad JSON')
+                return
+
+        if server.failure_rate and random.random() < server.failure_rate:
+            self._send_status(server.failure_status)
+            return
+
+        if server.token and self.headers.get('x-api-key') != server.token:
+            self._send_status(
+                HTTPStatus.UNAUTHORIZED,
+                details="You need to provide a correct authentication token "
+                        "using the header 'x-api-key'"
+            )
+            return
+
+        resource, apiid = self._route()
+        if not resource or (method == 'post' and apiid) or \
+                (method in ('put', 'delete') and not apiid):
+            self._send(HTTPStatus.NOT_FOUND, '404 page not found')
+            return
+
+        name = RESOURCES[resource]
+        if method == 'get':
+            if apiid:
+                item = server.store.get(resource, apiid)
+                if item is None:
+                    self._send_status(HTTPStatus.NOT_FOUND)
+                    return
+
+                items = [item]
+
+            else:
+                items = server.store.list(resource)
+
+            self._send_status(HTTPStatus.OK, 'Success', data=items)
+
+        elif method == 'post':
+            apiid = server.store.create(resource, data)
+            self._send_status(
+                HTTPStatus.CREATED, '{} successfully created'.format(name),
+                data={'id': apiid, 'links': {'self': self.path + '/' + apiid}}
+            )
+
+        elif method == 'put':
+            if server.store.put(resource, apiid, data):
+                self._send_status(
+                    HTTPStatus.OK, '{} successfully updated'.format(name),
+                    data={'id': apiid, 'links': {'self': self.path}}
+                )
+
+            else:
+                self._send_status(HTTPStatus.NOT_FOUND)
+
+        else:
+            if server.store.delete(resource, apiid):
+                self._send_status(
+                    HTTPStatus.OK, '{} successfully deleted'.format(name)
+                )
+
+            else:
+                self._send_status(HTTPStatus.NOT_FOUND)
+
+    def do_GET(self):
+        self._handle('get')
+
+    def do_PUT(self):
+        self._handle('put')
+
+    def do_POST(self):
+        self._handle('post')
+
+    def do_DELETE(self):
+        self._handle('delete')
+
+    def do_OPTIONS(self):
+        # CORS preflight, frontend calls WEB-API directly
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header(
+            'Access-Control-Allow-Methods', 'GET, PUT, POST, DELETE, OPTIONS'
+        )
+        self.send_header(
+            'Access-Control-Allow-Headers', 'Accept, Content-Type, x-api-key'
+        )
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def make_server(fixtures, host='localhost', port=8081, token=None,
+                latency=0., jitter=0., failure_rate=0., failure_status=503,
+                persist=False, verbose=False):
+    """
+    Returns HTTP server standing in for WEB-API profile endpoints, serving
+    profiles from fixtures directory. Each request is delayed by latency
+    plus random value up to jitter seconds, and fails with failure_status
+    with probability of failure_rate. If token is given, requests without
+    it in x-api-key header are refused. Port 0 picks a free port, which is
+    then found in server.server_port.
+    """
+    server = WebAPIServer((host, port), WebAPIHandler)
+    server.store = ProfileStore(fixtures, persist=persist)
+    server.token = token
+    server.latency = latency
+    server.jitter = jitter
+    server.failure_rate = failure_rate
+    server.failure_status = failure_status
+    server.verbose = verbose
+
+    return server
@@ -17,6 +17,94 @@ class Aggregation(models.Model):
         return u'%s' % (self.name)
 
 
+class AggregationMetricProfile(models.Model):
+    """
+    Name of the metric profile aggregation profile is using, mirrored from
+    WEB-API so that aggregations using a metric profile are found without
+    fetching them all.
+    """
+    aggregation = models.OneToOneField(Aggregation, on_delete=models.CASCADE)
+    metric_profile = models.CharField(max_length=128, db_index=True)
+
+    class Meta:
+        app_label = 'poem'
+
+
+class AggregationService(models.Model):
+    """
+    Service of aggregation profile's group, one row per (aggregation, group,
+    service), mirrored from WEB-API.
+    """
+    aggregation = models.ForeignKey(
+        Aggregation, on_delete=models.CASCADE, related_name='services'
+    )
+    group = models.CharField(max_length=128)
+    service = models.CharField(max_length=128, db_index=True)
+
+    class Meta:
+        app_label = 'poem'
+
+
+def aggregation_from_webapi(profile):
+    """
+    Returns (metric profile name, set of (group, service) tuples) of
+    aggregation profile as sent by WEB-API, or as kept in its history.
+    """
+    metric_profile = profile['metric_profile']
+    if isinstance(metric_profile, dict):
+        metric_profile = metric_profile['name']
+
+    return metric_profile, set(
+        (group['name'], service['name']) for group in profile['groups']
+        for service in group.get('services', [])
+    )
+
+
+def set_aggregation_contents(aggregations):
+    """
+    Replaces rows of aggregations given as dict of Aggregation instance to
+    (metric profile name, iterable of (group, service) tuples).
+    """
+    ids = [aggregation.id for aggregation in aggregations]
+    AggregationMetricProfile.objects.filter(aggregation_id__in=ids).delete()
+    AggregationService.objects.filter(aggregation_id__in=ids).delete()
+    AggregationMetricProfile.objects.bulk_create([
+        AggregationMetricProfile(
+            aggregation=aggregation, metric_profile=metric_profile
+        ) for aggregation, (metric_profile, services) in aggregations.items()
+    ])
+    AggregationService.objects.bulk_create([
+        AggregationService(
+            aggregation=aggregation, group=group, service=service
+        ) for aggregation, (metric_profile, services) in aggregations.items()
+        for group, service in services
+    ])
+
+
+def get_aggregation_contents(aggregations=None):
+    """
+    Returns dict of aggregation id to (metric profile name, set of (group,
+    service) tuples), for aggregations with the given ids, or for all of
+    them.
+    """
+    profiles = AggregationMetricProfile.objects.all()
+    services = AggregationService.objects.all()
+    if aggregations is not None:
+        profiles = profiles.filter(aggregation_id__in=aggregations)
+        services = services.filter(aggregation_id__in=aggregations)
+
+    result = dict(
+        (aggregation, (metric_profile, set())) for aggregation, metric_profile
+        in profiles.values_list('aggregation_id', 'metric_profile')
+    )
+    for aggregation, group, service in services.values_list(
+            'aggregation_id', 'group', 'service'
+    ):
+        result[aggregation][1].add((group, service))
+
+    return result
+
+
 class GroupOfAggregations(models.Model):
     name = models.CharField(_('name'), max_length=80, unique=True)
     permissions = models.ManyToManyField(Permission,
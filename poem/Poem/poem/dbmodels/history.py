@@ -1,15 +1,19 @@
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
+import datetime
+import gzip
 import json
 
+from Poem.helpers import history_codec
+from Poem.helpers.tenant_helpers import run_in_tenants, raise_tenant_errors
+from Poem.helpers.versioned_comments import tenant_comment
 from Poem.poem.models import Metric
 from Poem.poem_super_admin import models as admin_models
-from Poem.tenants.models import Tenant
-
-from tenant_schemas.utils import schema_context, get_public_schema_name
 
 
 class TenantHistoryManager(models.Manager):
@@ -17,52 +21,424 @@ class TenantHistoryManager(models.Manager):
         return self.get(object_repr=object_repr)
 
 
+class TenantHistorySnapshot(models.Model):
+    """
+    Full serialized data shared by history entries, addressed by its
+    SHA-256 digest, so that identical versions are stored once.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    data = models.TextField()
+
+    class Meta:
+        app_label = 'poem'
+
+
 class TenantHistory(models.Model):
     """
     Tenant history model is going to store versions of tenant specific
     models; unlike History model which stores versions in public Postgres
     schema.
+
+    Serialized data is either stored in the entry itself, or, if
+    HISTORY_STORAGE is set to 'delta', as a snapshot (keyframe) with delta
+    to be applied to it. Either way it is read and written through
+    serialized_data property; delta-encoded data is rebuilt when read.
     """
     object_id = models.CharField(max_length=191)
-    serialized_data = models.TextField()
+    data = models.TextField(db_column='serialized_data', blank=True)
+    snapshot = models.ForeignKey(
+        TenantHistorySnapshot, null=True, on_delete=models.PROTECT
+    )
+    delta = models.TextField(blank=True)
     object_repr = models.TextField()
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     date_created = models.DateTimeField(auto_now_add=True)
     comment = models.TextField(blank=True)
+    rendered_comment = models.TextField(blank=True)
     user = models.CharField(max_length=32)
 
     objects = TenantHistoryManager()
 
     class Meta:
         app_label = 'poem'
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'date_created'])
+        ]
 
     def natural_key(self):
         return (self.object_repr,)
 
+    @property
+    def serialized_data(self):
+        if self.snapshot_id is None:
+            return self.data
+
+        key = (self.snapshot_id, self.delta)
+        cached = self.__dict__.get('_serialized_data')
+        if cached and cached[0] == key:
+            return cached[1]
+
+        if self.delta:
+            value = history_codec.decode_delta(self.snapshot.data, self.delta)
+
+        else:
+            value = self.snapshot.data
+
+        self.__dict__['_serialized_data'] = (key, value)
+
+        return value
+
+    @serialized_data.setter
+    def serialized_data(self, value):
+        self.data = value
+        self.snapshot = None
+        self.delta = ''
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        # rendered once, so that listing versions does not parse comments
+        self.rendered_comment = tenant_comment(
+            self.comment,
+            self.content_type_id == ContentType.objects.get_for_model(
+                Metric
+            ).id
+        )
+        with transaction.atomic():
+            if self.snapshot_id is None and \
+                    settings.HISTORY_STORAGE == 'delta':
+                _encode_latest(self)
+
+            super().save(*args, **kwargs)
+
+            if created:
+                TenantHistoryHead.objects.update_or_create(
+                    content_type_id=self.content_type_id,
+                    object_id=self.object_id,
+                    defaults={
+                        'history': self,
+                        'date_created': self.date_created,
+                        'serialized_data': self.serialized_data
+                    }
+                )
+
+            else:
+                TenantHistoryHead.objects.filter(history=self).update(
+                    serialized_data=self.serialized_data
+                )
+
+
+def _encode(history, keyframe, deltas):
+    """
+    Stores serialized data of history entry as delta to keyframe snapshot,
+    if there are less than HISTORY_KEYFRAME_INTERVAL deltas to it, or as
+    snapshot of its own otherwise. Snapshot with the same data is reused.
+    Returns snapshot the entry refers to.
+    """
+    text = history.serialized_data
+    digest = history_codec.digest(text)
+
+    snapshot = TenantHistorySnapshot.objects.filter(digest=digest).first()
+    if snapshot is None and keyframe is not None and \
+            deltas < settings.HISTORY_KEYFRAME_INTERVAL:
+        delta = history_codec.encode_delta(keyframe.data, text)
+        if delta is not None:
+            history.data, history.snapshot, history.delta = '', keyframe, delta
+            return keyframe
+
+    if snapshot is None:
+        snapshot, created = TenantHistorySnapshot.objects.get_or_create(
+            digest=digest, defaults={'data': text}
+        )
+
+    history.data, history.snapshot, history.delta = '', snapshot, ''
+
+    return snapshot
+
+
+def _encode_latest(history):
+    # deltas are made against keyframe of the object's latest version
+    latest = get_latest_history(history.object_id, history.content_type_id)
+
+    keyframe = latest.snapshot if latest else None
+    deltas = 0
+    if keyframe:
+        deltas = TenantHistory.objects.filter(
+            content_type_id=history.content_type_id,
+            object_id=history.object_id, snapshot=keyframe
+        ).exclude(delta='').count()
+
+    _encode(history, keyframe, deltas)
+
+
+def convert_history(content_type_id, object_id, delta=True):
+    """
+    Converts stored history of the object to delta-encoded storage, or back
+    to full serialized data in each entry if delta is False. Returns number
+    of converted entries.
+    """
+    converted = 0
+    with transaction.atomic():
+        vers = TenantHistory.objects.select_for_update(of=('self',)).filter(
+            content_type_id=content_type_id, object_id=object_id
+        ).select_related('snapshot').order_by('date_created', 'id')
+
+        keyframe = None
+        deltas = 0
+        for ver in vers:
+            if not delta:
+                if ver.snapshot_id is None:
+                    continue
+
+                ver.data, ver.snapshot, ver.delta = \
+                    ver.serialized_data, None, ''
+
+            else:
+                stored = (ver.snapshot_id, ver.delta)
+                ver.serialized_data = ver.serialized_data
+                snapshot = _encode(ver, keyframe, deltas)
+                if snapshot == keyframe and ver.delta:
+                    deltas += 1
+
+                else:
+                    keyframe, deltas = snapshot, 0
+
+                if (ver.snapshot_id, ver.delta) == stored:
+                    continue
+
+            super(TenantHistory, ver).save(
+                update_fields=['data', 'snapshot', 'delta']
+            )
+            converted += 1
+
+    return converted
+
+
+def delete_unused_snapshots():
+    return TenantHistorySnapshot.objects.filter(
+        tenanthistory__isnull=True
+    ).delete()[0]
+
+
+class TenantHistoryHead(models.Model):
+    """
+    Latest version of each object having tenant history, kept up to date
+    by TenantHistory.save(), so that the current state of object is read
+    without going through all of its versions.
+
+    There is no database constraint on history, since TenantHistory table
+    may be partitioned by date_created (see partition_history command);
+    date_created is kept here so that the entry is looked up only in the
+    partition holding it.
+    """
+    object_id = models.CharField(max_length=191)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    history = models.OneToOneField(
+        TenantHistory, on_delete=models.CASCADE, related_name='head',
+        db_constraint=False
+    )
+    date_created = models.DateTimeField()
+    serialized_data = models.TextField()
+
+    class Meta:
+        app_label = 'poem'
+        unique_together = [['content_type', 'object_id']]
+
+
+def get_latest_history(object_id, ct):
+    """
+    Returns the latest TenantHistory entry of the object, or None if it
+    has no history.
+    """
+    head = TenantHistoryHead.objects.filter(
+        object_id=object_id, content_type=ct
+    ).values_list('history_id', 'date_created').first()
+
+    if head:
+        history = TenantHistory.objects.select_related('snapshot').filter(
+            id=head[0], date_created=head[1]
+        ).first()
+        if history:
+            return history
+
+    # entries saved bypassing the model (e.g. loaded from fixtures)
+    return TenantHistory.objects.filter(
+            object_id=object_id, content_type=ct
+        ).select_related('snapshot').order_by('-date_created', '-id').first()
+
+
+def get_latest_serialized_data(object_id, ct):
+    """
+    Returns serialized data of the latest version of the object, or None if
+    it has no history.
+    """
+    try:
+        return TenantHistoryHead.objects.values_list(
+            'serialized_data', flat=True
+        ).get(object_id=object_id, content_type=ct)
+
+    except TenantHistoryHead.DoesNotExist:
+        history = get_latest_history(object_id, ct)
+        return history.serialized_data if history else None
+
+
+class TenantHistoryArchive(models.Model):
+    """
+    Old versions of the object squashed by archive_history, stored as
+    gzip compressed NDJSON with one line per version.
+    """
+    object_id = models.CharField(max_length=191)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    versions = models.PositiveIntegerField()
+    date_from = models.DateTimeField()
+    date_until = models.DateTimeField()
+    data = models.BinaryField()
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'poem'
+        indexes = [models.Index(fields=['content_type', 'object_id'])]
+
+    def get_versions(self):
+        """
+        Returns list of archived versions as dicts with id, object_repr,
+        serialized_data, date_created, comment and user of the version.
+        """
+        return [
+            json.loads(line)
+            for line in gzip.decompress(self.data).decode().splitlines()
+        ]
+
+
+def _archive(versions):
+    lines = [
+        json.dumps(dict(
+            id=ver.id,
+            object_repr=ver.object_repr,
+            serialized_data=ver.serialized_data,
+            date_created=ver.date_created.strftime('%Y-%m-%d %H:%M:%S.%f'),
+            comment=ver.comment,
+            user=ver.user
+        )) for ver in versions
+    ]
+
+    TenantHistoryArchive.objects.create(
+        object_id=versions[0].object_id,
+        content_type_id=versions[0].content_type_id,
+        versions=len(versions),
+        date_from=versions[0].date_created,
+        date_until=versions[-1].date_created,
+        data=gzip.compress('\n'.join(lines).encode())
+    )
+    TenantHistory.objects.filter(id__in=[ver.id for ver in versions]).delete()
+
+
+def archive_history(
+        content_type_id, object_id, keep_versions=None, keep_days=None,
+        batch_size=1000
+):
+    """
+    Moves versions of the object which are neither among the keep_versions
+    latest ones, nor created in the last keep_days days, to archive. The
+    latest version is always kept. Versions are archived oldest first, in
+    batches of batch_size, each batch in its own transaction, so that
+    entries are locked only while their batch is moved. Returns number of
+    archived versions.
+    """
+    cutoff = None
+    if keep_days is not None:
+        cutoff = timezone.now() - datetime.timedelta(days=keep_days)
+
+    # versions are only added after the kept ones, so the ones found here
+    # stay eligible for archiving
+    vers = TenantHistory.objects.filter(
+        content_type_id=content_type_id, object_id=object_id
+    ).order_by('-date_created', '-id').values_list('id', 'date_created')
+    ids = [
+        pk for pk, date_created in vers[max(keep_versions or 1, 1):]
+        if cutoff is None or date_created < cutoff
+    ]
+    ids.reverse()
+
+    archived = 0
+    for i in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            versions = list(
+                TenantHistory.objects.select_for_update(
+                    of=('self',)
+                ).select_related('snapshot').filter(
+                    id__in=ids[i:i + batch_size]
+                ).order_by('date_created', 'id')
+            )
+            if versions:
+                _archive(versions)
+                archived += len(versions)
+
+    return archived
+
+
+def get_archive_boundary(object_id, ct):
+    """
+    Returns tuple with number of archived versions of the object and
+    creation date of the newest one, or None if none of its versions are
+    archived.
+    """
+    boundary = TenantHistoryArchive.objects.filter(
+        object_id=object_id, content_type=ct
+    ).aggregate(
+        versions=models.Sum('versions'), date_until=models.Max('date_until')
+    )
+
+    if not boundary['versions']:
+        return None
+
+    return boundary['versions'], boundary['date_until']
+
+
+def _update_probekey_in_history(probes):
+    ct = ContentType.objects.get_for_model(Metric)
+    for probe in probes:
+        metrics = Metric.objects.filter(probekey=probe)
+        for metric in metrics:
+            with transaction.atomic():
+                vers = TenantHistory.objects.filter(
+                    object_id=metric.id, content_type=ct
+                ).select_related('snapshot').order_by('date_created', 'id')
+
+                latest = None
+                for ver in vers:
+                    serialized_data = json.loads(ver.serialized_data)
+                    serialized_data[0]['fields']['probekey'] = [
+                        probe.name, probe.package.version
+                    ]
+                    ver.serialized_data = json.dumps(serialized_data)
+                    # stored in full, and delta-encoded below in order the
+                    # versions were created, once all of them are rewritten
+                    super(TenantHistory, ver).save(
+                        update_fields=['data', 'snapshot', 'delta']
+                    )
+                    latest = ver
+
+                if latest is None:
+                    continue
+
+                if settings.HISTORY_STORAGE == 'delta':
+                    convert_history(ct.id, metric.id)
+
+                TenantHistoryHead.objects.filter(
+                    content_type=ct, object_id=metric.id
+                ).update(serialized_data=latest.serialized_data)
+
+    delete_unused_snapshots()
+
 
 @receiver(post_save, sender=admin_models.Package)
 def update_metric_history(sender, instance, created, **kwargs):
     if not created:
-        schemas = list(
-            Tenant.objects.all().values_list('schema_name', flat=True)
+        probes = list(
+            admin_models.ProbeHistory.objects.filter(
+                package=instance
+            ).select_related('package')
         )
-        schemas.remove(get_public_schema_name())
-        probes = admin_models.ProbeHistory.objects.filter(
-            package=instance
+        raise_tenant_errors(
+            run_in_tenants(_update_probekey_in_history, probes)
         )
-        for schema in schemas:
-            with schema_context(schema):
-                for probe in probes:
-                    metrics = Metric.objects.filter(probekey=probe)
-                    for metric in metrics:
-                        vers = TenantHistory.objects.filter(
-                            object_id=metric.id
-                        ).order_by('-date_created')
-
-                        for ver in vers:
-                            serialized_data = json.loads(ver.serialized_data)
-                            serialized_data[0]['fields']['probekey'] = [
-                                probe.name, probe.package.version
-                            ]
-                            ver.serialized_data = json.dumps(serialized_data)
-                            ver.save()
@@ -0,0 +1,61 @@
+from django.db import models
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from Poem.poem.models import Metric
+from Poem.poem_super_admin import models as admin_models
+from Poem.tenants.models import Tenant
+
+from tenant_schemas.utils import schema_context, get_public_schema_name
+
+
+class MetricConfigSnapshot(models.Model):
+    """
+    Rendered JSON document with configuration of all tenant's metrics, as it
+    is served on /api/v2/metrics/. It is cleared whenever metric, its tags or
+    its probe version change, and it is rebuilt on the next request.
+
+    Generation is increased each time the document is cleared; rebuilt
+    document is stored only if generation has not changed while it was
+    built, so that it does not overwrite a later change.
+    """
+    data = models.TextField(blank=True)
+    generation = models.PositiveIntegerField(default=0)
+    date_created = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'poem'
+
+
+def invalidate_metricconfigs():
+    MetricConfigSnapshot.objects.update(
+        data='', generation=models.F('generation') + 1
+    )
+
+
+def invalidate_metricconfigs_all_tenants():
+    schemas = Tenant.objects.exclude(
+        schema_name=get_public_schema_name()
+    ).values_list('schema_name', flat=True)
+
+    for schema in schemas:
+        with schema_context(schema):
+            invalidate_metricconfigs()
+
+
+@receiver(post_save, sender=Metric)
+@receiver(post_delete, sender=Metric)
+def metric_changed(sender, instance, **kwargs):
+    invalidate_metricconfigs()
+
+
+@receiver(m2m_changed, sender=Metric.tags.through)
+def metric_tags_changed(sender, instance, action, **kwargs):
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        invalidate_metricconfigs()
+
+
+@receiver(post_save, sender=admin_models.ProbeHistory)
+@receiver(post_delete, sender=admin_models.ProbeHistory)
+def probe_history_changed(sender, instance, **kwargs):
+    invalidate_metricconfigs_all_tenants()
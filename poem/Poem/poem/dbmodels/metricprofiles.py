@@ -18,6 +18,65 @@ class MetricProfiles(models.Model):
         return u'%s' % (self.name)
 
 
+class MetricProfileMetric(models.Model):
+    """
+    Metric of tenant's metric profile, one row per (profile, service,
+    metric). Profiles themselves are kept in WEB-API, rows mirror them so
+    that profiles containing a metric are found without fetching them all.
+    """
+    profile = models.ForeignKey(
+        MetricProfiles, on_delete=models.CASCADE, related_name='metrics'
+    )
+    service = models.CharField(max_length=128)
+    metric = models.CharField(max_length=128, db_index=True)
+
+    class Meta:
+        app_label = 'poem'
+
+
+def metrics_from_webapi(profile):
+    """
+    Returns set of (service, metric) tuples of profile as sent by WEB-API.
+    """
+    return set(
+        (service['service'], metric) for service in profile['services']
+        for metric in service.get('metrics', [])
+    )
+
+
+def set_profile_metrics(profiles):
+    """
+    Replaces rows of profiles given as dict of MetricProfiles instance to
+    iterable of (service, metric) tuples.
+    """
+    MetricProfileMetric.objects.filter(
+        profile_id__in=[profile.id for profile in profiles]
+    ).delete()
+    MetricProfileMetric.objects.bulk_create([
+        MetricProfileMetric(profile=profile, service=service, metric=metric)
+        for profile, metrics in profiles.items()
+        for service, metric in metrics
+    ])
+
+
+def get_profile_metrics(profiles=None):
+    """
+    Returns dict of profile id to set of its (service, metric) tuples, for
+    profiles with the given ids, or for all of them.
+    """
+    rows = MetricProfileMetric.objects.all()
+    if profiles is not None:
+        rows = rows.filter(profile_id__in=profiles)
+
+    result = dict()
+    for profile, service, metric in rows.values_list(
+            'profile_id', 'service', 'metric'
+    ):
+        result.setdefault(profile, set()).add((service, metric))
+
+    return result
+
+
 class GroupOfMetricProfiles(models.Model):
     name = models.CharField(_('name'), max_length=80, unique=True)
     permissions = models.ManyToManyField(Permission,
@@ -0,0 +1,135 @@
+from django.db import models
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from Poem.poem.models import Metric
+from Poem.poem_super_admin import models as admin_models
+from Poem.tenants.models import Tenant
+
+from tenant_schemas.utils import schema_context, get_public_schema_name
+
+
+class MetricRepo(models.Model):
+    """
+    Resolution of tenant's metric to package of its probe and YUM repos
+    the package is in, one row per repo. Packages without any repo have a
+    single row with empty repo and tag. Rows are rebuilt whenever metric,
+    probe version, package or repo change.
+    """
+    metric = models.ForeignKey(Metric, on_delete=models.CASCADE)
+    name = models.CharField(max_length=128, db_index=True)
+    package = models.TextField()
+    version = models.TextField()
+    yumrepo = models.ForeignKey(
+        admin_models.YumRepo, null=True, db_constraint=False,
+        on_delete=models.DO_NOTHING
+    )
+    repo = models.TextField(blank=True)
+    tag = models.CharField(max_length=128, blank=True, db_index=True)
+
+    class Meta:
+        app_label = 'poem'
+
+
+def update_metric_repos(metrics=None):
+    """
+    Rebuilds rows of the given metrics queryset, or of all tenant's metrics
+    if queryset is not given.
+    """
+    if metrics is None:
+        metrics = Metric.objects.all()
+
+    metrics = metrics.distinct().select_related(
+        'probekey__package'
+    ).prefetch_related('probekey__package__repos__tag')
+
+    rows = []
+    ids = []
+    for metric in metrics:
+        ids.append(metric.id)
+        if not metric.probekey:
+            continue
+
+        package = metric.probekey.package
+        repos = sorted(package.repos.all(), key=lambda r: r.name)
+        for repo in repos if repos else [None]:
+            rows.append(MetricRepo(
+                metric=metric,
+                name=metric.name,
+                package=package.name,
+                version=package.version,
+                yumrepo=repo,
+                repo=repo.name if repo else '',
+                tag=repo.tag.name if repo else ''
+            ))
+
+    MetricRepo.objects.filter(metric_id__in=ids).delete()
+    MetricRepo.objects.bulk_create(rows)
+
+
+def update_metric_repos_all_tenants(**kwargs):
+    """
+    Rebuilds rows of metrics filtered by kwargs in all tenant schemas.
+    """
+    schemas = Tenant.objects.exclude(
+        schema_name=get_public_schema_name()
+    ).values_list('schema_name', flat=True)
+
+    for schema in schemas:
+        with schema_context(schema):
+            update_metric_repos(Metric.objects.filter(**kwargs))
+
+
+@receiver(post_save, sender=Metric)
+def metric_changed(sender, instance, **kwargs):
+    update_metric_repos(Metric.objects.filter(id=instance.id))
+
+
+@receiver(post_save, sender=admin_models.ProbeHistory)
+def probe_history_changed(sender, instance, **kwargs):
+    update_metric_repos_all_tenants(probekey=instance)
+
+
+@receiver(post_delete, sender=admin_models.ProbeHistory)
+def probe_history_deleted(sender, instance, **kwargs):
+    # metrics' probekey has already been set to null
+    update_metric_repos_all_tenants(
+        probekey__isnull=True, metricrepo__isnull=False
+    )
+
+
+@receiver(post_save, sender=admin_models.Package)
+@receiver(post_delete, sender=admin_models.Package)
+def package_changed(sender, instance, **kwargs):
+    update_metric_repos_all_tenants(probekey__package_id=instance.id)
+
+
+@receiver(m2m_changed, sender=admin_models.Package.repos.through)
+def package_repos_changed(sender, instance, action, reverse, pk_set,
+                          **kwargs):
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        if reverse:
+            # changed from repo side, instance is YumRepo
+            update_metric_repos_all_tenants(
+                metricrepo__yumrepo_id=instance.id
+            )
+            if pk_set:
+                update_metric_repos_all_tenants(
+                    probekey__package_id__in=pk_set
+                )
+
+        else:
+            update_metric_repos_all_tenants(probekey__package_id=instance.id)
+
+
+@receiver(post_save, sender=admin_models.YumRepo)
+@receiver(post_delete, sender=admin_models.YumRepo)
+def yumrepo_changed(sender, instance, **kwargs):
+    update_metric_repos_all_tenants(metricrepo__yumrepo_id=instance.id)
+
+
+@receiver(post_save, sender=admin_models.OSTag)
+def ostag_changed(sender, instance, **kwargs):
+    update_metric_repos_all_tenants(
+        metricrepo__yumrepo__tag_id=instance.id
+    )
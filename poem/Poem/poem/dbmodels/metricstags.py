@@ -1,3 +1,4 @@
+from Poem.helpers.inline_fields import InlineField
 from Poem.poem_super_admin.models import ProbeHistory, MetricTags
 from django.contrib.auth.models import GroupManager, Permission
 from django.db import models
@@ -56,13 +57,13 @@ class Metric(models.Model):
                               on_delete=models.SET_NULL)
     parent = models.CharField(max_length=128)
     probeexecutable = models.CharField(max_length=128)
-    config = models.CharField(max_length=1024)
-    attribute = models.CharField(max_length=1024)
-    dependancy = models.CharField(max_length=1024)
-    flags = models.CharField(max_length=1024)
-    files = models.CharField(max_length=1024)
-    parameter = models.CharField(max_length=1024)
-    fileparameter = models.CharField(max_length=1024)
+    config = InlineField()
+    attribute = InlineField()
+    dependancy = InlineField()
+    flags = InlineField()
+    files = InlineField()
+    parameter = InlineField()
+    fileparameter = InlineField()
 
     class Meta:
         permissions = (('metricsown', 'Read/Write/Modify'),)
@@ -1,3 +1,5 @@
+import json
+
 from django.contrib.auth.models import GroupManager, Permission
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
@@ -17,6 +19,75 @@ class ThresholdsProfiles(models.Model):
         return u'%s' % self.name
 
 
+class ThresholdsRule(models.Model):
+    """
+    Rule of thresholds profile, mirrored from WEB-API so that profiles with
+    rules for a metric are found without fetching them all.
+    """
+    profile = models.ForeignKey(
+        ThresholdsProfiles, on_delete=models.CASCADE, related_name='rules'
+    )
+    host = models.CharField(max_length=128, default='')
+    endpoint_group = models.CharField(max_length=128, default='')
+    metric = models.CharField(max_length=128, db_index=True)
+    thresholds = models.TextField()
+
+    class Meta:
+        app_label = 'poem'
+
+
+def thresholds_rules_from_webapi(profile):
+    """
+    Returns set of (host, endpoint group, metric, thresholds) tuples of
+    thresholds profile as sent by WEB-API, or as kept in its history.
+    """
+    rules = profile['rules']
+    if isinstance(rules, str):
+        rules = json.loads(rules)
+
+    return set(
+        (
+            rule.get('host', ''), rule.get('endpoint_group', ''),
+            rule['metric'], rule['thresholds']
+        ) for rule in rules
+    )
+
+
+def set_thresholds_rules(profiles):
+    """
+    Replaces rows of profiles given as dict of ThresholdsProfiles instance
+    to iterable of (host, endpoint group, metric, thresholds) tuples.
+    """
+    ThresholdsRule.objects.filter(
+        profile_id__in=[profile.id for profile in profiles]
+    ).delete()
+    ThresholdsRule.objects.bulk_create([
+        ThresholdsRule(
+            profile=profile, host=host, endpoint_group=endpoint_group,
+            metric=metric, thresholds=thresholds
+        ) for profile, rules in profiles.items()
+        for host, endpoint_group, metric, thresholds in rules
+    ])
+
+
+def get_thresholds_rules(profiles=None):
+    """
+    Returns dict of profile id to set of its (host, endpoint group, metric,
+    thresholds) tuples, for profiles with the given ids, or for all of them.
+    """
+    rows = ThresholdsRule.objects.all()
+    if profiles is not None:
+        rows = rows.filter(profile_id__in=profiles)
+
+    result = dict()
+    for profile, *rule in rows.values_list(
+            'profile_id', 'host', 'endpoint_group', 'metric', 'thresholds'
+    ):
+        result.setdefault(profile, set()).add(tuple(rule))
+
+    return result
+
+
 class GroupOfThresholdsProfiles(models.Model):
     name = models.CharField(_('name'), max_length=80, unique=True)
     permissions = models.ManyToManyField(
@@ -0,0 +1,108 @@
+from configparser import ConfigParser
+
+from Poem.helpers.tenant_helpers import run_in_tenants
+from Poem.poem.models import TenantHistory, archive_history, \
+    delete_unused_snapshots
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+
+def tenant_retention():
+    """
+    Returns tuple with number of the latest versions and number of days of
+    history kept by the tenant, as set in its GENERAL_<tenant> section of
+    the configuration file; None is returned for options which are not set.
+    """
+    config = ConfigParser()
+    config.read(settings.CONFIG_FILE)
+
+    section = 'GENERAL_' + connection.schema_name.upper()
+    keep_versions = config.getint(
+        section, 'HistoryKeepVersions', fallback=None
+    )
+    keep_days = config.getint(section, 'HistoryKeepDays', fallback=None)
+
+    return keep_versions, keep_days
+
+
+def _archive(keep_versions, keep_days):
+    if keep_versions is None and keep_days is None:
+        keep_versions, keep_days = tenant_retention()
+
+        if keep_versions is None and keep_days is None:
+            return None
+
+    # objects with only one version have nothing to archive
+    objects = TenantHistory.objects.values(
+        'content_type', 'object_id'
+    ).annotate(versions=Count('id')).filter(versions__gt=1).order_by(
+        'content_type', 'object_id'
+    ).values_list('content_type', 'object_id')
+
+    archived = 0
+    for content_type_id, object_id in objects.iterator():
+        archived += archive_history(
+            content_type_id, object_id, keep_versions, keep_days
+        )
+
+    return archived, delete_unused_snapshots()
+
+
+class Command(BaseCommand):
+    help = """Move old versions of tenant history to archive, where they are
+              kept compressed. Versions which are either among the latest
+              HistoryKeepVersions versions of the object, or created in the
+              last HistoryKeepDays days, are kept, as set in GENERAL_<tenant>
+              section of the configuration; tenants with neither of them set
+              are skipped. Versions are moved in small batches, so command
+              can be run while POEM is serving requests.
+           """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-versions', type=int,
+            help='number of the latest versions of each object to keep; '
+                 'overrides configured retention of tenants'
+        )
+        parser.add_argument(
+            '--keep-days', type=int,
+            help='keep versions created in the given number of days; '
+                 'overrides configured retention of tenants'
+        )
+        parser.add_argument(
+            '--schema', action='append', dest='schemas',
+            help='archive history of given tenant schema only (can be '
+                 'repeated); all tenants are handled by default'
+        )
+
+    def handle(self, *args, **kwargs):
+        results = run_in_tenants(
+            _archive, kwargs['keep_versions'], kwargs['keep_days'],
+            schemas=kwargs['schemas']
+        )
+
+        failed = False
+        for result in results:
+            if result.error:
+                failed = True
+                self.stderr.write('{}: {}'.format(
+                    result.schema.upper(), repr(result.error)
+                ))
+
+            elif result.result is None:
+                self.stdout.write(
+                    '{}: No history retention set; skipping.'.format(
+                        result.schema.upper()
+                    )
+                )
+
+            else:
+                self.stdout.write(
+                    '{}: {} history entries archived, {} unused snapshots '
+                    'deleted.'.format(result.schema.upper(), *result.result)
+                )
+
+        if failed:
+            raise CommandError('History of some tenants was not archived.')
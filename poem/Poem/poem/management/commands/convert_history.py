@@ -0,0 +1,58 @@
+from Poem.helpers.tenant_helpers import run_in_tenants
+from Poem.poem.models import TenantHistory, convert_history, \
+    delete_unused_snapshots
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _convert(delta):
+    objects = TenantHistory.objects.order_by(
+        'content_type', 'object_id'
+    ).values_list('content_type', 'object_id').distinct()
+
+    converted = 0
+    for content_type_id, object_id in objects.iterator():
+        converted += convert_history(content_type_id, object_id, delta)
+
+    return converted, delete_unused_snapshots()
+
+
+class Command(BaseCommand):
+    help = """Convert stored tenant history to delta-encoded storage (keyframe
+              snapshots with deltas between them), or back to full serialized
+              data in each entry. History of each object is converted in
+              its own transaction, so command can be run while POEM is
+              serving requests. Snapshots not used any more are deleted.
+           """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--to', choices=['delta', 'full'], default='delta',
+            help='storage to convert history to'
+        )
+        parser.add_argument(
+            '--schema', action='append', dest='schemas',
+            help='convert history of given tenant schema only (can be '
+                 'repeated); all tenants are converted by default'
+        )
+
+    def handle(self, *args, **kwargs):
+        results = run_in_tenants(
+            _convert, kwargs['to'] == 'delta', schemas=kwargs['schemas']
+        )
+
+        failed = False
+        for result in results:
+            if result.error:
+                failed = True
+                self.stderr.write('{}: {}'.format(
+                    result.schema.upper(), repr(result.error)
+                ))
+
+            else:
+                self.stdout.write(
+                    '{}: {} history entries converted, {} unused snapshots '
+                    'deleted.'.format(result.schema.upper(), *result.result)
+                )
+
+        if failed:
+            raise CommandError('History of some tenants was not converted.')
@@ -0,0 +1,125 @@
+import datetime
+
+from Poem.helpers.history_partitions import MIN_PG_VERSION, \
+    create_partitions, detach_partitions, is_partitioned, partition_table
+from Poem.helpers.tenant_helpers import get_tenant_schemas, run_in_tenants
+from Poem.poem.models import TenantHistory, TenantHistoryHead
+from Poem.poem_super_admin.models import History
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from tenant_schemas.utils import get_public_schema_name
+
+
+def _date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _partition(convert, months, before):
+    # public schema keeps history of super admin objects
+    if connection.schema_name == get_public_schema_name():
+        table = History._meta.db_table
+        in_use = None
+
+    else:
+        table = TenantHistory._meta.db_table
+        # the latest versions of objects, and versions whose data is in
+        # snapshots, have to stay in the table
+        in_use = 'id IN (SELECT history_id FROM {}) ' \
+            'OR snapshot_id IS NOT NULL'
+        in_use = in_use.format(
+            connection.ops.quote_name(TenantHistoryHead._meta.db_table)
+        )
+
+    converted = convert and partition_table(table, months)
+    if not is_partitioned(table):
+        return None
+
+    created = create_partitions(table, months)
+    detached = detach_partitions(table, before, in_use) if before else []
+
+    return converted, created, detached
+
+
+class Command(BaseCommand):
+    help = """Maintain monthly partitions of history tables, partitioned by
+              date of the entry: create partitions for the months ahead and
+              detach the ones holding only old entries, so that they can be
+              archived and dropped. Partitions of tenant history holding
+              the latest version of an object, or versions stored as
+              snapshots, are not detached; archive_history moves old
+              versions out of them. With --convert, existing history tables
+              are partitioned first; tables are locked while their entries
+              are moved. Tenants' history and public schema history are
+              handled. PostgreSQL 11 or newer is needed for partitions.
+           """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='partition history tables which are not partitioned yet'
+        )
+        parser.add_argument(
+            '--months', type=int, default=3,
+            help='number of months ahead to create partitions for'
+        )
+        parser.add_argument(
+            '--detach-before', type=_date, metavar='YYYY-MM-DD',
+            help='detach partitions with entries created before given date'
+        )
+        parser.add_argument(
+            '--schema', action='append', dest='schemas',
+            help='handle history of given schema only (can be repeated); '
+                 'all schemas are handled by default'
+        )
+
+    def handle(self, *args, **kwargs):
+        # tables are never partitioned on older servers, so they are only
+        # reported as not partitioned unless conversion is asked for
+        if kwargs['convert'] and connection.pg_version < MIN_PG_VERSION:
+            raise CommandError(
+                'History tables cannot be partitioned: PostgreSQL {} or '
+                'newer is needed.'.format(MIN_PG_VERSION // 10000)
+            )
+
+        schemas = kwargs['schemas']
+        if schemas is None:
+            schemas = [get_public_schema_name()] + get_tenant_schemas()
+
+        results = run_in_tenants(
+            _partition, kwargs['convert'], kwargs['months'],
+            kwargs['detach_before'], schemas=schemas
+        )
+
+        failed = False
+        for result in results:
+            if result.error:
+                failed = True
+                self.stderr.write('{}: {}'.format(
+                    result.schema.upper(), repr(result.error)
+                ))
+
+            elif result.result is None:
+                self.stdout.write(
+                    '{}: History table is not partitioned; use --convert to '
+                    'partition it.'.format(result.schema.upper())
+                )
+
+            else:
+                converted, created, detached = result.result
+                if converted:
+                    self.stdout.write(
+                        '{}: History table partitioned.'.format(
+                            result.schema.upper()
+                        )
+                    )
+
+                self.stdout.write(
+                    '{}: {} partitions created, {} partitions detached{}'
+                    '.'.format(
+                        result.schema.upper(), len(created), len(detached),
+                        ': ' + ', '.join(detached) if detached else ''
+                    )
+                )
+
+        if failed:
+            raise CommandError('Partitions of some schemas were not updated.')
@@ -0,0 +1,63 @@
+from Poem.helpers.webapi_server import make_server, RESOURCES
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = """Run local server standing in for WEB-API profile endpoints
+              (/api/v2/{}), serving profiles from JSON fixture directory,
+              with optional latency and failure injection. Point WEBAPI
+              section of poem.conf to it to run POEM without WEB-API.
+           """.format(', '.join(RESOURCES))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fixtures', required=True, type=str,
+            help='directory with <resource>.json files'
+        )
+        parser.add_argument('--host', type=str, default='localhost')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument(
+            '--token', type=str, help='accept only requests with this token'
+        )
+        parser.add_argument(
+            '--latency', type=float, default=0.,
+            help='delay of each response in seconds'
+        )
+        parser.add_argument(
+            '--jitter', type=float, default=0.,
+            help='maximum random delay added to latency in seconds'
+        )
+        parser.add_argument(
+            '--failure-rate', type=float, default=0.,
+            help='fraction of requests which fail, between 0 and 1'
+        )
+        parser.add_argument(
+            '--failure-status', type=int, default=503,
+            help='status code of failed requests'
+        )
+        parser.add_argument(
+            '--persist', action='store_true',
+            help='write changed profiles back to fixture files'
+        )
+
+    def handle(self, *args, **kwargs):
+        server = make_server(
+            kwargs['fixtures'], host=kwargs['host'], port=kwargs['port'],
+            token=kwargs['token'], latency=kwargs['latency'],
+            jitter=kwargs['jitter'], failure_rate=kwargs['failure_rate'],
+            failure_status=kwargs['failure_status'],
+            persist=kwargs['persist'], verbose=kwargs['verbosity'] > 1
+        )
+
+        self.stdout.write('Serving WEB-API on http://{}:{}/api/v2/'.format(
+            kwargs['host'], server.server_port
+        ))
+
+        try:
+            server.serve_forever()
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            server.server_close()
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.17 on 2026-10-18 20:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem', '0017_metric_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricConfigSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.TextField()),
+                ('date_created', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
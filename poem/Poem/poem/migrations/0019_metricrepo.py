@@ -0,0 +1,51 @@
+# Generated by Django 2.2.17 on 2026-10-18 21:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_metricrepo(apps, schema_editor):
+    Metric = apps.get_model('poem', 'Metric')
+    MetricRepo = apps.get_model('poem', 'MetricRepo')
+
+    rows = []
+    for metric in Metric.objects.filter(probekey__isnull=False):
+        package = metric.probekey.package
+        repos = sorted(package.repos.all(), key=lambda r: r.name)
+        for repo in repos if repos else [None]:
+            rows.append(MetricRepo(
+                metric=metric,
+                name=metric.name,
+                package=package.name,
+                version=package.version,
+                yumrepo=repo,
+                repo=repo.name if repo else '',
+                tag=repo.tag.name if repo else ''
+            ))
+
+    MetricRepo.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem_super_admin', '0024_metrictemplatehistory_tags'),
+        ('poem', '0018_metricconfigsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricRepo',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=128)),
+                ('package', models.TextField()),
+                ('version', models.TextField()),
+                ('repo', models.TextField(blank=True)),
+                ('tag', models.CharField(blank=True, db_index=True, max_length=128)),
+                ('metric', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poem.Metric')),
+                ('yumrepo', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='poem_super_admin.YumRepo')),
+            ],
+        ),
+        migrations.RunPython(populate_metricrepo, migrations.RunPython.noop),
+    ]
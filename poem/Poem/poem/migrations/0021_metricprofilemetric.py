@@ -0,0 +1,61 @@
+# Generated by Django 2.2.17 on 2026-10-18 23:06
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_metricprofilemetric(apps, schema_editor):
+    """
+    Rows are filled from the latest history entry of each profile, they
+    are kept up to date by syncing with WEB-API afterwards.
+    """
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    MetricProfiles = apps.get_model('poem', 'MetricProfiles')
+    MetricProfileMetric = apps.get_model('poem', 'MetricProfileMetric')
+    TenantHistory = apps.get_model('poem', 'TenantHistory')
+
+    try:
+        ct = ContentType.objects.get(app_label='poem', model='metricprofiles')
+
+    except ContentType.DoesNotExist:
+        return
+
+    rows = []
+    for profile in MetricProfiles.objects.all():
+        history = TenantHistory.objects.filter(
+            object_id=profile.id, content_type=ct
+        ).order_by('-date_created', '-id').first()
+        if not history:
+            continue
+
+        fields = json.loads(history.serialized_data)[0]['fields']
+        for service, metric in fields.get('metricinstances', []):
+            rows.append(MetricProfileMetric(
+                profile=profile, service=service, metric=metric
+            ))
+
+    MetricProfileMetric.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem', '0020_inline_fields_jsonb'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricProfileMetric',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(max_length=128)),
+                ('metric', models.CharField(db_index=True, max_length=128)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='poem.MetricProfiles')),
+            ],
+        ),
+        migrations.RunPython(
+            populate_metricprofilemetric, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 2.2.17 on 2026-10-18 23:17
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _latest_history(apps, model):
+    """
+    Yields (profile, fields of its latest history entry) for profiles of
+    the given model which have history.
+    """
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Model = apps.get_model('poem', model)
+    TenantHistory = apps.get_model('poem', 'TenantHistory')
+
+    try:
+        ct = ContentType.objects.get(app_label='poem', model=model.lower())
+
+    except ContentType.DoesNotExist:
+        return
+
+    for profile in Model.objects.all():
+        history = TenantHistory.objects.filter(
+            object_id=profile.id, content_type=ct
+        ).order_by('-date_created', '-id').first()
+        if history:
+            yield profile, json.loads(history.serialized_data)[0]['fields']
+
+
+def populate_profile_contents(apps, schema_editor):
+    """
+    Rows are filled from the latest history entry of each profile, they
+    are kept up to date by syncing with WEB-API afterwards.
+    """
+    AggregationMetricProfile = apps.get_model(
+        'poem', 'AggregationMetricProfile'
+    )
+    AggregationService = apps.get_model('poem', 'AggregationService')
+    ThresholdsRule = apps.get_model('poem', 'ThresholdsRule')
+
+    profiles = []
+    services = []
+    for aggregation, fields in _latest_history(apps, 'Aggregation'):
+        if 'metric_profile' not in fields:
+            continue
+
+        profiles.append(AggregationMetricProfile(
+            aggregation=aggregation, metric_profile=fields['metric_profile']
+        ))
+        for group in fields.get('groups', []):
+            for service in group.get('services', []):
+                services.append(AggregationService(
+                    aggregation=aggregation, group=group['name'],
+                    service=service['name']
+                ))
+
+    rules = []
+    for profile, fields in _latest_history(apps, 'ThresholdsProfiles'):
+        data = fields.get('rules', [])
+        if isinstance(data, str):
+            data = json.loads(data)
+
+        for rule in data:
+            rules.append(ThresholdsRule(
+                profile=profile, host=rule.get('host', ''),
+                endpoint_group=rule.get('endpoint_group', ''),
+                metric=rule['metric'], thresholds=rule['thresholds']
+            ))
+
+    AggregationMetricProfile.objects.bulk_create(profiles)
+    AggregationService.objects.bulk_create(services)
+    ThresholdsRule.objects.bulk_create(rules)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem', '0021_metricprofilemetric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThresholdsRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host', models.CharField(default='', max_length=128)),
+                ('endpoint_group', models.CharField(default='', max_length=128)),
+                ('metric', models.CharField(db_index=True, max_length=128)),
+                ('thresholds', models.TextField()),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='poem.ThresholdsProfiles')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AggregationService',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(max_length=128)),
+                ('service', models.CharField(db_index=True, max_length=128)),
+                ('aggregation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='services', to='poem.Aggregation')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AggregationMetricProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric_profile', models.CharField(db_index=True, max_length=128)),
+                ('aggregation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='poem.Aggregation')),
+            ],
+        ),
+        migrations.RunPython(
+            populate_profile_contents, migrations.RunPython.noop
+        ),
+    ]
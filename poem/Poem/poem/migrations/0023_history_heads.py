@@ -0,0 +1,49 @@
+# Generated by Django 2.2.17 on 2026-10-18 23:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_history_heads(apps, schema_editor):
+    TenantHistory = apps.get_model('poem', 'TenantHistory')
+    TenantHistoryHead = apps.get_model('poem', 'TenantHistoryHead')
+
+    # the latest entry of each object
+    latest = TenantHistory.objects.order_by(
+        'content_type', 'object_id', '-date_created', '-id'
+    ).distinct('content_type', 'object_id')
+
+    TenantHistoryHead.objects.bulk_create([
+        TenantHistoryHead(
+            object_id=history.object_id,
+            content_type_id=history.content_type_id,
+            history=history, serialized_data=history.serialized_data
+        ) for history in latest.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('poem', '0022_profile_contents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantHistoryHead',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.CharField(max_length=191)),
+                ('serialized_data', models.TextField()),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+                ('history', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='head', to='poem.TenantHistory')),
+            ],
+            options={
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+        migrations.RunPython(
+            populate_history_heads, migrations.RunPython.noop
+        ),
+    ]
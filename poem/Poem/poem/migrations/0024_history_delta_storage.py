@@ -0,0 +1,47 @@
+# Generated by Django 2.2.17 on 2026-10-19 01:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem', '0023_history_heads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantHistorySnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('data', models.TextField()),
+            ],
+        ),
+        # column keeps its name, serialized_data is now model property
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='tenanthistory',
+                    old_name='serialized_data',
+                    new_name='data',
+                ),
+                migrations.AlterField(
+                    model_name='tenanthistory',
+                    name='data',
+                    field=models.TextField(blank=True, db_column='serialized_data'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='tenanthistory',
+            name='delta',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='tenanthistory',
+            name='snapshot',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='poem.TenantHistorySnapshot'),
+        ),
+    ]
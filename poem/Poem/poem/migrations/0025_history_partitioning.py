@@ -0,0 +1,47 @@
+# Generated by Django 2.2.17 on 2026-10-19 00:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_head_dates(apps, schema_editor):
+    TenantHistory = apps.get_model('poem', 'TenantHistory')
+    TenantHistoryHead = apps.get_model('poem', 'TenantHistoryHead')
+
+    TenantHistoryHead.objects.update(
+        date_created=models.Subquery(
+            TenantHistory.objects.filter(
+                id=models.OuterRef('history_id')
+            ).values('date_created')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem', '0024_history_delta_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenanthistoryhead',
+            name='date_created',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(populate_head_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tenanthistoryhead',
+            name='date_created',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='tenanthistoryhead',
+            name='history',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='head', to='poem.TenantHistory'),
+        ),
+        migrations.AddIndex(
+            model_name='tenanthistory',
+            index=models.Index(fields=['content_type', 'object_id', 'date_created'], name='poem_tenant_content_952aea_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.17 on 2026-10-19 00:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('poem', '0025_history_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantHistoryArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.CharField(max_length=191)),
+                ('versions', models.PositiveIntegerField()),
+                ('date_from', models.DateTimeField()),
+                ('date_until', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tenanthistoryarchive',
+            index=models.Index(fields=['content_type', 'object_id'], name='poem_tenant_content_c478bd_idx'),
+        ),
+    ]
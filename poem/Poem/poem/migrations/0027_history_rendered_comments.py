@@ -0,0 +1,46 @@
+# Generated by Django 2.2.17 on 2026-10-19 01:00
+
+from django.db import migrations, models
+
+from Poem.helpers.versioned_comments import tenant_comment
+
+
+def render_comments(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TenantHistory = apps.get_model('poem', 'TenantHistory')
+
+    metric = ContentType.objects.filter(
+        app_label='poem', model='metric'
+    ).values_list('id', flat=True).first()
+
+    batch = []
+    for history in TenantHistory.objects.only(
+        'id', 'content_type', 'comment'
+    ).iterator():
+        history.rendered_comment = tenant_comment(
+            history.comment, history.content_type_id == metric
+        )
+        batch.append(history)
+
+        if len(batch) == 1000:
+            TenantHistory.objects.bulk_update(batch, ['rendered_comment'])
+            batch = []
+
+    TenantHistory.objects.bulk_update(batch, ['rendered_comment'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('poem', '0026_history_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenanthistory',
+            name='rendered_comment',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(render_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.17 on 2026-10-19 01:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem', '0027_history_rendered_comments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metricconfigsnapshot',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='metricconfigsnapshot',
+            name='data',
+            field=models.TextField(blank=True),
+        ),
+    ]
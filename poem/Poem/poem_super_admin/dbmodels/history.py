@@ -18,6 +18,53 @@ class History(models.Model):
 
     class Meta:
         app_label = 'poem_super_admin'
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'date_created'])
+        ]
 
     def natural_key(self):
         return (self.object_repr,)
+
+
+def move_history_head(head_model, history):
+    """
+    Makes the newly created history entry head of its object's versions,
+    with the former head kept as the previous version.
+    """
+    head = head_model.objects.select_for_update().filter(
+        object_id=history.object_id_id
+    ).first()
+
+    if head:
+        head.previous_id = head.history_id
+        head.history = history
+        head.save()
+
+    else:
+        # versions saved bypassing the model (e.g. loaded from fixtures)
+        previous = type(history).objects.filter(
+            object_id=history.object_id_id
+        ).exclude(pk=history.pk).order_by('-date_created', '-id').first()
+        head_model.objects.create(
+            object_id=history.object_id, history=history, previous=previous
+        )
+
+
+def get_history_head(head_model, history_model, instance):
+    """
+    Returns the latest and the previous history entry of the instance, each
+    of them None if there is no such version.
+    """
+    try:
+        head = head_model.objects.select_related(
+            'history', 'previous'
+        ).get(object_id=instance)
+        return head.history, head.previous
+
+    except head_model.DoesNotExist:
+        history = list(
+            history_model.objects.filter(
+                object_id=instance
+            ).order_by('-date_created', '-id')[:2]
+        )
+        return tuple(history + [None] * (2 - len(history)))
@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 
-from Poem.poem_super_admin.models import ProbeHistory
+from Poem.helpers.inline_fields import InlineField
+from Poem.helpers.versioned_comments import new_comment
+from Poem.poem_super_admin.models import ProbeHistory, move_history_head
 
 
 class MetricTemplateManager(models.Manager):
@@ -50,13 +52,13 @@ class MetricTemplate(models.Model):
     description = models.TextField(default='')
     parent = models.CharField(max_length=128)
     probeexecutable = models.CharField(max_length=128)
-    config = models.CharField(max_length=1024)
-    attribute = models.CharField(max_length=1024)
-    dependency = models.CharField(max_length=1024)
-    flags = models.CharField(max_length=1024)
-    files = models.CharField(max_length=1024)
-    parameter = models.CharField(max_length=1024)
-    fileparameter = models.CharField(max_length=1024)
+    config = InlineField()
+    attribute = InlineField()
+    dependency = InlineField()
+    flags = InlineField()
+    files = InlineField()
+    parameter = InlineField()
+    fileparameter = InlineField()
 
     objects = MetricTemplateManager()
 
@@ -81,15 +83,16 @@ class MetricTemplateHistory(models.Model):
     description = models.TextField(default='')
     parent = models.CharField(max_length=128)
     probeexecutable = models.CharField(max_length=128)
-    config = models.CharField(max_length=1024)
-    attribute = models.CharField(max_length=1024)
-    dependency = models.CharField(max_length=1024)
-    flags = models.CharField(max_length=1024)
-    files = models.CharField(max_length=1024)
-    parameter = models.CharField(max_length=1024)
-    fileparameter = models.CharField(max_length=1024)
+    config = InlineField()
+    attribute = InlineField()
+    dependency = InlineField()
+    flags = InlineField()
+    files = InlineField()
+    parameter = InlineField()
+    fileparameter = InlineField()
     date_created = models.DateTimeField(auto_now_add=True)
     version_comment = models.TextField(blank=True)
+    version_rendered_comment = models.TextField(blank=True)
     version_user = models.CharField(max_length=32)
 
     class Meta:
@@ -104,3 +107,32 @@ class MetricTemplateHistory(models.Model):
 
     def natural_key(self):
         return (self.name, self.probekey)
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        self.version_rendered_comment = new_comment(self.version_comment)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if created:
+                move_history_head(MetricTemplateHistoryHead, self)
+
+
+class MetricTemplateHistoryHead(models.Model):
+    """
+    Points to the latest and the previous version of metric template, kept
+    up to date by MetricTemplateHistory.save().
+    """
+    object_id = models.OneToOneField(
+        MetricTemplate, primary_key=True, on_delete=models.CASCADE
+    )
+    history = models.ForeignKey(
+        MetricTemplateHistory, on_delete=models.CASCADE, related_name='+'
+    )
+    previous = models.ForeignKey(
+        MetricTemplateHistory, null=True, on_delete=models.SET_NULL,
+        related_name='+'
+    )
+
+    class Meta:
+        app_label = 'poem_super_admin'
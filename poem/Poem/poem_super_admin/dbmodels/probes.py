@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 
-from Poem.poem_super_admin.models import Package
+from Poem.helpers.versioned_comments import new_comment
+from Poem.poem_super_admin.models import Package, move_history_head
 
 
 class ProbeManager(models.Manager):
@@ -46,6 +47,7 @@ class ProbeHistory(models.Model):
     docurl = models.CharField(max_length=512)
     date_created = models.DateTimeField(auto_now_add=True)
     version_comment = models.TextField(blank=True)
+    version_rendered_comment = models.TextField(blank=True)
     version_user = models.CharField(max_length=32)
 
     objects = ProbeHistoryManager()
@@ -59,3 +61,31 @@ class ProbeHistory(models.Model):
 
     def natural_key(self):
         return (self.name, self.package.version)
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        self.version_rendered_comment = new_comment(self.version_comment)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if created:
+                move_history_head(ProbeHistoryHead, self)
+
+
+class ProbeHistoryHead(models.Model):
+    """
+    Points to the latest and the previous version of probe, kept up to date
+    by ProbeHistory.save().
+    """
+    object_id = models.OneToOneField(
+        Probe, primary_key=True, on_delete=models.CASCADE
+    )
+    history = models.ForeignKey(
+        ProbeHistory, on_delete=models.CASCADE, related_name='+'
+    )
+    previous = models.ForeignKey(
+        ProbeHistory, null=True, on_delete=models.SET_NULL, related_name='+'
+    )
+
+    class Meta:
+        app_label = 'poem_super_admin'
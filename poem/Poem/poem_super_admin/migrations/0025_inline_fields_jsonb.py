@@ -0,0 +1,92 @@
+import logging
+
+from django.db import migrations, models
+
+import Poem.helpers.inline_fields
+from Poem.helpers.inline_codec import decode_inline_pairs
+
+logger = logging.getLogger('POEM')
+
+INLINE_FIELDS = [
+    'config', 'attribute', 'dependency', 'flags', 'files', 'parameter',
+    'fileparameter'
+]
+MODELS = ['metrictemplate', 'metrictemplatehistory']
+
+
+def inline_pairs(obj, field):
+    value = getattr(obj, field)
+    try:
+        return decode_inline_pairs(value)
+
+    except (ValueError, TypeError, AttributeError):
+        # malformed legacy value is kept whole as a single item
+        logger.warning(
+            'Malformed value of %s.%s (id %s) kept as single item: %r',
+            obj._meta.model_name, field, obj.pk, value
+        )
+        return [{'key': value, 'value': None}]
+
+
+def convert_inline_fields(apps, schema_editor):
+    for model_name in MODELS:
+        model = apps.get_model('poem_super_admin', model_name)
+        for obj in model.objects.all():
+            for field in INLINE_FIELDS:
+                setattr(obj, field + '_json', inline_pairs(obj, field))
+            obj.save(update_fields=[f + '_json' for f in INLINE_FIELDS])
+
+
+def revert_inline_fields(apps, schema_editor):
+    # values of InlineField are given in the old text format
+    for model_name in MODELS:
+        model = apps.get_model('poem_super_admin', model_name)
+        for obj in model.objects.all():
+            for field in INLINE_FIELDS:
+                setattr(obj, field, str(getattr(obj, field + '_json')))
+            obj.save(update_fields=INLINE_FIELDS)
+
+
+def operations():
+    ops = []
+    for model_name in MODELS:
+        for field in INLINE_FIELDS:
+            ops.append(migrations.AddField(
+                model_name=model_name,
+                name=field + '_json',
+                field=Poem.helpers.inline_fields.InlineField(default=str),
+            ))
+            # old field is filled only when migrating backwards, after it is
+            # added back, so it is left nullable until then
+            ops.append(migrations.AlterField(
+                model_name=model_name,
+                name=field,
+                field=models.CharField(max_length=1024, null=True),
+            ))
+
+    ops.append(migrations.RunPython(
+        convert_inline_fields, revert_inline_fields
+    ))
+
+    for model_name in MODELS:
+        for field in INLINE_FIELDS:
+            ops.append(migrations.RemoveField(
+                model_name=model_name,
+                name=field,
+            ))
+            ops.append(migrations.RenameField(
+                model_name=model_name,
+                old_name=field + '_json',
+                new_name=field,
+            ))
+
+    return ops
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem_super_admin', '0024_metrictemplatehistory_tags'),
+    ]
+
+    operations = operations()
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.17 on 2026-10-18 23:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _populate(apps, history_model, head_model):
+    History = apps.get_model('poem_super_admin', history_model)
+    Head = apps.get_model('poem_super_admin', head_model)
+
+    heads = dict()
+    for history in History.objects.order_by(
+        'object_id', '-date_created', '-id'
+    ).only('id', 'object_id').iterator():
+        if history.object_id_id not in heads:
+            heads[history.object_id_id] = Head(
+                object_id_id=history.object_id_id, history_id=history.id
+            )
+
+        elif heads[history.object_id_id].previous_id is None:
+            heads[history.object_id_id].previous_id = history.id
+
+    Head.objects.bulk_create(heads.values(), batch_size=1000)
+
+
+def populate_history_heads(apps, schema_editor):
+    _populate(apps, 'ProbeHistory', 'ProbeHistoryHead')
+    _populate(apps, 'MetricTemplateHistory', 'MetricTemplateHistoryHead')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem_super_admin', '0025_inline_fields_jsonb'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProbeHistoryHead',
+            fields=[
+                ('object_id', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='poem_super_admin.Probe')),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='poem_super_admin.ProbeHistory')),
+                ('previous', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='poem_super_admin.ProbeHistory')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MetricTemplateHistoryHead',
+            fields=[
+                ('object_id', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='poem_super_admin.MetricTemplate')),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='poem_super_admin.MetricTemplateHistory')),
+                ('previous', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='poem_super_admin.MetricTemplateHistory')),
+            ],
+        ),
+        migrations.RunPython(
+            populate_history_heads, migrations.RunPython.noop
+        ),
+    ]
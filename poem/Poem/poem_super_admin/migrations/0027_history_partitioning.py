@@ -0,0 +1,17 @@
+# Generated by Django 2.2.17 on 2026-10-19 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem_super_admin', '0026_history_heads'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['content_type', 'object_id', 'date_created'], name='poem_super__content_199b3e_idx'),
+        ),
+    ]
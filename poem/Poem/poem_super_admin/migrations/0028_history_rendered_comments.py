@@ -0,0 +1,44 @@
+# Generated by Django 2.2.17 on 2026-10-19 01:00
+
+from django.db import migrations, models
+
+from Poem.helpers.versioned_comments import new_comment
+
+
+def render_comments(apps, schema_editor):
+    for name in ['ProbeHistory', 'MetricTemplateHistory']:
+        model = apps.get_model('poem_super_admin', name)
+
+        batch = []
+        for history in model.objects.only('id', 'version_comment').iterator():
+            history.version_rendered_comment = new_comment(
+                history.version_comment
+            )
+            batch.append(history)
+
+            if len(batch) == 1000:
+                model.objects.bulk_update(batch, ['version_rendered_comment'])
+                batch = []
+
+        model.objects.bulk_update(batch, ['version_rendered_comment'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poem_super_admin', '0027_history_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metrictemplatehistory',
+            name='version_rendered_comment',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='probehistory',
+            name='version_rendered_comment',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(render_comments, migrations.RunPython.noop),
+    ]
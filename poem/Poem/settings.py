@@ -17,6 +17,14 @@ try:
     # General
     DEBUG = bool(config.getboolean('GENERAL', 'debug'))
     TIME_ZONE = config.get('GENERAL', 'timezone')
+    TENANT_WORKERS = config.getint('GENERAL', 'TenantWorkers', fallback=4)
+    HISTORY_STORAGE = config.get('GENERAL', 'HistoryStorage', fallback='full')
+    HISTORY_KEYFRAME_INTERVAL = config.getint(
+        'GENERAL', 'HistoryKeyframeInterval', fallback=20
+    )
+
+    if HISTORY_STORAGE not in ('full', 'delta'):
+        raise ImproperlyConfigured('HistoryStorage should be full or delta')
 
     DBNAME = config.get('DATABASE', 'name')
     DBUSER = config.get('DATABASE', 'user')
@@ -49,6 +57,24 @@ try:
     WEBAPI_THRESHOLDS = config.get('WEBAPI', 'ThresholdsProfile')
     WEBAPI_OPERATIONS = config.get('WEBAPI', 'OperationsProfile')
     WEBAPI_REPORTS = config.get('WEBAPI', 'Reports')
+    WEBAPI_TIMEOUT = config.getint('WEBAPI', 'Timeout', fallback=180)
+    WEBAPI_RETRIES = config.getint('WEBAPI', 'Retries', fallback=3)
+    WEBAPI_RETRY_BACKOFF = config.getfloat(
+        'WEBAPI', 'RetryBackoff', fallback=0.5
+    )
+    WEBAPI_POOL_SIZE = config.getint('WEBAPI', 'PoolSize', fallback=10)
+    WEBAPI_REQUEST_BUDGET = config.getint(
+        'WEBAPI', 'RequestBudget', fallback=30
+    )
+    WEBAPI_BREAKER_THRESHOLD = config.getfloat(
+        'WEBAPI', 'BreakerThreshold', fallback=0.5
+    )
+    WEBAPI_BREAKER_MIN_CALLS = config.getint(
+        'WEBAPI', 'BreakerMinCalls', fallback=5
+    )
+    WEBAPI_BREAKER_COOLDOWN = config.getint(
+        'WEBAPI', 'BreakerCooldown', fallback=30
+    )
 
 
 except NoSectionError as e:
@@ -132,6 +158,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'Poem.helpers.webapi.WebAPIDeadlineMiddleware',
 ]
 
 TEMPLATES = [
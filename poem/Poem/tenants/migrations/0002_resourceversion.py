@@ -0,0 +1,26 @@
+# Generated by Django 2.2.17 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema_name', models.CharField(max_length=63)),
+                ('resource', models.CharField(max_length=64)),
+                ('version', models.BigIntegerField(default=0)),
+                ('date_modified', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('schema_name', 'resource')},
+            },
+        ),
+    ]
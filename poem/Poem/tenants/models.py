@@ -1,5 +1,10 @@
-from django.db import models
+from django.db import models, connection, IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
 from tenant_schemas.models import TenantMixin
+from tenant_schemas.utils import get_public_schema_name
 
 
 class Tenant(TenantMixin):
@@ -10,3 +15,159 @@ class Tenant(TenantMixin):
 
     class Meta:
         app_label = 'tenants'
+
+
+# resources whose versions are kept per tenant schema; all the others are
+# kept only for public schema
+TENANT_RESOURCES = ('metric', 'tenanthistory', 'apikey')
+
+
+class ResourceVersion(models.Model):
+    """
+    Monotonically increasing version of group of models (resource) in given
+    schema. It is bumped on every change of the resource, and it is used to
+    generate validators for conditional GET requests.
+    """
+    schema_name = models.CharField(max_length=63)
+    resource = models.CharField(max_length=64)
+    version = models.BigIntegerField(default=0)
+    date_modified = models.DateTimeField()
+
+    class Meta:
+        app_label = 'tenants'
+        unique_together = [['schema_name', 'resource']]
+
+
+def resource_schema(resource):
+    if resource in TENANT_RESOURCES:
+        return connection.schema_name
+
+    else:
+        return get_public_schema_name()
+
+
+def bump_resource_version(resource):
+    schema = resource_schema(resource)
+    now = timezone.now()
+
+    updated = ResourceVersion.objects.filter(
+        schema_name=schema, resource=resource
+    ).update(version=F('version') + 1, date_modified=now)
+
+    if not updated:
+        try:
+            with transaction.atomic():
+                ResourceVersion.objects.create(
+                    schema_name=schema, resource=resource, version=1,
+                    date_modified=now
+                )
+
+        except IntegrityError:
+            # created in the meantime by concurrent request
+            ResourceVersion.objects.filter(
+                schema_name=schema, resource=resource
+            ).update(version=F('version') + 1, date_modified=now)
+
+
+def get_resource_versions(resources):
+    """
+    Returns dict with (schema_name, resource) as key, and ResourceVersion
+    instance as value. Resources which have never been changed are left out.
+    """
+    query = Q()
+    for resource in resources:
+        query |= Q(schema_name=resource_schema(resource), resource=resource)
+
+    return dict(
+        ((ver.schema_name, ver.resource), ver)
+        for ver in ResourceVersion.objects.filter(query)
+    )
+
+
+def m2m_changed_done(action):
+    return action in ['post_add', 'post_remove', 'post_clear']
+
+
+@receiver(post_save, sender='poem.Metric')
+@receiver(post_delete, sender='poem.Metric')
+def metric_changed(sender, **kwargs):
+    bump_resource_version('metric')
+
+
+@receiver(m2m_changed, sender='poem.Metric_tags')
+def metric_tags_changed(sender, action, **kwargs):
+    if m2m_changed_done(action):
+        bump_resource_version('metric')
+
+
+# deleting group clears group of its metrics without saving them
+@receiver(post_save, sender='poem.GroupOfMetrics')
+@receiver(post_delete, sender='poem.GroupOfMetrics')
+def group_of_metrics_changed(sender, **kwargs):
+    bump_resource_version('metric')
+
+
+@receiver(post_save, sender='poem.TenantHistory')
+@receiver(post_delete, sender='poem.TenantHistory')
+def tenant_history_changed(sender, **kwargs):
+    bump_resource_version('tenanthistory')
+
+
+@receiver(post_save, sender='api.MyAPIKey')
+@receiver(post_delete, sender='api.MyAPIKey')
+def apikey_changed(sender, **kwargs):
+    bump_resource_version('apikey')
+
+
+@receiver(post_save, sender='poem_super_admin.MetricTemplate')
+@receiver(post_delete, sender='poem_super_admin.MetricTemplate')
+@receiver(post_save, sender='poem_super_admin.MetricTags')
+@receiver(post_delete, sender='poem_super_admin.MetricTags')
+def metrictemplate_changed(sender, **kwargs):
+    bump_resource_version('metrictemplate')
+
+
+@receiver(m2m_changed, sender='poem_super_admin.MetricTemplate_tags')
+def metrictemplate_tags_changed(sender, action, **kwargs):
+    if m2m_changed_done(action):
+        bump_resource_version('metrictemplate')
+
+
+@receiver(post_save, sender='poem_super_admin.Probe')
+@receiver(post_delete, sender='poem_super_admin.Probe')
+def probe_changed(sender, **kwargs):
+    bump_resource_version('probe')
+
+
+@receiver(post_save, sender='poem_super_admin.Package')
+@receiver(post_delete, sender='poem_super_admin.Package')
+def package_changed(sender, **kwargs):
+    bump_resource_version('package')
+
+
+@receiver(m2m_changed, sender='poem_super_admin.Package_repos')
+def package_repos_changed(sender, action, **kwargs):
+    if m2m_changed_done(action):
+        bump_resource_version('package')
+
+
+@receiver(post_save, sender='poem_super_admin.YumRepo')
+@receiver(post_delete, sender='poem_super_admin.YumRepo')
+@receiver(post_save, sender='poem_super_admin.OSTag')
+@receiver(post_delete, sender='poem_super_admin.OSTag')
+def yumrepo_changed(sender, **kwargs):
+    bump_resource_version('yumrepo')
+
+
+@receiver(post_save, sender='poem_super_admin.ProbeHistory')
+@receiver(post_delete, sender='poem_super_admin.ProbeHistory')
+@receiver(post_save, sender='poem_super_admin.MetricTemplateHistory')
+@receiver(post_delete, sender='poem_super_admin.MetricTemplateHistory')
+def history_changed(sender, **kwargs):
+    bump_resource_version('history')
+
+
+@receiver(m2m_changed, sender='poem_super_admin.MetricTemplateHistory_tags')
+def history_tags_changed(sender, action, **kwargs):
+    if m2m_changed_done(action):
+        bump_resource_version('history')
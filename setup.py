@@ -34,7 +34,7 @@ setup(name=NAME,
                'bin/poem-clearsessions'],
       data_files=[
           ('etc/poem', ['etc/poem.conf.template', 'etc/poem_logging.conf']),
-          ('etc/cron.d/', ['cron/poem-sync', 'cron/poem-clearsessions', 'cron/poem-db_backup']),
+          ('etc/cron.d/', ['cron/poem-sync', 'cron/poem-clearsessions', 'cron/poem-db_backup', 'cron/poem-history_partitions', 'cron/poem-history_archive']),
           ('etc/logrotate.d/', ['logrotate.d/poem-db_backup']),
           ('etc/httpd/conf.d', ['poem/apache/poem.conf']),
           ('usr/share/poem/apache', ['poem/apache/poem.wsgi']),